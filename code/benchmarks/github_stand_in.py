@@ -0,0 +1,375 @@
+import gzip
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Optional, Iterable, Sequence, Tuple
+from urllib.parse import urlparse, parse_qs
+
+
+class SyntheticDocuments:
+    """
+    A deterministic collection of documents, where each term is contained by a pseudo-random subset of
+    them, seeded by the term. The subset of a term is kept as a bitset, so the amount of documents
+    matching a query is exact, and the amounts of the subqueries of a decomposition are consistent.
+
+    About a half, a quarter or an eighth of the documents contain each term, depending on the term.
+    """
+
+    DEFAULT_SIZE = 100000
+    _TOKEN_PATTERN = re.compile(r'"[^"]*"|[()]|[^\s()]+')
+
+    def __init__(self, size: int = DEFAULT_SIZE, seed: int = 0):
+        self._size = size
+        self._seed = seed
+        self._all = (1 << size) - 1
+        self._bitsets: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def get_bitset(self, term: str) -> int:
+        term = term.lower()
+        with self._lock:
+            bitset = self._bitsets.get(term)
+            if bitset is None:
+                digest = hashlib.sha256(f'{self._seed}:{term}'.encode()).digest()
+                rng = random.Random(digest)
+                bitset = self._all
+                for _ in range(1 + digest[0] % 3):
+                    bitset &= rng.getrandbits(self._size)
+                self._bitsets[term] = bitset
+            return bitset
+
+    def get_query_bitset(self, query: str) -> int:
+        """
+        The bitset of the documents matching a search query: terms, maybe negated by NOT, separated by
+        spaces, and maybe disjunctions by OR and groups in parentheses, where the spaces bind tighter
+        """
+        tokens = self._TOKEN_PATTERN.findall(query)
+        return self._get_disjunction_bitset(tokens, 0)[0]
+
+    def _get_disjunction_bitset(self, tokens: Sequence[str], i: int) -> Tuple[int, int]:
+        bitset = 0
+        while True:
+            conjunction, i = self._get_conjunction_bitset(tokens, i)
+            bitset |= conjunction
+            if i >= len(tokens) or tokens[i] != 'OR':
+                return bitset, i
+            i += 1
+
+    def _get_conjunction_bitset(self, tokens: Sequence[str], i: int) -> Tuple[int, int]:
+        bitset = self._all
+        negated = False
+        while i < len(tokens) and tokens[i] not in ('OR', ')'):
+            if tokens[i] == 'NOT':
+                negated = not negated
+                i += 1
+                continue
+            if tokens[i] == '(':
+                operand, i = self._get_disjunction_bitset(tokens, i + 1)
+            else:
+                operand = self.get_bitset(tokens[i].strip('"'))
+            i += 1  # the term, or the closing parenthesis
+            bitset &= (self._all ^ operand) if negated else operand
+            negated = False
+        return bitset, i
+
+    def count(self, query: str) -> int:
+        return bin(self.get_query_bitset(query)).count('1')
+
+    def count_union(self, queries: Iterable[str]) -> int:
+        """The amount of documents matching any of the search queries, to check the evaluation of a disjunction"""
+        bitset = 0
+        for query in queries:
+            bitset |= self.get_query_bitset(query)
+        return bin(bitset).count('1')
+
+
+class GithubStandIn:
+    """
+    Local HTTP server standing in for the GitHub REST API in benchmarks and tests. It serves
+    `/rate_limit` and `/search/<type>`, where the amounts are given by `SyntheticDocuments`, and the
+    aliased searches and `rateLimit` of the GraphQL API at `/graphql`.
+
+    Each credential, taken from the Authorization header, has its own search rate limit of `limit` requests
+    per window of `period` seconds. Beyond it, the requests are rejected with a 403 as GitHub does. Every
+    `secondary_every` search requests, one is rejected by a secondary rate limit, with a 403 and a
+    `Retry-After` of `retry_after` seconds. The credentials in `rejected` are answered with a 401.
+    The search requests take `latency` seconds, plus up to `jitter` seconds. They give a page of
+    `per_page` items, 30 by default, shaped as the items of a code search, and the responses are
+    compressed if the request accepts gzip, so the bytes sent (see `response_bytes`) are as GitHub's.
+
+    The GraphQL requests have their own rate limit of `points_limit` points per window of `points_period`
+    seconds, where each one costs a point per hundred searches, and at least one. Beyond it, they are
+    answered with a `RATE_LIMITED` error as GitHub does. The secondary rate limit applies to them as
+    well. The searches of the queries in `failed` are answered with an error of their own.
+
+    It can be used as a context manager, which starts and stops it.
+    """
+
+    SEARCH_TYPES = ('code', 'commits', 'issues', 'repositories', 'topics', 'users')
+    DEFAULT_PER_PAGE = 30
+    MAX_PER_PAGE = 100
+    # the alias, the variable of the query and the field of the amount of each aliased search
+    _GRAPHQL_SEARCH_PATTERN = re.compile(r'(\w+): search\(query: \$(\w+)[^)]*\) \{ (\w+) \}')
+
+    def __init__(self, documents: Optional[SyntheticDocuments] = None, latency: float = 0, jitter: float = 0,
+                 limit: int = 30, period: float = 60, secondary_every: int = 0, retry_after: int = 1,
+                 rejected: Sequence[str] = (), points_limit: int = 5000, points_period: float = 3600,
+                 failed: Sequence[str] = (), host: str = '127.0.0.1', port: int = 0):
+        self.documents = documents or SyntheticDocuments()
+        self.latency = latency
+        self.jitter = jitter
+        self.limit = limit
+        self.period = period
+        self.secondary_every = secondary_every
+        self.retry_after = retry_after
+        self.rejected = set(rejected)
+        self.points_limit = points_limit
+        self.points_period = points_period
+        self.failed = set(failed)
+        self._windows: Dict[str, Tuple[float, int]] = {}
+        self._points_windows: Dict[str, Tuple[float, int]] = {}
+        self._lock = threading.Lock()
+        self._random = random.Random(0)
+        self.search_requests = 0
+        self.served = 0
+        self.rate_limited = 0
+        self.secondary_limited = 0
+        self.unauthorized = 0
+        self.graphql_requests = 0
+        self.response_bytes = 0
+        self.graphql_searches = 0
+        self._server = ThreadingHTTPServer((host, port), self._get_handler_type())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self) -> 'GithubStandIn':
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _get_window(self, credential: str, points: bool = False) -> Tuple[float, int]:
+        """The reset time and the used requests, or points, of the current window of the credential"""
+        now = time.time()
+        reset, used = (self._points_windows if points else self._windows).get(credential, (0., 0))
+        if now >= reset:
+            reset, used = now + (self.points_period if points else self.period), 0
+        return reset, used
+
+    def get_rate(self, credential: str) -> Dict[str, int]:
+        with self._lock:
+            reset, used = self._get_window(credential)
+        return {'limit': self.limit, 'remaining': max(self.limit - used, 0), 'reset': int(reset) + 1, 'used': used}
+
+    def _take(self, credential: str) -> Tuple[Optional[str], Dict[str, int]]:
+        """Counts a search request. Gives the reason to reject it, if any, and the rate after it"""
+        with self._lock:
+            self.search_requests += 1
+            reset, used = self._get_window(credential)
+            if used >= self.limit:
+                self.rate_limited += 1
+                reason = 'primary'
+            elif self.secondary_every and self.search_requests % self.secondary_every == 0:
+                self.secondary_limited += 1
+                reason = 'secondary'
+            else:
+                used += 1
+                self.served += 1
+                reason = None
+            self._windows[credential] = reset, used
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        rate = {'limit': self.limit, 'remaining': max(self.limit - used, 0), 'reset': int(reset) + 1, 'used': used}
+        if reason is None and delay > 0:
+            time.sleep(delay)
+        return reason, rate
+
+    @staticmethod
+    def get_search_item(query: str, i: int) -> Dict[str, object]:
+        """The i-th item of a search, with the fields of a code search item and its repository"""
+        owner = f'owner{i}'
+        repository = f'{owner}/repository{i}'
+        api_url = f'https://api.github.com/repos/{repository}'
+        repository_urls = {f'{name}_url': f'{api_url}/{name}{{/number}}'
+                           for name in ('archive', 'assignees', 'blobs', 'branches', 'collaborators', 'comments',
+                                        'commits', 'compare', 'contents', 'contributors', 'deployments',
+                                        'downloads', 'events', 'forks', 'git_commits', 'git_refs', 'git_tags',
+                                        'hooks', 'issue_comment', 'issue_events', 'issues', 'keys', 'labels',
+                                        'languages', 'merges', 'milestones', 'notifications', 'pulls', 'releases',
+                                        'stargazers', 'statuses', 'subscribers', 'subscription', 'tags', 'teams',
+                                        'trees')}
+        sha = hashlib.sha1(f'{query}:{i}'.encode()).hexdigest()
+        return {
+            'name': f'file{i}.py',
+            'path': f'src/file{i}.py',
+            'sha': sha,
+            'url': f'{api_url}/contents/src/file{i}.py?ref={sha}',
+            'git_url': f'{api_url}/git/blobs/{sha}',
+            'html_url': f'https://github.com/{repository}/blob/{sha}/src/file{i}.py',
+            'repository': {
+                'id': i, 'node_id': f'MDEwOlJlcG9zaXRvcnk{i}', 'name': f'repository{i}', 'full_name': repository,
+                'private': False, 'description': f'Repository {i} matching {query}', 'fork': False,
+                'url': api_url, 'html_url': f'https://github.com/{repository}',
+                'owner': {'login': owner, 'id': i, 'node_id': f'MDQ6VXNlcj{i}', 'type': 'User', 'site_admin': False,
+                          'avatar_url': f'https://avatars.githubusercontent.com/u/{i}?v=4', 'gravatar_id': '',
+                          'url': f'https://api.github.com/users/{owner}',
+                          'html_url': f'https://github.com/{owner}'},
+                **repository_urls,
+            },
+            'score': 1.,
+        }
+
+    def _take_points(self, credential: str, searches: int) -> Tuple[Optional[str], Dict[str, object]]:
+        """
+        Counts a GraphQL request of the given amount of searches. Gives the reason to reject it, if any,
+        and its `rateLimit`
+        """
+        cost = max(1, math.ceil(searches / 100)) if searches else 0
+        with self._lock:
+            self.graphql_requests += 1
+            reset, used = self._get_window(credential, points=True)
+            if used + cost > self.points_limit:
+                self.rate_limited += 1
+                reason = 'primary'
+            elif searches and self.secondary_every and self.graphql_requests % self.secondary_every == 0:
+                self.secondary_limited += 1
+                reason = 'secondary'
+            else:
+                used += cost
+                self.served += 1 if searches else 0
+                self.graphql_searches += searches
+                reason = None
+            self._points_windows[credential] = reset, used
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter and searches else 0)
+        rate_limit = {'cost': cost, 'limit': self.points_limit, 'remaining': max(self.points_limit - used, 0),
+                      'resetAt': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(int(reset) + 1))}
+        if reason is None and searches and delay > 0:
+            time.sleep(delay)
+        return reason, rate_limit
+
+    def get_graphql_response(self, credential: str, document: str, variables: Dict[str, str]
+                             ) -> Tuple[int, dict, Dict[str, str]]:
+        """The status, the body and the extra headers of the response to a GraphQL request"""
+        searches = self._GRAPHQL_SEARCH_PATTERN.findall(document)
+        reason, rate_limit = self._take_points(credential, len(searches))
+        if reason == 'secondary':
+            return 403, {'message': 'You have exceeded a secondary rate limit. '
+                                    'Please wait a few minutes before you try again.'}, \
+                {'Retry-After': str(self.retry_after)}
+        if reason == 'primary':
+            return 200, {'data': None, 'errors': [{'type': 'RATE_LIMITED',
+                                                   'message': 'API rate limit exceeded for user.'}]}, {}
+        data: Dict[str, object] = {'rateLimit': rate_limit}
+        errors = []
+        for alias, variable, count_field in searches:
+            query = variables.get(variable, '')
+            if query in self.failed:
+                data[alias] = None
+                errors.append({'type': 'INVALID', 'path': [alias], 'message': f'Invalid search query {query!r}'})
+            else:
+                data[alias] = {count_field: self.documents.count(query)}
+        return 200, {'data': data, **({'errors': errors} if errors else {})}, {}
+
+    def _get_handler_type(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # the headers and the body are written separately, which would be delayed by the Nagle algorithm
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: dict, rate: Optional[Dict[str, int]] = None,
+                      headers: Optional[Dict[str, str]] = None):
+                data = json.dumps(body).encode()
+                compressed = 'gzip' in self.headers.get('Accept-Encoding', '')
+                if compressed:
+                    data = gzip.compress(data, compresslevel=6)
+                with stand_in._lock:
+                    stand_in.response_bytes += len(data)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                if compressed:
+                    self.send_header('Content-Encoding', 'gzip')
+                if rate is not None:
+                    self.send_header('X-RateLimit-Limit', str(rate['limit']))
+                    self.send_header('X-RateLimit-Remaining', str(rate['remaining']))
+                    self.send_header('X-RateLimit-Reset', str(rate['reset']))
+                    self.send_header('X-RateLimit-Used', str(rate['used']))
+                    self.send_header('X-RateLimit-Resource', 'search')
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                credential = self.headers.get('Authorization', '')
+                if credential.partition(' ')[2] in stand_in.rejected:
+                    with stand_in._lock:
+                        stand_in.unauthorized += 1
+                    self._send(401, {'message': 'Bad credentials'})
+                elif url.path == '/rate_limit':
+                    rate = stand_in.get_rate(credential)
+                    self._send(200, {'resources': {'core': rate, 'search': rate}, 'rate': rate}, rate)
+                elif url.path.startswith('/search/') and url.path[len('/search/'):] in stand_in.SEARCH_TYPES:
+                    fields = parse_qs(url.query)
+                    query = fields.get('q', [''])[0]
+                    reason, rate = stand_in._take(credential)
+                    if reason == 'primary':
+                        self._send(403, {'message': 'API rate limit exceeded for user.'}, rate)
+                    elif reason == 'secondary':
+                        self._send(403, {'message': 'You have exceeded a secondary rate limit. '
+                                                    'Please wait a few minutes before you try again.'},
+                                   rate, {'Retry-After': str(stand_in.retry_after)})
+                    else:
+                        total_count = stand_in.documents.count(query)
+                        per_page = min(int(fields.get('per_page', [stand_in.DEFAULT_PER_PAGE])[0]),
+                                       stand_in.MAX_PER_PAGE)
+                        items = [stand_in.get_search_item(query, i) for i in range(min(per_page, total_count))]
+                        self._send(200, {'total_count': total_count, 'incomplete_results': False,
+                                         'items': items}, rate)
+                else:
+                    self._send(404, {'message': 'Not Found'})
+
+            def do_POST(self):
+                credential = self.headers.get('Authorization', '')
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                if credential.partition(' ')[2] in stand_in.rejected:
+                    with stand_in._lock:
+                        stand_in.unauthorized += 1
+                    self._send(401, {'message': 'Bad credentials'})
+                elif urlparse(self.path).path == '/graphql':
+                    status, response, headers = stand_in.get_graphql_response(
+                        credential, body.get('query', ''), body.get('variables') or {})
+                    self._send(status, response, headers=headers)
+                else:
+                    self._send(404, {'message': 'Not Found'})
+
+        return Handler
@@ -0,0 +1,82 @@
+import threading
+import time
+from datetime import datetime
+from typing import Tuple, Sequence
+
+from lib.classes.internal.decomposers.decomposer import Decomposer
+from lib.classes.internal.engines.github_v3_engine import GithubV3Engine
+from lib.classes.internal.query_issuers.query_issuer import QueryIssuer
+from lib.classes.internal.query_issuers.runtime_calibration import RuntimeCalibration
+from lib.classes.internal.translators.translator import Translator
+from lib.utilities.metrics import METRICS
+from lib.utilities.with_external_arguments import CustomArgumentParser
+
+
+class FakeQueryIssuer(QueryIssuer):
+    """
+    Query issuer that needs no network. It counts the documents that contain all the literals of a query,
+    after `latency` seconds, and raises a `ConnectionError` after issuing `fail_after` queries
+    """
+
+    DOCUMENTS = ({'a', 'b'}, {'a', 'c'}, {'b', 'c', 'd'}, {'d'}, {'a', 'b', 'c'}, {'e'},
+                 {'f', 'g'}, {'a', 'b', 'c', 'd', 'e', 'f', 'g', 'h'}, {'h'})
+
+    def __init__(self, latency: float = 0, fail_after: int = None):
+        self._latency = latency
+        self._fail_after = fail_after
+        self._lock = threading.Lock()
+        self.issued = []
+        QueryIssuer.__init__(self)
+
+    def _set_client(self):
+        pass
+
+    def issue(self, name: str, query: str) -> Tuple[bool, int]:
+        time.sleep(self._latency)
+        with self._lock:
+            if self._fail_after is not None and len(self.issued) >= self._fail_after:
+                raise ConnectionError
+            self.issued.append(query)
+        METRICS.increment('requests_total')
+        literals = query.split()
+        return True, sum(all(literal in document for literal in literals) for document in self.DOCUMENTS)
+
+    def check_query_restrictions(self, query: str, name: str) -> bool:
+        return True
+
+    def satisfies_query_restrictions(self, query: str) -> bool:
+        return True
+
+    def get_estimated_time(self, subqueries_total: int, concurrency: int = 1) -> Tuple[str, str]:
+        return '0:00:00', '0:00:00'
+
+    def get_server_current_datetime(self) -> datetime:
+        return datetime.now()
+
+
+class OfflineEngine(GithubV3Engine):
+    """A `GithubV3Engine` that issues the queries to a `FakeQueryIssuer`"""
+
+    def __init__(self, args_sequence: Sequence[str], latency: float = 0, cache_options='in-memory', **kwargs):
+        self._latency = latency
+        GithubV3Engine.__init__(self, args_sequence, cache_options, [], False, CustomArgumentParser(), **kwargs)
+
+    def _get_query_issuer(self, connect: bool, calibration: RuntimeCalibration) -> FakeQueryIssuer:
+        return FakeQueryIssuer(self._latency)
+
+    def get_main_decomposer(self) -> Decomposer:
+        """The decomposer of the queries, unless the fallback one is used"""
+        return self._main_decomposer
+
+    def get_translator(self) -> Translator:
+        return self._translator
+
+    def cache_amount(self, subquery: str, amount: int):
+        """Caches the results amount of the particular query, so it is not issued"""
+        self._cache.set_amount(subquery, amount)
+
+
+def get_offline_engine(args_sequence: Sequence[str], latency: float = 0, cache_options='in-memory',
+                       **kwargs) -> OfflineEngine:
+    """An `OfflineEngine`, for the tests and the benchmarks"""
+    return OfflineEngine(args_sequence, latency, cache_options, **kwargs)
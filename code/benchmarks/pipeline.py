@@ -0,0 +1,243 @@
+"""
+CPU benchmark of the parse -> DNF -> enumerate -> translate pipeline, with no network.
+
+Each workload is a query made by `generate_query`, and its stages are timed one after the other:
+
+    parse      BracketsSyntaxParser parses the source of the query
+    dnf        ExclusionInclusionDecomposer converts it to disjunctive normal form
+    enumerate  the subqueries are enumerated as bitmasks, simplified by the qualifier rules
+    translate  the subqueries are enumerated again, and translated by SpacesTranslator
+    evaluate   the engine evaluates the query with all its subqueries already cached
+
+The peak memory allocated by each stage is then measured by running the stages again under tracemalloc.
+The results are compared with the baselines saved before on the same host, which are not committed, and
+the process exits with status 1 if some stage regressed beyond the tolerance. The seconds of the baselines
+are scaled by how much slower a fixed calibration loop runs now than when they were saved, so a busier or
+throttled host is not taken as a regression.
+
+    python -m benchmarks.pipeline --workloads flat-12 nested-3
+    python -m benchmarks.pipeline --workloads cached-2^20 --no-memory
+    python -m benchmarks.pipeline --save-baseline
+    python -m benchmarks.pipeline
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from typing import Dict, Sequence, NamedTuple, Tuple, Callable, Any
+
+from lib.classes.internal.parsers.brackets_syntax_parser import BracketsSyntaxParser
+from benchmarks.offline_engine import get_offline_engine
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baselines', 'pipeline.json')
+CALIBRATION_ITERATIONS = 200000
+CALIBRATION_REPEAT = 5
+STAGES = ('parse', 'dnf', 'enumerate', 'translate', 'evaluate')
+# differences below them are taken as noise
+MIN_SECONDS_DELTA = 0.01
+MIN_BYTES_DELTA = 1 << 20
+# single-valued, so two different values of it in a subquery make it empty
+QUALIFIER = 'language'
+
+
+class Workload(NamedTuple):
+    terms: int
+    width: int
+    depth: int = 1
+    sharing: float = 0
+    negation: float = 0
+    qualifiers: float = 0
+    engine_args: Tuple[str, ...] = ()
+
+
+WORKLOADS: Dict[str, Workload] = {
+    'flat-12': Workload(terms=12, width=3),
+    'shared-12': Workload(terms=12, width=3, sharing=0.7),
+    'negated-12': Workload(terms=12, width=3, negation=0.4),
+    'qualified-12': Workload(terms=12, width=3, qualifiers=0.3),
+    'nested-3': Workload(terms=3, width=2, depth=3),
+    'merged-14': Workload(terms=14, width=3, sharing=0.9, engine_args=('**merge-subqueries',)),
+    'cached-2^16': Workload(terms=16, width=2),
+    'cached-2^20': Workload(terms=20, width=2),
+}
+# the larger ones take minutes, so they are run only when given
+DEFAULT_WORKLOADS = [name for name, workload in WORKLOADS.items() if workload.terms <= 14]
+
+
+def generate_query(terms: int, width: int, depth: int = 1, sharing: float = 0, negation: float = 0,
+                   qualifiers: float = 0, seed: int = 0) -> str:
+    """
+    Source of a disjunction of `terms` expressions, in the brackets syntax. Each expression nests `depth`
+    levels of `width` operands, alternating conjunctions, from the outermost, and disjunctions. Each literal
+    is, with probability `sharing`, one of the literals already used, and is negated with probability
+    `negation`. A new literal is, with probability `qualifiers`, a value of a single-valued qualifier, so
+    the subqueries are simplified by the qualifier rules.
+    """
+    rng = random.Random(seed)
+    literals = []
+
+    def get_literal() -> str:
+        if literals and rng.random() < sharing:
+            literal = rng.choice(literals)
+        else:
+            literal = f'w{len(literals)}'
+            if qualifiers and rng.random() < qualifiers:
+                literal = f'{QUALIFIER}:{literal}'
+            literals.append(literal)
+        return f'~{literal}' if rng.random() < negation else literal
+
+    def get_expression(level: int) -> str:
+        if level == 0:
+            return get_literal()
+        operands = ' '.join(get_expression(level - 1) for _ in range(width))
+        return f'[{operands}]' if (depth - level) % 2 == 0 else f'{{{operands}}}'
+
+    return '{' + ' '.join(get_expression(depth) for _ in range(terms)) + '}'
+
+
+def run_stages(workload: Workload, measure: Callable[[str, Callable[[], Any]], Any]) -> int:
+    """Runs the stages of the workload, each one through `measure`. Gives the amount of subqueries"""
+    source = generate_query(workload.terms, workload.width, workload.depth, workload.sharing, workload.negation,
+                            workload.qualifiers)
+    engine = get_offline_engine(workload.engine_args)
+    decomposer, translator = engine.get_main_decomposer(), engine.get_translator()
+
+    middle_code = measure('parse', lambda: next(iter(BracketsSyntaxParser([]).get_middle_codes(source, 'BENCHMARK'))))
+    measure('dnf', lambda: decomposer.set_middle_code(middle_code))
+    subqueries = measure('enumerate', lambda: sum(1 for _ in decomposer.get_subquery_masks()))
+    # so the translation starts, as the enumeration, with the memoized simplifications empty
+    decomposer.set_middle_code(middle_code)
+    measure('translate', lambda: sum(1 for _ in decomposer.get_translated_subqueries(translator)))
+
+    for _, subquery, _ in decomposer.get_translated_subqueries(translator):
+        engine.cache_amount(subquery, 0)
+    middle_code = next(iter(BracketsSyntaxParser([]).get_middle_codes(source, 'BENCHMARK')))
+    results = measure('evaluate', lambda: engine.get_total_amount(middle_code))
+    assert results[2] == 0, 'Not all the subqueries were cached'
+    return subqueries
+
+
+def run_workload(workload: Workload, memory: bool = True) -> Dict[str, Dict[str, float]]:
+    stages: Dict[str, Dict[str, float]] = {stage: {} for stage in STAGES}
+
+    def measure_time(stage: str, func: Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        result = func()
+        stages[stage]['seconds'] = time.perf_counter() - start
+        return result
+
+    def measure_memory(stage: str, func: Callable[[], Any]) -> Any:
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        else:
+            # before Python 3.9 the peak is only reset by tracing again from scratch
+            tracemalloc.stop()
+            tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        result = func()
+        stages[stage]['peak_bytes'] = tracemalloc.get_traced_memory()[1] - base
+        return result
+
+    subqueries = run_stages(workload, measure_time)
+    if memory:
+        tracemalloc.start()
+        try:
+            run_stages(workload, measure_memory)
+        finally:
+            tracemalloc.stop()
+    for stage in stages.values():
+        stage['subqueries'] = subqueries
+    return stages
+
+
+def calibrate() -> float:
+    """
+    Seconds of a fixed loop of dictionary, set and integer operations, as the stages do, the fastest of
+    several runs, so the seconds measured on different runs can be compared (see `compare`)
+    """
+    best = float('inf')
+    for _ in range(CALIBRATION_REPEAT):
+        start = time.perf_counter()
+        memo, seen = {}, set()
+        for i in range(CALIBRATION_ITERATIONS):
+            mask = i | i >> 3
+            if mask not in seen:
+                seen.add(mask)
+                memo[mask] = bin(mask).count('1')
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            tolerance: float, seconds_scale: float = 1.) -> Dict[str, str]:
+    """
+    The regressions of each stage with respect to the baseline, whose seconds are multiplied by
+    `seconds_scale`, the ratio of the calibration seconds of the results to the ones of the baseline
+    """
+    regressions = {}
+    for stage, measures in results.items():
+        base = baseline.get(stage)
+        if not base:
+            continue
+        for measure, min_delta in (('seconds', MIN_SECONDS_DELTA), ('peak_bytes', MIN_BYTES_DELTA)):
+            if measure in measures and measure in base:
+                value, base_value = measures[measure], base[measure]
+                if measure == 'seconds':
+                    base_value *= seconds_scale
+                if value > base_value * (1 + tolerance) and value - base_value > min_delta:
+                    regressions[stage] = f'{measure} {value / base_value if base_value else float("inf"):.2f}x'
+    return regressions
+
+
+def main(args_sequence: Sequence[str] = None):
+    args_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    args_parser.add_argument('--workloads', nargs='+', choices=WORKLOADS.keys(), default=DEFAULT_WORKLOADS)
+    args_parser.add_argument('--baseline', default=DEFAULT_BASELINE, metavar='FILENAME',
+                             help='baselines of this host. They are not committed, as they depend on the host')
+    args_parser.add_argument('--save-baseline', action='store_true',
+                             help='store the results of the workloads run as their baselines, along the '
+                                  'calibration seconds')
+    args_parser.add_argument('--tolerance', type=float, default=0.25,
+                             help='ratio over the baseline beyond which a stage is taken as regressed')
+    args_parser.add_argument('--no-memory', action='store_true', help='do not measure the peak memory')
+    args = args_parser.parse_args(args_sequence)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baselines = json.load(file)
+    calibration = calibrate()
+    print(f'Calibration seconds: {calibration:.4f}\n')
+
+    regressed = False
+    print(f'{"Workload":<12} {"Stage":<10} {"Subqueries":>10} {"Seconds":>9} {"Baseline":>9} '
+          f'{"Peak MiB":>9} {"Baseline":>9}  Regression')
+    for name in args.workloads:
+        results = run_workload(WORKLOADS[name], not args.no_memory)
+        baseline = baselines.get(name, {})
+        seconds_scale = calibration / baseline['calibration_seconds'] if baseline else 1.
+        regressions = compare(results, baseline.get('stages', {}), args.tolerance, seconds_scale)
+        regressed |= bool(regressions)
+        for stage, measures in results.items():
+            base = baseline.get('stages', {}).get(stage, {})
+            print(f'{name:<12} {stage:<10} {measures["subqueries"]:>10} {measures["seconds"]:>9.4f} '
+                  f'{base.get("seconds", float("nan")) * seconds_scale:>9.4f} '
+                  f'{measures.get("peak_bytes", float("nan")) / (1 << 20):>9.2f} '
+                  f'{base.get("peak_bytes", float("nan")) / (1 << 20):>9.2f}  {regressions.get(stage, "")}',
+                  flush=True)
+        if args.save_baseline:
+            baselines[name] = {'calibration_seconds': calibration, 'stages': results}
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+    elif regressed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
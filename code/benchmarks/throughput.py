@@ -0,0 +1,103 @@
+"""
+End-to-end issuing throughput of `GithubV3Engine`, or of `GithubV4Engine` with --graphql, against the
+local `GithubStandIn`, through **url.
+
+For each combination of credentials and concurrency, a disjunction of the given amount of terms is
+evaluated from an empty cache, and the requests per second, the wall time, the response bytes per
+subquery, the rejections served by the stand-in, the retries of the HTTP client and whether the results amount is exact are reported.
+
+    python -m benchmarks.throughput --terms 8 --tokens 1 2 4 --concurrency 1 4 16 --latency 0.05
+
+With --graphql, the subqueries are issued in batches of each of the given --batch-size, and the
+disjunction is not pushed down to the stand-in, so the subqueries are the same as without it.
+
+    python -m benchmarks.throughput --graphql --terms 10 --batch-size 10 50 100 --concurrency 100 200
+"""
+import argparse
+import time
+from typing import Sequence, Dict
+
+from benchmarks.github_stand_in import GithubStandIn, SyntheticDocuments
+from lib.classes.inputs.str_input import StrInput
+from lib.classes.internal.engines.github_v3_engine import GithubV3Engine
+from lib.classes.internal.engines.github_v4_engine import GithubV4Engine
+from lib.classes.internal.query_issuers.githubv4_query_issuer import GithubV4QueryIssuer
+from lib.classes.internal.parsers import DEFAULT_PARSER_TYPE
+from lib.utilities.metrics import METRICS
+from lib.utilities.with_external_arguments import CustomArgumentParser
+
+
+def run_scenario(documents: SyntheticDocuments, terms: Sequence[str], tokens: int, concurrency: int,
+                 args: argparse.Namespace, batch_size: int = 1) -> Dict[str, object]:
+    query = '{' + ' '.join(terms) + '}'
+    middle_code = next(iter(StrInput([query], DEFAULT_PARSER_TYPE, CustomArgumentParser()).get_middle_codes()))
+    with GithubStandIn(documents, latency=args.latency, jitter=args.jitter, limit=args.limit, period=args.period,
+                       secondary_every=args.secondary_every, retry_after=args.retry_after,
+                       points_limit=args.limit, points_period=args.period) as stand_in:
+        METRICS.reset()
+        args_sequence = ['**url', stand_in.url, '**concurrency', str(concurrency),
+                         '**backoff-factor', str(args.backoff_factor),
+                         '**rate-limit-period', str(args.period),
+                         '**credentials', *(f'token{i}' for i in range(tokens))]
+        if args.graphql:
+            engine = GithubV4Engine([*args_sequence, '**batch-size', str(batch_size), '**no-pushdown'],
+                                    'in-memory', [], False, CustomArgumentParser())
+        else:
+            engine = GithubV3Engine(args_sequence, 'in-memory', [], False, CustomArgumentParser())
+        start = time.perf_counter()
+        results = engine.get_total_amount(middle_code)
+        wall_time = time.perf_counter() - start
+    return {
+        'tokens': tokens,
+        'concurrency': concurrency,
+        'batch_size': batch_size,
+        'requests': results[2],
+        'http_requests': METRICS.get_counter('requests_total'),
+        'wall_time': wall_time,
+        'requests_per_second': results[2] / wall_time if wall_time else 0.,
+        'bytes_per_request': stand_in.response_bytes / max(results[2], 1),
+        'rate_limited': stand_in.rate_limited,
+        'secondary_limited': stand_in.secondary_limited,
+        'retries': METRICS.get_counter('retries_total'),
+        'errors': results[2] - results[3],
+        'exact': results[0] == documents.count_union(terms),
+    }
+
+
+def main(args_sequence: Sequence[str] = None):
+    args_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    args_parser.add_argument('--terms', type=int, default=6,
+                             help='terms of the disjunction, which gives 2^TERMS - 1 subqueries')
+    args_parser.add_argument('--tokens', type=int, nargs='+', default=[1, 2])
+    args_parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4])
+    args_parser.add_argument('--latency', type=float, default=0.02, help='seconds of each search request')
+    args_parser.add_argument('--jitter', type=float, default=0.01)
+    args_parser.add_argument('--limit', type=int, default=600,
+                             help='search requests, or GraphQL points, per credential and window')
+    args_parser.add_argument('--period', type=float, default=60, help='seconds of the rate limit window')
+    args_parser.add_argument('--secondary-every', type=int, default=0,
+                             help='reject one of each given amount of search requests by a secondary rate limit')
+    args_parser.add_argument('--retry-after', type=int, default=1)
+    args_parser.add_argument('--backoff-factor', type=float, default=1)
+    args_parser.add_argument('--documents', type=int, default=SyntheticDocuments.DEFAULT_SIZE)
+    args_parser.add_argument('--graphql', action='store_true', help='issue the subqueries through GithubV4Engine')
+    args_parser.add_argument('--batch-size', type=int, nargs='+', default=[GithubV4QueryIssuer.DEFAULT_BATCH_SIZE],
+                             help='subqueries per GraphQL request, with --graphql')
+    args = args_parser.parse_args(args_sequence)
+
+    documents = SyntheticDocuments(args.documents)
+    terms = [f'term{i}' for i in range(args.terms)]
+    print(f'{"Tokens":>6} {"Concurrency":>11} {"Batch":>5} {"Requests":>8} {"HTTP":>6} {"Wall time":>9} '
+          f'{"Req/s":>8} {"Bytes/req":>9} {"403":>5} {"403 (2nd)":>9} {"Retries":>7} {"Errors":>6} {"Exact":>5}')
+    for tokens in args.tokens:
+        for concurrency in args.concurrency:
+            for batch_size in (args.batch_size if args.graphql else [1]):
+                r = run_scenario(documents, terms, tokens, concurrency, args, batch_size)
+                print(f'{r["tokens"]:>6} {r["concurrency"]:>11} {r["batch_size"]:>5} {r["requests"]:>8} '
+                      f'{r["http_requests"]:>6} {r["wall_time"]:>9.2f} {r["requests_per_second"]:>8.2f} '
+                      f'{r["bytes_per_request"]:>9.0f} {r["rate_limited"]:>5} {r["secondary_limited"]:>9} {r["retries"]:>7g} {r["errors"]:>6} '
+                      f'{str(r["exact"]):>5}')
+
+
+if __name__ == '__main__':
+    main()
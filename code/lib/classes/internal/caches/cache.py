@@ -1,7 +1,10 @@
 from abc import ABC, abstractmethod
-from typing import Sequence
+import time
+from contextlib import contextmanager
+from typing import Sequence, Mapping, Optional, Iterator
 
 from lib.classes import WithLoggingAndExternalArguments
+from lib.utilities.metrics import METRICS
 
 
 class Cache(dict, WithLoggingAndExternalArguments, ABC):
@@ -17,3 +20,30 @@ class Cache(dict, WithLoggingAndExternalArguments, ABC):
     @abstractmethod
     def _reset(self):
         pass
+
+    def get_amount(self, subquery: str) -> Optional[int]:
+        """The cached amount of the subquery, or None if it is not cached. Hits, misses and latency are measured"""
+        start = time.perf_counter()
+        amount = self[subquery] if subquery in self else None
+        METRICS.observe('cache_lookup_seconds', time.perf_counter() - start)
+        METRICS.increment('cache_misses_total' if amount is None else 'cache_hits_total')
+        return amount
+
+    def set_amount(self, subquery: str, amount: int):
+        with METRICS.time('cache_write_seconds'):
+            self[subquery] = amount
+
+    def sync(self):
+        pass
+
+    def close(self):
+        pass
+
+    def get_reader(self) -> Mapping:
+        """A mapping to read the cache from a forked process, within `shared_with_readers`"""
+        return self
+
+    @contextmanager
+    def shared_with_readers(self) -> Iterator[None]:
+        """The processes to read the cache are forked in the block, where the cache is not written"""
+        yield
@@ -1,5 +1,6 @@
+from contextlib import contextmanager
 from shelve import DbfilenameShelf
-from typing import Sequence
+from typing import Sequence, Mapping, Iterator
 
 from lib.classes.internal.caches.cache import Cache
 from lib.utilities.logging import ExitCode
@@ -55,3 +56,23 @@ class ShelfCache(DbfilenameShelf, Cache):
         DbfilenameShelf.sync(self)
         # noinspection PyUnresolvedReferences
         self._debug('Synchronized', header=f'Cache "{self.filename}"')
+
+    def get_reader(self) -> Mapping:
+        """A new read-only shelf, as the file position of the inherited one would be shared between processes"""
+        # noinspection PyUnresolvedReferences
+        return DbfilenameShelf(filename=self.filename, flag='r')
+
+    @contextmanager
+    def shared_with_readers(self) -> Iterator[None]:
+        """
+        The shelf is synchronized and closed in the block, as some databases (gdbm) lock the file of
+        a writer against the readers, and then opened again without truncating it
+        """
+        self.close()
+        try:
+            yield
+        finally:
+            # noinspection PyUnresolvedReferences
+            DbfilenameShelf.__init__(self, filename=self.filename,
+                                     flag='w' if self.mode == 'new' else self.FILE_CACHE_MODE[self.mode],
+                                     writeback=self.in_memory_cache)
@@ -0,0 +1,9 @@
+from lib.classes.internal.decomposers.disjoint_decomposer import DisjointDecomposer
+from lib.classes.internal.decomposers.exclusion_inclusion_decomposer import ExclusionInclusionDecomposer
+
+DECOMPOSER_TYPE = {
+    ExclusionInclusionDecomposer.ARG_NAME: ExclusionInclusionDecomposer,
+    DisjointDecomposer.ARG_NAME: DisjointDecomposer
+}
+
+DEFAULT_DECOMPOSER_TYPE = ExclusionInclusionDecomposer.ARG_NAME
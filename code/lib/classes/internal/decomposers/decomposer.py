@@ -1,7 +1,8 @@
 from abc import abstractmethod
-from typing import Iterable
+from typing import Iterable, Optional, Tuple, Dict, Any, Callable, List
 
 from lib.classes.internal.middle_codes.middle_code import MiddleCode
+from lib.classes.internal.translators.translator import Translator
 from lib.utilities.logging.with_logging import WithLogging
 
 
@@ -10,11 +11,40 @@ class Decomposer(WithLogging):
     def __init__(self):
         WithLogging.__init__(self)
         self._middle_code = None
+        self._satisfies_query_restrictions: Optional[Callable[[str], bool]] = None
 
     @abstractmethod
     def get_subqueries(self) -> Iterable[MiddleCode]:
         pass
 
+    def get_translated_subqueries(self, translator: Translator) -> Iterable[Tuple[str, str, int]]:
+        """
+        Same as `get_subqueries` but gives triples (name, particular query, sum factor).
+        Decomposers may override it to avoid building a middle code for each subquery.
+        """
+        for q, sum_factor in self.get_subqueries():
+            yield q.name, translator.get_particular_query(q), sum_factor
+
+    def get_ranked_sub_queries_amount(self) -> int:
+        """
+        Amount of subqueries that can be addressed by their rank (see `get_translated_subqueries_range`).
+        It is 0 if the subqueries can only be given in sequence, e.g. when they depend on the amounts
+        of the previous ones.
+        """
+        return 0
+
+    def get_translated_subqueries_range(self, translator: Translator,
+                                        begin: int, end: int) -> Iterable[Tuple[str, str, int]]:
+        """Same as `get_translated_subqueries` but only for the subqueries with rank in [begin, end)"""
+        return ()
+
+    def depends_on_sub_amounts(self) -> bool:
+        """
+        Whether the subqueries given depend on the amounts of the previous ones (see `set_sub_amount`),
+        so each one must be set before the next one is requested
+        """
+        return False
+
     @abstractmethod
     def get_sub_queries_amount(self) -> int:
         pass
@@ -23,5 +53,76 @@ class Decomposer(WithLogging):
     def longest_subexpression(self) -> MiddleCode:
         pass
 
+    def get_translated_longest_subqueries(self, translator: Translator) -> Iterable[str]:
+        """
+        The particular queries that the longest subexpression is issued as, which are more than one
+        if it has to be rewritten to satisfy the query restrictions (see `set_query_restrictions`)
+        """
+        return [translator.get_particular_query(self.longest_subexpression())]
+
     def set_middle_code(self, middle_code: MiddleCode):
         self._middle_code = middle_code
+
+    def set_query_restrictions(self, satisfies_query_restrictions: Optional[Callable[[str], bool]]):
+        """
+        Sets the predicate that tells whether a particular query can be issued. Decomposers may use
+        it to rewrite the subqueries that can not be issued as equivalent sums of other subqueries.
+        """
+        self._satisfies_query_restrictions = satisfies_query_restrictions
+
+    def set_sub_amount(self, name: str, amount: Optional[int], issued: bool):
+        """
+        Receives the outcome of the subquery with the given name previously given by `get_subqueries`.
+        The amount is None if it is not known (i.e. in simulation mode or after an error).
+        """
+        pass
+
+    def pop_sub_amounts_state(self) -> Any:
+        """
+        Gives and forgets everything learned through `set_sub_amount`, including the subqueries
+        given and still pending. It is used to merge into this decomposer the work done by a copy
+        of it in another process (see `merge_sub_amounts_state`).
+        """
+        return None
+
+    def merge_sub_amounts_state(self, state: Any):
+        pass
+
+    def reset_sub_amounts(self):
+        """
+        Forgets everything counted while the subqueries were enumerated, so they can be enumerated again
+        from scratch without setting the middle code again (see `set_middle_code`)
+        """
+        self.pop_sub_amounts_state()
+
+    def get_pruned_sub_queries_amount(self) -> int:
+        return 0
+
+    def get_expansion_sub_queries_amount(self) -> int:
+        """Amount of subqueries added by rewriting the ones that do not satisfy the query restrictions"""
+        return 0
+
+    def get_truncated_sub_queries_amount(self) -> int:
+        return 0
+
+    def get_bounds(self) -> Optional[Tuple[int, int]]:
+        """Lower and upper bounds of the results amount when the decomposition is not exact"""
+        return None
+
+    def get_depths_end_ranks(self) -> List[int]:
+        """
+        If the subqueries are ranked by depth, the rank after the last subquery of each depth, from the
+        first depth on (see `get_partial_bounds`). Otherwise, an empty list.
+        """
+        return []
+
+    def get_partial_bounds(self, depth: int) -> Optional[Tuple[int, Optional[int]]]:
+        """
+        Lower and upper bounds of the results amount given by the amounts of the subqueries up to the
+        given depth, once all of them have been set (see `get_depths_end_ranks`). The upper bound is None
+        if there is none yet.
+        """
+        return None
+
+    def get_issued_sub_queries_per_depth(self) -> Dict[int, int]:
+        return {}
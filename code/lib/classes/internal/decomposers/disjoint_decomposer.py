@@ -0,0 +1,81 @@
+from collections import Counter
+from typing import Iterable, FrozenSet, List, Tuple, Optional
+
+import sympy
+
+from lib.classes.internal.decomposers.dnf_converter import DnfConverter
+from lib.classes.internal.decomposers.dnf_decomposer import DnfDecomposer
+from lib.classes.internal.decomposers.espresso_minimizer import EspressoMinimizer
+from lib.classes.internal.middle_codes.middle_code import MiddleCode
+from lib.classes.internal.middle_codes.sympy_logic_middle_code import SympyLogicMiddleCode
+from lib.classes.internal.rules.qualifier_rules import QualifierRules
+
+
+class DisjointDecomposer(DnfDecomposer):
+    """
+    Rewrites the disjunctive normal form of a query as a disjunction of mutually
+    disjoint conjunctions by means of the Shannon expansion:
+
+        f = x & f|x  |  ~x & f|~x
+
+    The results amount of the query is then the plain sum of the results amounts
+    of those conjunctions, which may contain negated literals.
+    """
+
+    ARG_NAME = 'disjoint'
+
+    def __init__(self, deep_simplify=False, rules: Optional[QualifierRules] = None,
+                 dnf_converter: Optional[DnfConverter] = None, minimizer: Optional[EspressoMinimizer] = None):
+        DnfDecomposer.__init__(self, deep_simplify, rules, dnf_converter, minimizer)
+        self._disjoint_terms: List[FrozenSet[sympy.Basic]] = []
+
+    def set_middle_code(self, middle_code: MiddleCode):
+        DnfDecomposer.set_middle_code(self, middle_code)
+        self._debug(f'Converting to disjoint terms ...', header=self._middle_code.full_name)
+        disjoint_terms = [self._simplify(frozenset(term))
+                          for term in self._get_disjoint_terms(self._absorb(self._terms), ())]
+        self._disjoint_terms = [term for term in disjoint_terms if term is not None]
+        if len(self._disjoint_terms) < len(disjoint_terms):
+            self._debug(f'Provably empty disjoint terms discarded',
+                        arg=len(disjoint_terms) - len(self._disjoint_terms))
+        self._debug(f'Disjoint terms number', arg=len(self._disjoint_terms))
+
+    def _get_disjoint_terms(self, terms: List[FrozenSet[sympy.Basic]],
+                            fixed: Tuple[sympy.Basic, ...]) -> Iterable[Tuple[sympy.Basic, ...]]:
+        if not terms:
+            return
+        if len(terms) == 1:
+            yield fixed + tuple(terms[0])
+            return
+        counter = Counter(literal.args[0] if isinstance(literal, sympy.Not) else literal
+                          for term in terms for literal in term)
+        symbol = counter.most_common(1)[0][0]
+        for literal in (symbol, sympy.Not(symbol)):
+            opposite = sympy.Not(literal)
+            cofactor = [term - {literal} for term in terms if opposite not in term]
+            yield from self._get_disjoint_terms(self._absorb(cofactor), fixed + (literal,))
+
+    @staticmethod
+    def _absorb(terms: List[FrozenSet[sympy.Basic]]) -> List[FrozenSet[sympy.Basic]]:
+        """Removes the terms that are supersets of another term (x | x & y == x)"""
+        absorbed = []
+        for term in sorted(set(terms), key=len):
+            if not any(other <= term for other in absorbed):
+                absorbed.append(term)
+        return absorbed
+
+    def longest_subexpression(self) -> SympyLogicMiddleCode:
+        return SympyLogicMiddleCode(exp=sympy.And(*max(self._disjoint_terms,
+                                                       key=lambda t: sum(len(str(s)) + 1 for s in t),
+                                                       default=())))
+
+    def get_subqueries(self) -> Iterable[MiddleCode]:
+        for i, term in enumerate(self._disjoint_terms, start=1):
+            yield SympyLogicMiddleCode(
+                namespace=self._middle_code.full_name,
+                name=str(i),
+                exp=sympy.And(*term)
+            ), 1
+
+    def get_sub_queries_amount(self) -> int:
+        return len(self._disjoint_terms)
@@ -0,0 +1,159 @@
+import dbm
+import hashlib
+import shelve
+import time
+from typing import List, FrozenSet, Optional, Dict
+
+import sympy
+
+from lib.utilities.logging.with_logging import WithLogging
+
+
+class DnfConverter(WithLogging):
+    """
+    Converts a boolean expression to its disjunctive normal form as a list of terms, each one
+    the frozenset of its literals. The expression is first taken to negation normal form, and
+    then the terms of the conjunctions are multiplied out. After each step the terms containing
+    a literal and its negation are dropped, and the terms that are supersets of another term are
+    absorbed (x | x & y == x), so the intermediate forms stay as small as possible.
+
+    The literals are handled as ints while converting: the i-th symbol is 2i and its negation 2i + 1.
+
+    The conversion gives up, returning None, if any intermediate form has more than max_terms
+    terms or if it takes more than timeout seconds.
+
+    The forms of the conjunctions and disjunctions already converted are memoized during the
+    whole run, so the named subexpressions shared by several queries are converted only once.
+    If a cache file is given, the forms of the whole expressions are also stored in it, keyed
+    by a hash of their canonical representation, so they are not converted again in later runs.
+    If the file cannot be opened, the expressions are converted without it.
+    The file is kept open until `close` is called.
+    """
+
+    DEFAULT_MAX_TERMS = 10000
+    DEFAULT_TIMEOUT = 30
+    CLOCK_CHECK_PERIOD = 1024
+    MAX_MEMOIZED_FORMS = 2 ** 14
+    CACHE_KEY_VERSION = '1'
+
+    def __init__(self, max_terms: int = DEFAULT_MAX_TERMS, timeout: float = DEFAULT_TIMEOUT,
+                 cache_filename: Optional[str] = None):
+        WithLogging.__init__(self)
+        self._max_terms = max_terms
+        self._timeout = timeout
+        self._deadline = 0.
+        self._steps = 0
+        self._symbols: List[sympy.Symbol] = []
+        self._symbol_ids: Dict[sympy.Symbol, int] = {}
+        self._forms: Dict[sympy.Basic, List[FrozenSet[int]]] = {}
+        self._cache = None
+        if cache_filename:
+            # dbm.error is the tuple of the errors of the dbm modules, OSError included
+            try:
+                self._cache = shelve.open(cache_filename)
+            except dbm.error as e:
+                self._warning('Error while opening DNF cache. The forms will not be cached', e)
+
+    def convert(self, exp: sympy.Basic) -> Optional[List[FrozenSet[sympy.Basic]]]:
+        key = self._get_cache_key(exp) if self._cache is not None else None
+        if key is not None and key in self._cache:
+            self._debug('DNF found in the cache')
+            return [frozenset(sympy.Not(sympy.Symbol(name)) if negated else sympy.Symbol(name)
+                              for name, negated in term)
+                    for term in self._cache[key]]
+        self._deadline = time.monotonic() + self._timeout
+        self._steps = 0
+        terms = self._convert(sympy.to_nnf(exp, simplify=False))
+        if terms is None:
+            return None
+        if key is not None:
+            self._cache[key] = [tuple((self._symbols[literal_id >> 1].name, bool(literal_id & 1))
+                                      for literal_id in term)
+                                for term in terms]
+        return [frozenset(map(self._get_literal, term)) for term in terms]
+
+    def close(self):
+        """Synchronizes and closes the cache file, if any. The forms are not stored anymore"""
+        if self._cache is not None:
+            self._cache.close()
+            self._cache = None
+
+    def _get_cache_key(self, exp: sympy.Basic) -> str:
+        """sympy keeps the arguments of commutative operators sorted, so equal expressions have the same srepr"""
+        return hashlib.sha256(f'{self.CACHE_KEY_VERSION}:{sympy.srepr(exp)}'.encode()).hexdigest()
+
+    def _get_literal_id(self, symbol: sympy.Symbol, negated: bool) -> int:
+        symbol_id = self._symbol_ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = self._symbol_ids[symbol] = len(self._symbols)
+            self._symbols.append(symbol)
+        return symbol_id << 1 | negated
+
+    def _get_literal(self, literal_id: int) -> sympy.Basic:
+        symbol = self._symbols[literal_id >> 1]
+        return sympy.Not(symbol) if literal_id & 1 else symbol
+
+    def _convert(self, exp: sympy.Basic) -> Optional[List[FrozenSet[int]]]:
+        if isinstance(exp, sympy.Not):
+            return [frozenset((self._get_literal_id(exp.args[0], True),))]
+        if isinstance(exp, sympy.Symbol):
+            return [frozenset((self._get_literal_id(exp, False),))]
+        if not isinstance(exp, (sympy.Or, sympy.And)):
+            return [frozenset()] if exp == sympy.true else []
+        terms = self._forms.get(exp)
+        if terms is None:
+            terms = self._convert_operation(exp)
+            if terms is not None:
+                if len(self._forms) >= self.MAX_MEMOIZED_FORMS:
+                    self._forms = {}
+                self._forms[exp] = terms
+        return terms
+
+    def _convert_operation(self, exp: sympy.Basic) -> Optional[List[FrozenSet[int]]]:
+        if isinstance(exp, sympy.Or):
+            terms = []
+            for arg in exp.args:
+                arg_terms = self._convert(arg)
+                if arg_terms is None:
+                    return None
+                terms.extend(arg_terms)
+            return self._absorb(terms)
+        terms = [frozenset()]
+        for arg in exp.args:
+            arg_terms = self._convert(arg)
+            if arg_terms is None:
+                return None
+            terms = self._multiply(terms, arg_terms)
+            if terms is None:
+                return None
+        return terms
+
+    def _multiply(self, terms1: List[FrozenSet[int]], terms2: List[FrozenSet[int]]) -> Optional[List[FrozenSet[int]]]:
+        terms = set()
+        for term1 in terms1:
+            for term2 in terms2:
+                term = term1 | term2
+                if not any(literal ^ 1 in term for literal in term2):
+                    terms.add(term)
+            if len(terms) > self._max_terms or self._is_late():
+                return None
+        return self._absorb(terms)
+
+    def _absorb(self, terms) -> Optional[List[FrozenSet[int]]]:
+        """Only the shorter terms are compared, as two different terms of the same length can not absorb each other"""
+        absorbed = []
+        shorter_amount = 0
+        length = 0
+        for term in sorted(set(terms), key=len):
+            if len(term) > length:
+                length = len(term)
+                shorter_amount = len(absorbed)
+            if not any(absorbed[i] <= term for i in range(shorter_amount)):
+                absorbed.append(term)
+                if len(absorbed) > self._max_terms or self._is_late():
+                    return None
+        return absorbed
+
+    def _is_late(self) -> bool:
+        self._steps += 1
+        return self._steps % self.CLOCK_CHECK_PERIOD == 0 and time.monotonic() > self._deadline
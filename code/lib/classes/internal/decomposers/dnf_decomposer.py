@@ -0,0 +1,162 @@
+from abc import ABC
+from typing import FrozenSet, Optional, List, Tuple, Iterable, Sequence
+
+import sympy
+from sympy import simplify_logic, to_dnf
+
+from lib.classes.internal.decomposers.decomposer import Decomposer
+from lib.classes.internal.decomposers.dnf_converter import DnfConverter
+from lib.classes.internal.decomposers.espresso_minimizer import EspressoMinimizer
+from lib.classes.internal.middle_codes.middle_code import MiddleCode
+from lib.classes.internal.middle_codes.sympy_logic_middle_code import SympyLogicMiddleCode
+from lib.classes.internal.rules.qualifier_rules import QualifierRules
+from lib.classes.internal.translators.translator import Translator
+from lib.utilities.functions import bits_amount
+from lib.utilities.metrics import METRICS
+
+
+class DnfDecomposer(Decomposer, ABC):
+    """Base class for decomposers that work over the terms of the disjunctive normal form of a query"""
+
+    def __init__(self, deep_simplify=False, rules: Optional[QualifierRules] = None,
+                 dnf_converter: Optional[DnfConverter] = None, minimizer: Optional[EspressoMinimizer] = None):
+        Decomposer.__init__(self)
+        self._deep_simplify = deep_simplify
+        self._rules = rules
+        self._dnf_converter = dnf_converter or DnfConverter()
+        self._minimizer = minimizer
+        self._terms: List[FrozenSet[sympy.Basic]] = []
+        self._expansion_subqueries = 0
+
+    def set_middle_code(self, middle_code: MiddleCode):
+        Decomposer.set_middle_code(self, middle_code)
+        self._expansion_subqueries = 0
+        with METRICS.time('dnf_conversion_seconds'):
+            self._terms = self._convert_to_dnf()
+        if self._rules:
+            terms_amount = len(self._terms)
+            self._terms = [term for term in map(self._rules.simplify, self._terms) if term is not None]
+            if len(self._terms) < terms_amount:
+                self._info('Provably empty terms discarded', terms_amount - len(self._terms),
+                           header=self._middle_code.full_name)
+        if self._minimizer and len(self._terms) > 1:
+            self._terms = self._minimizer.minimize(self._terms, header=self._middle_code.full_name)
+        self._debug(f'Disjunctive normal form terms number', arg=len(self._terms))
+
+    @staticmethod
+    def _get_literals(term: sympy.Basic) -> FrozenSet[sympy.Basic]:
+        return frozenset(term.args) if isinstance(term, sympy.And) else frozenset((term,))
+
+    def _simplify(self, literals: FrozenSet[sympy.Basic]) -> Optional[FrozenSet[sympy.Basic]]:
+        """Returns None if the conjunction of the literals is provably empty (see `QualifierRules.simplify`)"""
+        return self._rules.simplify(literals) if self._rules else literals
+
+    def get_translated_subqueries(self, translator: Translator) -> Iterable[Tuple[str, str, int]]:
+        for q, sum_factor in self.get_subqueries():
+            query = translator.get_particular_query(q)
+            if self._satisfies_query_restrictions and not self._satisfies_query_restrictions(query):
+                yield from self._get_restricted_subqueries(translator, q.name, query,
+                                                           self._get_literals(q.exp), sum_factor)
+            else:
+                yield q.name, query, sum_factor
+
+    def get_translated_longest_subqueries(self, translator: Translator) -> Iterable[str]:
+        longest = self.longest_subexpression()
+        query = translator.get_particular_query(longest)
+        if self._satisfies_query_restrictions and not self._satisfies_query_restrictions(query):
+            subqueries = self._expand_negations(translator, 'longest', self._get_literals(longest.exp), 1)
+            if subqueries is not None:
+                return [subquery for _, subquery, _ in subqueries]
+        return [query]
+
+    def _get_restricted_subqueries(self, translator: Translator, name: str, query: str,
+                                   literals: Iterable[sympy.Basic], sum_factor: int) -> Iterable[Tuple[str, str, int]]:
+        subqueries = self._expand_negations(translator, name, literals, sum_factor)
+        if subqueries is None:
+            yield name, query, sum_factor
+            return
+        self._debug(f'Negations expanded. Subqueries number', arg=len(subqueries),
+                    header=f'{self._middle_code.full_name}.{name}')
+        self._expansion_subqueries += len(subqueries) - 1
+        self._set_expanded_subqueries(name, subqueries)
+        yield from subqueries
+
+    def _expand_negations(self, translator: Translator, name: str, literals: Iterable[sympy.Basic],
+                          sum_factor: int) -> Optional[List[Tuple[str, str, int]]]:
+        """
+        Rewrites a conjunction whose query does not satisfy the restrictions as a signed sum of
+        conjunctions with fewer negated literals, as count(A & ~B) = count(A) - count(A & B).
+        Expanding s negated literals gives 2^s queries, so the least s for which the longest of them,
+        the one with all the expanded literals as positive, satisfies the restrictions is taken.
+        Returns None if there is no such s. All the literals are never expanded, as the query of the
+        conjunction of no literals would be empty.
+        """
+        literals = list(literals)
+        negated = sorted((literal for literal in literals if isinstance(literal, sympy.Not)), key=str)
+        others = [literal for literal in literals if not isinstance(literal, sympy.Not)]
+        for s in range(1, len(negated) + 1):
+            expanded = [literal.args[0] for literal in negated[:s]]
+            kept = others + negated[s:]
+            if not kept:
+                return None
+            if self._satisfies_query_restrictions(self._get_query(translator, kept + expanded)):
+                break
+        else:
+            return None
+        subqueries = []
+        for t in range(2 ** len(expanded)):
+            subquery_literals = self._simplify(frozenset(kept + [literal for j, literal in enumerate(expanded)
+                                                                 if t >> j & 1]))
+            if subquery_literals is not None:
+                subqueries.append((f'{name}.{t + 1}', self._get_query(translator, subquery_literals),
+                                   -sum_factor if bits_amount(t) & 1 else sum_factor))
+        return subqueries
+
+    @staticmethod
+    def _get_query(translator: Translator, literals: Iterable[sympy.Basic]) -> str:
+        return translator.join_literal_queries([translator.get_literal_query(literal)
+                                                for literal in sorted(literals, key=str)])
+
+    def get_expansion_sub_queries_amount(self) -> int:
+        return self._expansion_subqueries
+
+    def reset_sub_amounts(self):
+        Decomposer.reset_sub_amounts(self)
+        self._expansion_subqueries = 0
+
+    def _set_expanded_subqueries(self, name: str, subqueries: Sequence[Tuple[str, str, int]]):
+        """Called when the subquery with the given name is replaced by the given ones"""
+        pass
+
+    def longest_subexpression(self) -> SympyLogicMiddleCode:
+        return SympyLogicMiddleCode(exp=simplify_logic(self._middle_code.exp.replace(sympy.Or, sympy.And)))
+
+    def _convert_to_dnf(self) -> List[FrozenSet[sympy.Basic]]:
+        """
+        Converts the expression with the `DnfConverter`, which is then minimized by sympy only if
+        deep simplification was asked for. If the conversion exceeds its budget, the expression
+        is converted by sympy instead, which may take much longer.
+        """
+        self._debug(f'Converting to DNF ...', header=self._middle_code.full_name)
+        terms = self._dnf_converter.convert(self._middle_code.exp)
+        if terms is None:
+            self._warning('DNF conversion budget exceeded, falling back to sympy conversion',
+                          header=self._middle_code.full_name)
+            exp = to_dnf(simplify_logic(self._middle_code.exp, form='dnf', force=self._deep_simplify))
+        else:
+            exp = sympy.Or(*(sympy.And(*term) for term in terms))
+            if self._deep_simplify:
+                exp = simplify_logic(exp, form='dnf', force=True)
+        self._middle_code.exp = exp
+        self._debug(f'Converted to DNF', header=self._middle_code.full_name)
+        if terms is None or self._deep_simplify:
+            terms = [self._get_literals(term) for term in self._get_terms(exp)]
+        return terms
+
+    @staticmethod
+    def _get_terms(exp: sympy.Basic) -> Tuple[sympy.Basic, ...]:
+        if exp == sympy.false:
+            return ()
+        if isinstance(exp, sympy.Or):
+            return exp.args
+        return exp,
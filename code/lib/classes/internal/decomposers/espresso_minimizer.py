@@ -0,0 +1,193 @@
+import time
+from typing import List, FrozenSet, Tuple, Dict
+
+import sympy
+
+from lib.utilities.functions import bits_amount
+from lib.utilities.logging.with_logging import WithLogging
+
+Cube = Tuple[int, int]
+
+
+class EspressoMinimizer(WithLogging):
+    """
+    Heuristic two-level minimizer in the style of Espresso. It looks for a cover of the same
+    function with fewer terms by repeating the expand, irredundant and reduce steps while
+    the cover improves:
+
+        expand          removes literals from each cube as long as it stays inside the function,
+                        and drops the cubes covered by the expanded one
+        irredundant     drops the cubes covered by the rest of the cover
+        reduce          adds literals to each cube as long as the rest of the cover keeps
+                        covering what is left out, so the next expansion may go another way
+
+    A cube is a pair of bitmasks (positive, negative) with the bit of each variable set in the
+    first one if the variable appears as is, and in the second one if it appears negated.
+    Whether a cube is covered is decided by the tautology of the cofactor of the cover.
+
+    When the time budget is exhausted every pending containment check fails, which only makes
+    the steps more conservative, and the best cover found so far is returned.
+    """
+
+    DEFAULT_TIMEOUT = 10
+    CLOCK_CHECK_PERIOD = 256
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT):
+        WithLogging.__init__(self)
+        self._timeout = timeout
+        self._deadline = 0.
+        self._steps = 0
+        self._late = False
+
+    def minimize(self, terms: List[FrozenSet[sympy.Basic]], header=None) -> List[FrozenSet[sympy.Basic]]:
+        self._info('Terms number before minimization', len(terms), header=header)
+        self._deadline = time.monotonic() + self._timeout
+        self._steps = 0
+        self._late = False
+        symbols = sorted({self._get_symbol(literal) for term in terms for literal in term}, key=str)
+        symbol_ids = {symbol: i for i, symbol in enumerate(symbols)}
+        cover = [self._get_cube(term, symbol_ids) for term in terms]
+        best = self._irredundant(self._expand(cover))
+        while not self._late:
+            cover = self._irredundant(self._expand(self._reduce(best)))
+            if self._get_cost(cover) >= self._get_cost(best):
+                break
+            best = cover
+        if self._late:
+            self._warning('Minimization time budget exhausted', header=header)
+        self._info('Terms number after minimization', len(best), header=header)
+        return [frozenset(symbols[i] for i in range(len(symbols)) if positive >> i & 1) |
+                frozenset(sympy.Not(symbols[i]) for i in range(len(symbols)) if negative >> i & 1)
+                for positive, negative in best]
+
+    @staticmethod
+    def _get_symbol(literal: sympy.Basic) -> sympy.Basic:
+        return literal.args[0] if isinstance(literal, sympy.Not) else literal
+
+    @staticmethod
+    def _get_cube(term: FrozenSet[sympy.Basic], symbol_ids: Dict[sympy.Basic, int]) -> Cube:
+        positive = negative = 0
+        for literal in term:
+            if isinstance(literal, sympy.Not):
+                negative |= 1 << symbol_ids[literal.args[0]]
+            else:
+                positive |= 1 << symbol_ids[literal]
+        return positive, negative
+
+    @staticmethod
+    def _get_cost(cover: List[Cube]) -> Tuple[int, int]:
+        return len(cover), sum(bits_amount(positive | negative) for positive, negative in cover)
+
+    @staticmethod
+    def _cofactor(cover: List[Cube], cube: Cube) -> List[Cube]:
+        positive, negative = cube
+        return [(p & ~positive, n & ~negative) for p, n in cover if not (p & negative or n & positive)]
+
+    def _is_covered(self, cube: Cube, cover: List[Cube]) -> bool:
+        return self._is_tautology(self._cofactor(cover, cube))
+
+    def _is_tautology(self, cover: List[Cube]) -> bool:
+        self._steps += 1
+        if self._steps % self.CLOCK_CHECK_PERIOD == 0 and time.monotonic() > self._deadline:
+            self._late = True
+        if self._late or not cover:
+            return False
+        positive = negative = 0
+        for p, n in cover:
+            if not (p | n):
+                return True
+            positive |= p
+            negative |= n
+        binate = positive & negative
+        unate = (positive | negative) & ~binate
+        if unate:
+            # the cubes with a unate variable can be dropped, as they are covered by the rest if it is a tautology
+            return self._is_tautology([(p, n) for p, n in cover if not (p | n) & unate])
+        if sum(1 / (1 << bits_amount(p | n)) for p, n in cover) < 1:
+            # the cubes do not have enough minterms to cover the whole space
+            return False
+        bits = [0] * binate.bit_length()
+        for p, n in cover:
+            variables = (p | n) & binate
+            while variables:
+                low = variables & -variables
+                bits[low.bit_length() - 1] += 1
+                variables ^= low
+        variable = 1 << max(range(len(bits)), key=bits.__getitem__)
+        return (self._is_tautology(self._cofactor(cover, (variable, 0))) and
+                self._is_tautology(self._cofactor(cover, (0, variable))))
+
+    def _expand(self, cover: List[Cube]) -> List[Cube]:
+        """The literals whose opposite appears less often in the cover are removed first"""
+        opposite_counts: Dict[Cube, int] = {}
+        for p, n in cover:
+            for literal in self._get_literals((p, n)):
+                opposite = literal[1], literal[0]
+                opposite_counts[opposite] = opposite_counts.get(opposite, 0) + 1
+        expanded = []
+        for cube in sorted(cover, key=lambda c: -bits_amount(c[0] | c[1])):
+            if any(self._contains(other, cube) for other in expanded):
+                continue
+            for literal in sorted(self._get_literals(cube), key=lambda lit: opposite_counts.get(lit, 0)):
+                candidate = cube[0] & ~literal[0], cube[1] & ~literal[1]
+                if self._is_covered(candidate, cover):
+                    cube = candidate
+            expanded = [other for other in expanded if not self._contains(cube, other)]
+            expanded.append(cube)
+        return expanded
+
+    def _irredundant(self, cover: List[Cube]) -> List[Cube]:
+        """The cubes with more literals are the first ones tried to be dropped"""
+        irredundant = list(cover)
+        for cube in sorted(cover, key=lambda c: -bits_amount(c[0] | c[1])):
+            rest = list(irredundant)
+            rest.remove(cube)
+            if self._is_covered(cube, rest):
+                irredundant = rest
+        return irredundant
+
+    def _reduce(self, cover: List[Cube]) -> List[Cube]:
+        """
+        Only the variables that appear in the cofactor of the rest of the cover are tried,
+        as adding any other literal would leave out a part that the rest does not cover.
+        """
+        reduced = list(cover)
+        for i, cube in enumerate(reduced):
+            rest = self._cofactor(reduced[:i] + reduced[i + 1:], cube)
+            free = self._get_variables(rest)
+            while free:
+                variable = free & -free
+                free ^= variable
+                if self._is_tautology(self._cofactor(rest, (0, variable))):
+                    literal = variable, 0
+                elif self._is_tautology(self._cofactor(rest, (variable, 0))):
+                    literal = 0, variable
+                else:
+                    continue
+                cube = cube[0] | literal[0], cube[1] | literal[1]
+                rest = self._cofactor(rest, literal)
+                free &= self._get_variables(rest)
+            reduced[i] = cube
+        return reduced
+
+    @staticmethod
+    def _get_variables(cover: List[Cube]) -> int:
+        variables = 0
+        for p, n in cover:
+            variables |= p | n
+        return variables
+
+    @staticmethod
+    def _get_literals(cube: Cube) -> List[Cube]:
+        literals = []
+        for mask, is_negative in ((cube[0], False), (cube[1], True)):
+            while mask:
+                low = mask & -mask
+                literals.append((0, low) if is_negative else (low, 0))
+                mask ^= low
+        return literals
+
+    @staticmethod
+    def _contains(cube: Cube, other: Cube) -> bool:
+        """Whether the cube contains the other one, i.e. its literals are a subset of the other's literals"""
+        return cube[0] & other[0] == cube[0] and cube[1] & other[1] == cube[1]
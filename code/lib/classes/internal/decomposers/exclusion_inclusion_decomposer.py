@@ -1,53 +1,474 @@
-from itertools import combinations
-from typing import Iterable
+import time
+from collections import defaultdict
+from typing import Iterable, Dict, Set, Tuple, Hashable, List, Optional, Any, Sequence
 
 import sympy
-from sympy import simplify_logic, to_dnf
 
-from lib.classes.internal.decomposers.decomposer import Decomposer
+from lib.classes.internal.decomposers.dnf_converter import DnfConverter
+from lib.classes.internal.decomposers.dnf_decomposer import DnfDecomposer
+from lib.classes.internal.decomposers.espresso_minimizer import EspressoMinimizer
 from lib.classes.internal.middle_codes.middle_code import MiddleCode
 from lib.classes.internal.middle_codes.sympy_logic_middle_code import SympyLogicMiddleCode
+from lib.classes.internal.rules.qualifier_rules import QualifierRules, MaskRules
+from lib.classes.internal.translators.translator import Translator
+from lib.utilities.functions import combination_amount, bits_amount
+from lib.utilities.metrics import METRICS
 
 
-class ExclusionInclusionDecomposer(Decomposer):
+class ExclusionInclusionDecomposer(DnfDecomposer):
+    """
+    Decomposer that implements the inclusion-exclusion principle.
 
-    def __init__(self, deep_simplify=False):
-        Decomposer.__init__(self)
-        self._deep_simplify = deep_simplify
-        self._terms = None
+    The literals of the query are identified by their position when sorted by their string
+    representation, and each conjunction is represented by the bitmask of its literals,
+    so the conjunction of several terms is the bitwise or of their bitmasks.
+    """
+
+    ARG_NAME = 'inclusion-exclusion'
+    EMPTY = -1
+    MAX_MEMOIZED_QUERIES = 2 ** 18
+
+    def __init__(self, deep_simplify=False, prune_zeros=False, merge_subqueries=False,
+                 rules: Optional[QualifierRules] = None, max_depth: Optional[int] = None,
+                 dnf_converter: Optional[DnfConverter] = None, minimizer: Optional[EspressoMinimizer] = None):
+        DnfDecomposer.__init__(self, deep_simplify, rules, dnf_converter, minimizer)
+        self._prune_zeros = prune_zeros
+        self._merge_subqueries = merge_subqueries
+        self._max_depth = max_depth
+        self._depth = 0
+        self._literals: List[sympy.Basic] = []
+        self._term_masks: List[int] = []
+        self._mask_rules: Optional[MaskRules] = None
+        self._merged_subqueries: List[Tuple[int, int, int]] = []
+        self._subquery_keys: Dict[str, Tuple[Hashable, int, int]] = {}
+        self._zero_keys: Set[Hashable] = set()
+        self._pruned_subqueries = 0
+        self._depth_sums: Dict[int, int] = defaultdict(int)
+        # the depths with some subquery whose amount is not known, so their sums are not bounds
+        self._missing_depths: Set[int] = set()
+        self._max_first_depth_amount = 0
+        self._issued_per_depth: Dict[int, int] = defaultdict(int)
 
     def set_middle_code(self, middle_code: MiddleCode):
-        Decomposer.set_middle_code(self, middle_code)
-        self._convert_to_dnf()
-        if (isinstance(self._middle_code.exp, sympy.Symbol) or
-                isinstance(self._middle_code.exp, sympy.And)):
-            self._terms = (self._middle_code.exp,)
-        else:
-            self._terms = self._middle_code.exp.args
-        self._debug(f'Disjunctive normal form terms number', arg=len(self._terms))
-
-    def longest_subexpression(self) -> SympyLogicMiddleCode:
-        return SympyLogicMiddleCode(exp=simplify_logic(self._middle_code.exp.replace(sympy.Or, sympy.And)))
-
-    def _convert_to_dnf(self):
-        self._debug(f'Converting to DNF ...', header=self._middle_code.full_name)
-        exp = simplify_logic(self._middle_code.exp, form='dnf', force=self._deep_simplify)
-        self._middle_code.exp = to_dnf(exp)
-        self._debug(f'Converted to DNF', header=self._middle_code.full_name)
+        DnfDecomposer.set_middle_code(self, middle_code)
+        self._literals = sorted(frozenset().union(*self._terms), key=str)
+        literal_ids = {literal: i for i, literal in enumerate(self._literals)}
+        self._term_masks = [sum(1 << literal_ids[literal] for literal in term) for term in self._terms]
+        self._mask_rules = self._rules.get_mask_rules(self._literals) if self._rules else None
+        self._depth = min(self._max_depth, len(self._terms)) if self._max_depth else len(self._terms)
+        if self._is_truncated():
+            self._info('Inclusion-exclusion truncated at depth', self._depth, header=middle_code.full_name)
+        self._reset_sub_amounts()
+        if self._merge_subqueries:
+            self._merged_subqueries = self._get_merged_subqueries()
+            self._debug(f'Distinct subqueries number', arg=len(self._merged_subqueries))
+
+    def _reset_sub_amounts(self):
+        self._subquery_keys = {}
+        self._zero_keys = set()
+        self._pruned_subqueries = 0
+        self._depth_sums = defaultdict(int)
+        self._missing_depths = set()
+        self._max_first_depth_amount = 0
+        self._issued_per_depth = defaultdict(int)
+
+    def _is_truncated(self) -> bool:
+        return self._depth < len(self._terms)
+
+    def _get_mask_literals(self, mask: int) -> List[sympy.Basic]:
+        return [literal for i, literal in enumerate(self._literals) if mask >> i & 1]
+
+    def _simplify_mask(self, mask: int) -> int:
+        """
+        Returns EMPTY if the conjunction is provably empty (see `QualifierRules.simplify`). The rules are
+        precomputed over the literals of the query, and not applied at all if none applies to them.
+        """
+        if self._mask_rules is None:
+            return mask
+        simplified_mask = self._mask_rules.simplify(mask)
+        return self.EMPTY if simplified_mask is None else simplified_mask
+
+    def _get_merged_subqueries(self) -> List[Tuple[int, int, int]]:
+        """
+        Groups the terms combinations by the set of literals of their conjunction, adding up
+        their inclusion-exclusion coefficients. Each term t added to the combinations c
+        already considered gives the new combinations t and c | t, the last with the
+        opposite sign of c. The groups whose coefficients net to zero are discarded.
+
+        When the decomposition is truncated only the combinations of the same depth are
+        grouped. Otherwise the depth of every group is taken as 0.
+        """
+        truncated = self._is_truncated()
+        coefficients: Dict[Tuple[int, int], int] = {}
+        for term_mask in self._term_masks:
+            new_coefficients = defaultdict(int)
+            new_coefficients[term_mask, int(truncated)] += 1
+            for (mask, depth), coefficient in coefficients.items():
+                if not truncated:
+                    new_coefficients[mask | term_mask, 0] -= coefficient
+                elif depth < self._depth:
+                    new_coefficients[mask | term_mask, depth + 1] -= coefficient
+            for key, coefficient in new_coefficients.items():
+                coefficient += coefficients.get(key, 0)
+                if coefficient:
+                    coefficients[key] = coefficient
+                else:
+                    coefficients.pop(key, None)
+        if self._mask_rules is not None:
+            simplified_coefficients = defaultdict(int)
+            for (mask, depth), coefficient in coefficients.items():
+                simplified_mask = self._simplify_mask(mask)
+                if simplified_mask != self.EMPTY:
+                    simplified_coefficients[simplified_mask, depth] += coefficient
+            coefficients = {key: coefficient for key, coefficient in simplified_coefficients.items()
+                            if coefficient}
+        return sorted(((mask, depth, coefficient) for (mask, depth), coefficient in coefficients.items()),
+                      key=lambda e: bits_amount(e[0]))
 
     def get_subqueries(self) -> Iterable[MiddleCode]:
         """This method implements an inclusion-exclusion principle"""
+        for name, mask, sum_factor in self.get_subquery_masks():
+            yield SympyLogicMiddleCode(
+                namespace=self._middle_code.full_name,
+                name=name,
+                exp=sympy.And(*self._get_mask_literals(mask))
+            ), sum_factor
+
+    def get_translated_subqueries(self, translator: Translator) -> Iterable[Tuple[str, str, int]]:
+        return self._translate(translator, self.get_subquery_masks())
+
+    def get_translated_subqueries_range(self, translator: Translator,
+                                        begin: int, end: int) -> Iterable[Tuple[str, str, int]]:
+        return self._translate(translator, self._get_subquery_masks_range(begin, end))
+
+    def _translate(self, translator: Translator,
+                   subquery_masks: Iterable[Tuple[str, int, int]]) -> Iterable[Tuple[str, str, int]]:
+        """
+        Translates the literals only once. The particular query of a conjunction is then
+        built from the translations of the bits set in its bitmask, looked up one byte at a time.
+        The seconds enumerating and translating are added up locally and recorded when the
+        subqueries are exhausted or abandoned, so the metrics lock is not taken for each one.
+        """
+        enumeration_seconds = translation_seconds = 0.
+        subqueries = 0
+        start = time.perf_counter()
+        literal_queries = [translator.get_literal_query(literal) for literal in self._literals]
+        byte_tables = [[tuple(literal_queries[first + i] for i in range(8)
+                              if byte >> i & 1 and first + i < len(literal_queries))
+                        for byte in range(256)]
+                       for first in range(0, len(literal_queries), 8)]
+        queries: Dict[int, str] = {}
+        subquery_masks = iter(subquery_masks)
+        try:
+            while True:
+                enumeration_start = time.perf_counter()
+                translation_seconds += enumeration_start - start
+                try:
+                    name, mask, sum_factor = next(subquery_masks)
+                except StopIteration:
+                    break
+                start = time.perf_counter()
+                enumeration_seconds += start - enumeration_start
+                subqueries += 1
+                query = queries.get(mask)
+                if query is None:
+                    parts = []
+                    bits = mask
+                    for byte_table in byte_tables:
+                        parts.extend(byte_table[bits & 255])
+                        bits >>= 8
+                    query = translator.join_literal_queries(parts)
+                    if len(queries) >= self.MAX_MEMOIZED_QUERIES:
+                        queries = {}
+                    queries[mask] = query
+                if self._satisfies_query_restrictions and not self._satisfies_query_restrictions(query):
+                    restricted_subqueries = list(self._get_restricted_subqueries(translator, name, query,
+                                                                                 self._get_mask_literals(mask),
+                                                                                 sum_factor))
+                    translation_seconds += time.perf_counter() - start
+                    yield from restricted_subqueries
+                else:
+                    translation_seconds += time.perf_counter() - start
+                    yield name, query, sum_factor
+                start = time.perf_counter()
+        finally:
+            METRICS.increment('enumeration_seconds_total', enumeration_seconds)
+            METRICS.increment('translation_seconds_total', translation_seconds)
+            METRICS.increment('subqueries_total', subqueries)
+
+    def get_subquery_masks(self) -> Iterable[Tuple[str, int, int]]:
+        """Triples (name, bitmask of the literals, sum factor) of the subqueries, before translating them"""
+        if self._merge_subqueries:
+            return self._get_merged_subquery_masks()
+        if self._prune_zeros:
+            return self._get_pruned_subquery_masks()
+        return self._get_all_subquery_masks()
+
+    def _get_all_subquery_masks(self) -> Iterable[Tuple[str, int, int]]:
+        """
+        Traverses the combinations of terms in depth-first order, so the bitmask of each
+        combination is obtained from the one of its prefix with a single bitwise or.
+        """
+        term_masks = self._term_masks
+        n = len(term_masks)
+        i = 0
+        stack = [(j, term_masks[j], 1) for j in reversed(range(n))]
+        while stack:
+            last, mask, depth = stack.pop()
+            if depth < self._depth:
+                stack.extend((k, mask | term_masks[k], depth + 1) for k in range(n - 1, last, -1))
+            i += 1
+            mask = self._simplify_mask(mask)
+            if mask == self.EMPTY:
+                self._pruned_subqueries += 1
+                continue
+            sum_factor = 1 if depth & 1 else -1
+            name = str(i)
+            self._subquery_keys[name] = (None, depth, sum_factor)
+            yield name, mask, sum_factor
+
+    def depends_on_sub_amounts(self) -> bool:
+        return self._prune_zeros
+
+    def get_ranked_sub_queries_amount(self) -> int:
+        """The subqueries can not be addressed by rank when pruning, as they depend on the previous amounts"""
+        if self._prune_zeros:
+            return 0
+        return self.get_sub_queries_amount()
+
+    def _get_subquery_masks_range(self, begin: int, end: int) -> Iterable[Tuple[str, int, int]]:
+        """
+        The merged subqueries are ranked by their position. Otherwise, the combinations of terms
+        are ranked by their amount of terms first and then in lexicographic order, so the first
+        combination of a range is found by unranking it in the combinatorial number system and
+        the rest are its successors.
+        """
+        if self._merge_subqueries:
+            for rank in range(begin, min(end, len(self._merged_subqueries))):
+                mask, depth, coefficient = self._merged_subqueries[rank]
+                name = str(rank + 1)
+                self._subquery_keys[name] = (mask, depth, coefficient)
+                yield name, mask, coefficient
+            return
+        n = len(self._term_masks)
+        rank = begin
+        p = 1
+        while p <= self._depth and rank >= combination_amount(n, p):
+            rank -= combination_amount(n, p)
+            p += 1
+        if p > self._depth:
+            return
+        comb = self._unrank(rank, n, p)
+        for rank in range(begin, end):
+            mask = 0
+            for j in comb:
+                mask |= self._term_masks[j]
+            mask = self._simplify_mask(mask)
+            if mask == self.EMPTY:
+                self._pruned_subqueries += 1
+            else:
+                sum_factor = 1 if p & 1 else -1
+                name = str(rank + 1)
+                self._subquery_keys[name] = (None, p, sum_factor)
+                yield name, mask, sum_factor
+            if not self._next_combination(comb, n):
+                p += 1
+                if p > self._depth:
+                    return
+                comb = list(range(p))
+
+    @staticmethod
+    def _unrank(rank: int, n: int, p: int) -> List[int]:
+        """The combination of p out of n with the given lexicographic rank"""
+        comb = []
+        x = 0
+        for i in range(p):
+            while True:
+                amount = combination_amount(n - x - 1, p - i - 1)
+                if rank < amount:
+                    break
+                rank -= amount
+                x += 1
+            comb.append(x)
+            x += 1
+        return comb
+
+    @staticmethod
+    def _next_combination(comb: List[int], n: int) -> bool:
+        """Turns the combination into its lexicographic successor. False if it was the last one"""
+        p = len(comb)
+        i = p - 1
+        while i >= 0 and comb[i] == n - p + i:
+            i -= 1
+        if i < 0:
+            return False
+        comb[i] += 1
+        for k in range(i + 1, p):
+            comb[k] = comb[k - 1] + 1
+        return True
+
+    def _get_merged_subquery_masks(self) -> Iterable[Tuple[str, int, int]]:
+        """
+        The merged subqueries are sorted by their amount of literals, so when pruning
+        a subquery reported as zero is always given before its supersets.
+        """
+        i = 0
+        for mask, depth, coefficient in self._merged_subqueries:
+            if self._prune_zeros and any(zero & mask == zero for zero in self._zero_keys):
+                self._pruned_subqueries += 1
+                continue
+            i += 1
+            name = str(i)
+            self._subquery_keys[name] = (mask, depth, coefficient)
+            yield name, mask, coefficient
+
+    def _get_pruned_subquery_masks(self) -> Iterable[Tuple[str, int, int]]:
+        """
+        Enumerates the lattice of terms combinations level by level. The amount of a
+        combination is bounded by the amount of any of its sub-combinations, so a
+        combination of level p is only generated if all its sub-combinations of level
+        p - 1 have not been reported as zero (see `set_sub_amount`).
+        """
         sum_factor = 1
         i = 0
-        for p in range(1, len(self._terms) + 1):
-            for comb in combinations(self._terms, p):
+        level = [((j,), term_mask) for j, term_mask in enumerate(self._term_masks)]
+        for p in range(1, self._depth + 1):
+            for comb, mask in level:
                 i += 1
-                yield SympyLogicMiddleCode(
-                    namespace=self._middle_code.full_name,
-                    name=str(i),
-                    exp=sympy.And(*comb)
-                ), sum_factor
+                mask = self._simplify_mask(mask)
+                if mask == self.EMPTY:
+                    self._pruned_subqueries += 1
+                    self._zero_keys.add(comb)
+                    continue
+                name = str(i)
+                self._subquery_keys[name] = (comb, p, sum_factor)
+                yield name, mask, sum_factor
+            alive = [(comb, mask) for comb, mask in level if comb not in self._zero_keys]
+            self._zero_keys = set()
+            if p < self._depth:
+                level = self._get_next_level(alive)
+                self._pruned_subqueries += combination_amount(len(self._terms), p + 1) - len(level)
             sum_factor *= -1
 
+    def _get_next_level(self, alive: List[Tuple[Tuple[int, ...], int]]) -> List[Tuple[Tuple[int, ...], int]]:
+        """
+        Joins the lexicographically sorted combinations of the same level that share all
+        but their last term, and keeps only the candidates whose sub-combinations are all alive.
+        """
+        alive_set = {comb for comb, _ in alive}
+        next_level = []
+        begin = 0
+        while begin < len(alive):
+            end = begin + 1
+            while end < len(alive) and alive[end][0][:-1] == alive[begin][0][:-1]:
+                end += 1
+            for a in range(begin, end):
+                comb, mask = alive[a]
+                for b in range(a + 1, end):
+                    last = alive[b][0][-1]
+                    candidate = comb + (last,)
+                    if all(candidate[:k] + candidate[k + 1:] in alive_set
+                           for k in range(len(candidate) - 2)):
+                        next_level.append((candidate, mask | self._term_masks[last]))
+            begin = end
+        return next_level
+
+    def _set_expanded_subqueries(self, name: str, subqueries: Sequence[Tuple[str, str, int]]):
+        """The expanded subqueries are not recorded as zeros, as they are not the combination itself"""
+        _, depth, _ = self._subquery_keys.pop(name, (None, 0, 0))
+        for subquery_name, _, sum_factor in subqueries:
+            self._subquery_keys[subquery_name] = (None, depth, sum_factor)
+
+    def set_sub_amount(self, name: str, amount: Optional[int], issued: bool):
+        key, depth, sum_factor = self._subquery_keys.pop(name, (None, 0, 0))
+        if issued:
+            self._issued_per_depth[depth] += 1
+        if amount is None:
+            self._missing_depths.add(depth)
+            return
+        if self._prune_zeros and amount == 0 and key is not None:
+            self._zero_keys.add(key)
+        self._depth_sums[depth] += sum_factor * amount
+        if depth == 1:
+            self._max_first_depth_amount = max(self._max_first_depth_amount, amount)
+
+    def pop_sub_amounts_state(self) -> Any:
+        state = (self._subquery_keys, self._pruned_subqueries, self._depth_sums, self._missing_depths,
+                 self._max_first_depth_amount, self._issued_per_depth, self._expansion_subqueries)
+        self._reset_sub_amounts()
+        self._expansion_subqueries = 0
+        return state
+
+    def merge_sub_amounts_state(self, state: Any):
+        (subquery_keys, pruned_subqueries, depth_sums, missing_depths,
+         max_first_depth_amount, issued_per_depth, expansion_subqueries) = state
+        self._expansion_subqueries += expansion_subqueries
+        self._subquery_keys.update(subquery_keys)
+        self._pruned_subqueries += pruned_subqueries
+        for depth, depth_sum in depth_sums.items():
+            self._depth_sums[depth] += depth_sum
+        self._missing_depths.update(missing_depths)
+        self._max_first_depth_amount = max(self._max_first_depth_amount, max_first_depth_amount)
+        for depth, amount in issued_per_depth.items():
+            self._issued_per_depth[depth] += amount
+
+    def get_pruned_sub_queries_amount(self) -> int:
+        return self._pruned_subqueries
+
+    def get_truncated_sub_queries_amount(self) -> int:
+        if not self._is_truncated():
+            return 0
+        return 2 ** len(self._terms) - 1 - self._get_combinations_amount()
+
+    def get_bounds(self) -> Optional[Tuple[int, int]]:
+        """
+        By the Bonferroni inequalities, the partial sums of the inclusion-exclusion principle
+        up to an odd depth are upper bounds of the results amount, and the ones up to an even
+        depth are lower bounds. The results amount is also bounded below by the amount of
+        any single term.
+        """
+        if not self._is_truncated():
+            return None
+        return self.get_partial_bounds(self._depth)
+
+    def get_depths_end_ranks(self) -> List[int]:
+        """The merged subqueries are not ranked by depth, and the pruned ones are not ranked"""
+        if self._merge_subqueries or self._prune_zeros:
+            return []
+        end_ranks = []
+        end_rank = 0
+        for depth in range(1, self._depth + 1):
+            end_rank += combination_amount(len(self._terms), depth)
+            end_ranks.append(end_rank)
+        return end_ranks
+
+    def get_partial_bounds(self, depth: int) -> Optional[Tuple[int, Optional[int]]]:
+        """
+        The partial sum up to the depth of all the terms is the exact results amount (see `get_bounds`).
+        There are no bounds if the amount of some subquery up to the depth is not known.
+        """
+        if any(k <= depth for k in self._missing_depths):
+            return None
+        lower_bound = self._max_first_depth_amount
+        upper_bound = None
+        partial_sum = 0
+        for k in range(1, depth + 1):
+            partial_sum += self._depth_sums[k]
+            if k % 2:
+                upper_bound = partial_sum if upper_bound is None else min(upper_bound, partial_sum)
+            else:
+                lower_bound = max(lower_bound, partial_sum)
+        if depth == len(self._terms):
+            return partial_sum, partial_sum
+        return lower_bound, upper_bound
+
+    def get_issued_sub_queries_per_depth(self) -> Dict[int, int]:
+        return {depth: amount for depth, amount in sorted(self._issued_per_depth.items()) if depth}
+
+    def _get_combinations_amount(self) -> int:
+        return sum(combination_amount(len(self._terms), p) for p in range(1, self._depth + 1))
+
     def get_sub_queries_amount(self) -> int:
-        return 2 ** len(self._terms) - 1
+        if self._merge_subqueries:
+            return len(self._merged_subqueries)
+        return self._get_combinations_amount()
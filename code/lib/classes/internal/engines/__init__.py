@@ -1,7 +1,11 @@
 from lib.classes.internal.engines.github_v3_engine import GithubV3Engine
+from lib.classes.internal.engines.github_v4_engine import GithubV4Engine
+from lib.classes.internal.engines.local_index_engine import LocalIndexEngine
 
 ENGINE_TYPE = {
     GithubV3Engine.ARG_NAME: GithubV3Engine,
+    GithubV4Engine.ARG_NAME: GithubV4Engine,
+    LocalIndexEngine.ARG_NAME: LocalIndexEngine,
 }
 
 DEFAULT_ENGINE_TYPE = GithubV3Engine.ARG_NAME
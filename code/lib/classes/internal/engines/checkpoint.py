@@ -0,0 +1,63 @@
+import hashlib
+import os
+import pickle
+import time
+from typing import Dict, Optional, Tuple
+
+from lib.classes.internal.engines.progress import Progress
+from lib.classes.internal.middle_codes.middle_code import MiddleCode
+from lib.utilities.functions import write_atomically
+from lib.utilities.logging import ExitCode
+from lib.utilities.logging.with_logging import WithLogging
+
+
+class Checkpoint(WithLogging):
+    """
+    File with the progress of the queries evaluated, keyed by a fingerprint of each query and its
+    decomposition, so a run killed at any moment can be resumed by the same command line.
+
+    The whole file is rewritten atomically on each save (see `write_atomically`), so the file is always
+    either the previous checkpoint or the new one.
+    """
+
+    DEFAULT_INTERVAL = 60
+    FINGERPRINT_VERSION = '4'
+
+    def __init__(self, filename: str, interval: float = DEFAULT_INTERVAL):
+        WithLogging.__init__(self)
+        self._filename = os.path.abspath(filename)
+        self._interval = interval
+        self._next_save = time.monotonic() + interval
+        self._progresses: Dict[str, Progress] = {}
+        if os.path.exists(self._filename):
+            try:
+                with open(self._filename, 'rb') as file:
+                    self._progresses = pickle.load(file)
+            except (IOError, pickle.UnpicklingError, EOFError) as e:
+                self._critical('Error while loading checkpoint', ExitCode.FILE_ERROR, e)
+            self._debug('Checkpoint loaded. Queries amount', len(self._progresses))
+
+    @classmethod
+    def get_fingerprint(cls, middle_code: MiddleCode, endpoint: Tuple[str, ...], *decomposition) -> str:
+        """
+        Hash of the query, the endpoint where its subqueries are issued (see `Engine.get_endpoint`)
+        and the given description of its decomposition
+        """
+        parts = ((cls.FINGERPRINT_VERSION, middle_code.full_name, middle_code.original_query) + tuple(endpoint)
+                 + decomposition)
+        return hashlib.sha256(':'.join(map(str, parts)).encode()).hexdigest()
+
+    def get(self, fingerprint: str) -> Optional[Progress]:
+        return self._progresses.get(fingerprint)
+
+    def is_due(self) -> bool:
+        return time.monotonic() >= self._next_save
+
+    def save(self, fingerprint: str, progress: Progress):
+        self._progresses[fingerprint] = progress
+        try:
+            write_atomically(self._filename, pickle.dumps(self._progresses))
+        except IOError as e:
+            self._critical('Error while saving checkpoint', ExitCode.FILE_ERROR, e)
+        self._next_save = time.monotonic() + self._interval
+        self._debug('Checkpoint saved. Position', progress.position)
@@ -1,26 +1,60 @@
-import random
+import itertools
+import multiprocessing
+import time
+from collections import defaultdict
 from abc import ABC
-from datetime import datetime
-from typing import Tuple, Sequence
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+from typing import Tuple, Sequence, Optional, Dict, Iterable, List, Mapping, Callable
 
 from lib.classes import WithLoggingAndExternalArguments
 from lib.classes.internal.caches import CACHE_TYPE, INPUT_CACHE_TYPE
+from lib.classes.internal.engines.checkpoint import Checkpoint
+from lib.classes.internal.engines.progress import Progress
 from lib.classes.internal.middle_codes.middle_code import MiddleCode
 from lib.utilities.functions import get_component
+from lib.utilities.metrics import METRICS
 from lib.utilities.with_external_arguments import CustomArgumentParser
 
+# Only set in the processes forked to evaluate shards (see `Engine._get_cached_results`): the engine
+# whose subqueries are evaluated and the cache reader of the process
+_sharding_state: Optional[Tuple['Engine', Mapping]] = None
+
+
+def _init_sharding_process(engine: 'Engine'):
+    """The engine is not pickled, as the processes are forked"""
+    global _sharding_state
+    # noinspection PyProtectedMember
+    _sharding_state = engine, engine._cache.get_reader()
+
+
+def _evaluate_shard(begin: int, end: int) -> Tuple[int, int, List[Tuple[str, str, int]], object]:
+    engine, cache = _sharding_state
+    # noinspection PyProtectedMember
+    return engine._evaluate_shard(cache, begin, end)
+
 
 class Engine(WithLoggingAndExternalArguments, ABC):
+    SHARDING_MIN_SUBQUERIES = 2 ** 12
+    SHARDS_PER_WORKER = 4
+    PLAN_NAME = 'plan'
+    CHECKPOINT_RANKS = 2 ** 10
+    PROGRESS_INTERVAL = 60
 
     def __init__(self, args_sequence: Sequence[str],
                  cache_options: Sequence[str],
                  input_caches_options: Sequence[str],
                  simulate: bool,
-                 main_args_parser: CustomArgumentParser):
+                 main_args_parser: CustomArgumentParser,
+                 progressive: bool = False,
+                 deadline: Optional[float] = None,
+                 max_requests: Optional[int] = None):
         WithLoggingAndExternalArguments.__init__(self, args_sequence)
         self._simulate = simulate
         self._simulation_cache = set()
         self._decomposer = None
+        self._main_decomposer = None
+        self._fallback_decomposer = None
         self._translator = None
         self._query_issuer = None
         self._cache_options = cache_options
@@ -28,11 +62,30 @@ class Engine(WithLoggingAndExternalArguments, ABC):
         self._cache = None
         self._main_args_parser = main_args_parser
         self._set_cache()
+        self._checkpoint = None
+        # noinspection PyUnresolvedReferences
+        if self.checkpoint is not None and not simulate:
+            # noinspection PyUnresolvedReferences
+            self._checkpoint = Checkpoint(self.checkpoint, self.checkpoint_interval)
+        self._progressive = progressive or deadline is not None or max_requests is not None
+        self._deadline = time.monotonic() + deadline if deadline is not None else None
+        self._max_requests = max_requests
+        self._issued_subqueries = 0
+        self._progress: Optional[Progress] = None
+        self._on_progress: Optional[Callable[[MiddleCode, Tuple], None]] = None
+        self._depths_end_ranks: List[int] = []
+        self._next_progress_report = 0.
+        self._given_subqueries_position = 0
+        self._given_subqueries = 0
         if simulate:
             self._get_amount = self._run_simulation
 
     def _init_arguments(self):
         self._args_parser.add_argument('**reset-cache', action='store_true')
+        self._args_parser.add_argument('**workers', type=int, default=1)
+        self._args_parser.add_argument('**concurrency', type=int, default=1)
+        self._args_parser.add_argument('**checkpoint', metavar='FILENAME')
+        self._args_parser.add_argument('**checkpoint-interval', type=float, default=Checkpoint.DEFAULT_INTERVAL)
 
     def _set_cache(self):
         self._cache = get_component(self._cache_options, CACHE_TYPE, 'cache',
@@ -47,118 +100,652 @@ class Engine(WithLoggingAndExternalArguments, ABC):
         self._simulation_cache = set()
         self._set_cache()
 
-    def get_total_amount(self, middle_code: MiddleCode) -> Tuple[int, int, int,
-                                                                 int, int, int,
-                                                                 datetime, datetime,
-                                                                 datetime, datetime,
-                                                                 datetime, datetime,
-                                                                 str]:
-        random.seed()
+    def plan(self, middle_codes: Sequence[MiddleCode]) -> Optional[Tuple[int, int, int, int, int, int,
+                                                                         str, str]]:
+        """
+        Decomposes all the given middle codes, and issues once each distinct subquery that is not cached
+        and satisfies the query restrictions, the ones referenced more times first. So the results amounts
+        of the middle codes are then given by `get_total_amount` from the cache. The middle codes whose
+        subqueries depend on the previous amounts are not planned. It gives the amounts of planned middle
+        codes, subqueries references, distinct subqueries, shared subqueries, subqueries already cached
+        and subqueries to be issued, and the estimated time to issue them.
+
+        The subqueries are not kept, as they may not fit in memory and enumerating them sets the state
+        of the decomposer, so `get_total_amount` decomposes and translates each middle code again.
+        """
+        # noinspection PyUnresolvedReferences
+        if self.reset_cache:
+            self._warning('The cache is reset for each query. Queries will not be planned')
+            return None
+        self._debug('Planning ...')
+        planned_middle_codes = 0
+        references: Dict[str, int] = defaultdict(int)
+        for middle_code in middle_codes:
+            self._set_decomposer(middle_code)
+            if self._decomposer.depends_on_sub_amounts():
+                self._info('Subqueries depend on the previous amounts. Query not planned',
+                           header=middle_code.full_name)
+                continue
+            planned_middle_codes += 1
+            for _, subquery, _ in self._decomposer.get_translated_subqueries(self._translator):
+                references[subquery] += 1
+        cached_subqueries = 0
+        to_issue_subqueries = []
+        for subquery, amount in references.items():
+            if subquery in self._cache or subquery in self._simulation_cache:
+                cached_subqueries += 1
+            elif self._query_issuer.satisfies_query_restrictions(subquery):
+                to_issue_subqueries.append(subquery)
+        to_issue_subqueries.sort(key=lambda q: references[q], reverse=True)
+        shared_subqueries = sum(amount > 1 for amount in references.values())
+        # noinspection PyUnresolvedReferences
+        estimated_time_min, estimated_time_max = self._query_issuer.get_estimated_time(len(to_issue_subqueries),
+                                                                                       self.concurrency)
+        self._info('Planned queries', planned_middle_codes)
+        self._info('Subqueries references', sum(references.values()))
+        self._info('Distinct subqueries', len(references))
+        self._info('Shared subqueries', shared_subqueries)
+        self._info('Subqueries to be issued', len(to_issue_subqueries))
+        self._info('Estimated time', f'from {estimated_time_min} to {estimated_time_max}')
+        if not self._simulate:
+            self._issue_planned(to_issue_subqueries)
+        return (planned_middle_codes, sum(references.values()), len(references), shared_subqueries,
+                cached_subqueries, len(to_issue_subqueries), estimated_time_min, estimated_time_max)
+
+    def get_capacity_estimated_times(self, subqueries_total: int, to_issue_subqueries: int,
+                                     scenarios: Iterable[Tuple[int, int, Optional[float]]]
+                                     ) -> List[Tuple[int, int, float, str, str]]:
+        """
+        Gives the estimated time to evaluate the subqueries for each scenario of amount of credentials,
+        concurrency and cache hit ratio. If the ratio of a scenario is not given, the one of the cache
+        in use is taken, by the subqueries to be issued out of the total.
+        """
+        capacity = []
+        for tokens, concurrency, cache_hit_ratio in scenarios:
+            if cache_hit_ratio is None:
+                cache_hit_ratio = 1 - to_issue_subqueries / subqueries_total if subqueries_total else 0
+            capacity.append((tokens, concurrency, cache_hit_ratio,
+                             *self._query_issuer.get_capacity_estimated_time(subqueries_total, tokens, concurrency,
+                                                                             cache_hit_ratio)))
+        return capacity
+
+    def _issue_planned(self, subqueries: Sequence[str]):
+        """Issues the subqueries keeping up to `**concurrency` of them in flight, and caches their amounts"""
+        # noinspection PyUnresolvedReferences
+        concurrency = max(self.concurrency, 1)
+        in_flight: Dict[Future, Tuple[str, str]] = {}
+
+        def cache_amounts(futures: Iterable[Future]):
+            for future in futures:
+                header, subquery = in_flight.pop(future)
+                no_error, sub_amount = future.result()
+                if no_error:
+                    self._cache.set_amount(subquery, sub_amount)
+                    self._debug('Results amount cached', header=header)
+                    self._debug('Results amount', sub_amount, header=header)
+                else:
+                    METRICS.increment('request_errors_total')
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            for i, subquery in enumerate(subqueries, 1):
+                header = f'{self.PLAN_NAME}.{i}'
+                if self._is_stopped():
+                    self._warning('Evaluation stopped', header=self.PLAN_NAME)
+                    break
+                self._debug(f'{i} of {len(subqueries)}', header=header, arg=subquery)
+                self._count_issued_subquery()
+                if len(in_flight) >= concurrency:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    cache_amounts(done)
+                in_flight[executor.submit(self._query_issuer.issue, header, subquery)] = header, subquery
+            cache_amounts(wait(in_flight).done)
+
+    def get_total_amount(self, middle_code: MiddleCode,
+                         on_progress: Optional[Callable[[MiddleCode, Tuple], None]] = None
+                         ) -> Tuple[int, int, int,
+                                    int, int, int,
+                                    datetime, datetime,
+                                    datetime, datetime,
+                                    datetime, datetime,
+                                    str, int, int,
+                                    Optional[int], Optional[int],
+                                    Dict[int, int], int]:
+        """
+        In progressive mode, the interim results amounts (see `_report_progress`) are given to
+        `on_progress` as they are known.
+        """
+        self._on_progress = on_progress
+        self._progress = None
         # noinspection PyUnresolvedReferences
         if self.reset_cache:
             self._reset_cache()
-        self._decomposer.set_middle_code(middle_code)
+        self._set_decomposer(middle_code)
         self._debug('Getting results amount ...', header=middle_code.full_name)
         longest_subquery = self._translator.get_particular_query(self._decomposer.longest_subexpression())
         self._debug('Longest subquery', longest_subquery, header=middle_code.full_name)
         longest_subquery_length = len(longest_subquery)
         self._debug('Longest subquery length', longest_subquery_length, header=middle_code.full_name)
-        if not self._query_issuer.check_query_restrictions(longest_subquery, middle_code.full_name):
+        if not all([self._query_issuer.check_query_restrictions(subquery, middle_code.full_name)
+                    for subquery in self._decomposer.get_translated_longest_subqueries(self._translator)]):
             self._debug('Subqueries that exceeds the maximum allowed length, will be discarded',
                         header=middle_code.full_name)
         self._debug('Getting total amount of subqueries ...', header=middle_code.full_name)
         subqueries_total = self._decomposer.get_sub_queries_amount()
         self._info('Subqueries amount', subqueries_total, header=middle_code.full_name)
 
-        estimated_time_min, estimated_time_max = self._query_issuer.get_estimated_time(subqueries_total)
+        # noinspection PyUnresolvedReferences
+        estimated_time_min, estimated_time_max = self._query_issuer.get_estimated_time(subqueries_total,
+                                                                                       self.concurrency)
         self._info('Estimated time without caching',
                    f'from {estimated_time_min} to {estimated_time_max}',
                    header=middle_code.full_name)
 
-        (issued_subqueries, without_error_subqueries,
-         with_error_to_be_added, with_error_to_be_subtracted,
-         results, begin_run_datetime, end_run_datetime) = self._get_amount(subqueries_total,
-                                                                           middle_code)
+        METRICS.increment('queries_total')
+        issued_subqueries_before = self._issued_subqueries
+        start = time.monotonic()
+        with METRICS.time('query_seconds'):
+            (issued_subqueries, without_error_subqueries,
+             with_error_to_be_added, with_error_to_be_subtracted,
+             results, begin_run_datetime, end_run_datetime) = self._get_amount(subqueries_total,
+                                                                               middle_code)
+        if not self._simulate:
+            # noinspection PyUnresolvedReferences
+            self._query_issuer.add_run(self._issued_subqueries - issued_subqueries_before, time.monotonic() - start,
+                                       self.concurrency)
 
+        # noinspection PyUnresolvedReferences
         (estimated_time_caching_min,
-         estimated_time_caching_max) = self._query_issuer.get_estimated_time(issued_subqueries)
+         estimated_time_caching_max) = self._query_issuer.get_estimated_time(issued_subqueries, self.concurrency)
+
+        expansion_subqueries = self._decomposer.get_expansion_sub_queries_amount()
+        if expansion_subqueries:
+            self._info('Subqueries added by negations expansion', expansion_subqueries,
+                       header=middle_code.full_name)
+            subqueries_total += expansion_subqueries
+
+        pruned_subqueries = self._decomposer.get_pruned_sub_queries_amount()
+        if pruned_subqueries:
+            self._info('Pruned subqueries', pruned_subqueries, header=middle_code.full_name)
+
+        truncated_subqueries = self._decomposer.get_truncated_sub_queries_amount()
+        lower_bound, upper_bound = self._decomposer.get_bounds() or (None, None)
+        if truncated_subqueries:
+            self._info('Subqueries saved by truncation', truncated_subqueries, header=middle_code.full_name)
+            self._info('Results amount bounds', f'from {lower_bound} to {upper_bound}',
+                       header=middle_code.full_name)
+
+        not_evaluated_subqueries = 0
+        if self._progress is not None and self._progress.stopped:
+            not_evaluated_subqueries = max(subqueries_total - self._progress.evaluated_subqueries -
+                                           pruned_subqueries, 0)
+            lower_bound, upper_bound = (self._decomposer.get_partial_bounds(self._progress.completed_depth) or
+                                        (None, None))
+            self._info('Subqueries not evaluated', not_evaluated_subqueries, header=middle_code.full_name)
+            self._info('Results amount bounds', f'from {lower_bound} to {upper_bound}',
+                       header=middle_code.full_name)
+
+        return self._get_results(results, subqueries_total, issued_subqueries, without_error_subqueries,
+                                 estimated_time_min, estimated_time_max,
+                                 estimated_time_caching_min, estimated_time_caching_max,
+                                 begin_run_datetime, end_run_datetime, longest_subquery,
+                                 with_error_to_be_added=with_error_to_be_added,
+                                 with_error_to_be_subtracted=with_error_to_be_subtracted,
+                                 pruned_subqueries=pruned_subqueries, truncated_subqueries=truncated_subqueries,
+                                 lower_bound=lower_bound, upper_bound=upper_bound,
+                                 issued_per_depth=self._decomposer.get_issued_sub_queries_per_depth(),
+                                 not_evaluated_subqueries=not_evaluated_subqueries)
 
+    @staticmethod
+    def _get_results(results: int, subqueries_total: int, issued_subqueries: int, without_error_subqueries: int,
+                     estimated_time_min: str, estimated_time_max: str,
+                     estimated_time_caching_min: str, estimated_time_caching_max: str,
+                     begin_run_datetime: datetime, end_run_datetime: datetime, longest_subquery: str,
+                     with_error_to_be_added: int = 0, with_error_to_be_subtracted: int = 0,
+                     pruned_subqueries: int = 0, truncated_subqueries: int = 0,
+                     lower_bound: Optional[int] = None, upper_bound: Optional[int] = None,
+                     issued_per_depth: Optional[Dict[int, int]] = None,
+                     not_evaluated_subqueries: int = 0) -> Tuple:
+        """The results of a query in the order that `get_total_amount` gives them to the outputs"""
         return (results, subqueries_total,
                 issued_subqueries, without_error_subqueries,
                 with_error_to_be_added, with_error_to_be_subtracted,
                 estimated_time_min, estimated_time_max,
                 estimated_time_caching_min, estimated_time_caching_max,
-                begin_run_datetime, end_run_datetime, longest_subquery)
+                begin_run_datetime, end_run_datetime, longest_subquery,
+                pruned_subqueries, truncated_subqueries, lower_bound, upper_bound,
+                issued_per_depth or {}, not_evaluated_subqueries)
+
+    def get_endpoint(self) -> Tuple[str, ...]:
+        """Identifies where the subqueries are issued, so the amounts of different endpoints are not mixed"""
+        return self.ARG_NAME,
+
+    def close(self):
+        """Called once all the queries are evaluated, to save what is kept between runs"""
+        if self._query_issuer is not None:
+            self._query_issuer.close()
+        self._cache.close()
+
+    def _set_decomposer(self, middle_code: MiddleCode):
+        """
+        Sets the decomposer to be used with the given middle code, where the subexpressions that the server
+        evaluates by itself are pushed down by the translator, as long as the longest subqueries still
+        satisfy the query restrictions. If some of the subqueries given by the main decomposer do not satisfy
+        them, the fallback decomposer, if any, is used instead.
+        """
+        pushed_down = self._translator.push_down(middle_code, self._query_issuer.satisfies_query_restrictions)
+        if pushed_down is not middle_code:
+            self._set_decomposer_for(pushed_down)
+            if all(self._query_issuer.satisfies_query_restrictions(subquery)
+                   for subquery in self._decomposer.get_translated_longest_subqueries(self._translator)):
+                self._info('Subexpressions pushed down to the server', pushed_down.exp, header=middle_code.full_name)
+                return
+            self._debug('The subqueries with the subexpressions pushed down do not satisfy the query restrictions',
+                        header=middle_code.full_name)
+        self._set_decomposer_for(middle_code)
+
+    def _set_decomposer_for(self, middle_code: MiddleCode):
+        """The subqueries of the main decomposer are only probed up to the first one that is not satisfied"""
+        self._decomposer = self._main_decomposer
+        self._decomposer.set_query_restrictions(self._query_issuer.satisfies_query_restrictions)
+        self._decomposer.set_middle_code(middle_code)
+        if self._fallback_decomposer is not None:
+            for _, subquery, _ in self._decomposer.get_translated_subqueries(self._translator):
+                if not self._query_issuer.satisfies_query_restrictions(subquery):
+                    self._info('Some subqueries do not satisfy the query restrictions. Using fallback decomposer',
+                               header=middle_code.full_name)
+                    self._decomposer = self._fallback_decomposer
+                    self._decomposer.set_query_restrictions(self._query_issuer.satisfies_query_restrictions)
+                    self._decomposer.set_middle_code(middle_code)
+                    break
+            else:
+                # the subqueries are enumerated again by the evaluation, so the amounts counted while
+                # enumerating them, as the subqueries added by negations expansion, are counted from scratch
+                self._decomposer.reset_sub_amounts()
+
+    def _get_cached_results(self, middle_code: MiddleCode) -> Tuple[int, Iterable[Tuple[str, str, int]]]:
+        """
+        Adds up the results amounts of the subqueries already cached, and gives the rest of the
+        subqueries. If the subqueries can be addressed by rank and there are enough of them, they are
+        split into contiguous shards that are translated and looked up in the cache by a pool of
+        forked processes. Otherwise, all the subqueries are given to be processed in sequence.
+        """
+        # noinspection PyUnresolvedReferences
+        workers = self.workers
+        ranked_subqueries = self._decomposer.get_ranked_sub_queries_amount()
+        if (workers <= 1 or ranked_subqueries < self.SHARDING_MIN_SUBQUERIES or
+                'fork' not in multiprocessing.get_all_start_methods()):
+            return 0, self._decomposer.get_translated_subqueries(self._translator)
+        self._debug('Evaluating shards ...', header=middle_code.full_name)
+        shards_amount = workers * self.SHARDS_PER_WORKER
+        bounds = [ranked_subqueries * i // shards_amount for i in range(shards_amount + 1)]
+        results = 0
+        cached_subqueries = 0
+        pending_subqueries = []
+        with self._cache.shared_with_readers(), \
+                ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'),
+                                    initializer=_init_sharding_process, initargs=(self,)) as executor:
+            for (shard_results, shard_cached_subqueries,
+                 shard_pending_subqueries, state) in executor.map(_evaluate_shard, bounds[:-1], bounds[1:]):
+                results += shard_results
+                cached_subqueries += shard_cached_subqueries
+                pending_subqueries.extend(shard_pending_subqueries)
+                self._decomposer.merge_sub_amounts_state(state)
+        # the subqueries pending are looked up again, so only the hits of the forked processes are lost
+        METRICS.increment('cache_hits_total', cached_subqueries)
+        self._info('Subqueries already cached', cached_subqueries, header=middle_code.full_name)
+        return results, pending_subqueries
+
+    def _evaluate_shard(self, cache: Mapping, begin: int,
+                        end: int) -> Tuple[int, int, List[Tuple[str, str, int]], object]:
+        """Runs in a forked process. The subqueries not cached or to be issued in simulation are given back"""
+        results = 0
+        cached_subqueries = 0
+        pending_subqueries = []
+        for name, subquery, sum_factor in self._decomposer.get_translated_subqueries_range(self._translator,
+                                                                                           begin, end):
+            if subquery in self._simulation_cache or subquery not in cache:
+                pending_subqueries.append((name, subquery, sum_factor))
+            else:
+                sub_amount = cache[subquery]
+                self._decomposer.set_sub_amount(name, sub_amount, issued=False)
+                results += sum_factor * sub_amount
+                cached_subqueries += 1
+        return results, cached_subqueries, pending_subqueries, self._decomposer.pop_sub_amounts_state()
 
     def _get_amount(self, subqueries_total, middle_code) -> Tuple[int, int, int, int, int,
                                                                   datetime, datetime]:
-        issued_subqueries = 0
-        without_error_subqueries = 0
-        with_error_to_be_subtracted = 0
-        with_error_to_be_added = 0
-        results = 0
+        fingerprint = None
+        progress = None
+        if self._checkpoint is not None:
+            if self._decomposer.depends_on_sub_amounts():
+                self._warning('The subqueries depend on the previous amounts. No checkpoint will be saved',
+                              header=middle_code.full_name)
+            else:
+                fingerprint = self._checkpoint.get_fingerprint(
+                    middle_code, self.get_endpoint(), self._decomposer.__class__.__name__, subqueries_total,
+                    self._translator.get_particular_query(self._decomposer.longest_subexpression()))
+                progress = self._checkpoint.get(fingerprint)
+        if progress is not None:
+            self._decomposer.merge_sub_amounts_state(progress.decomposer_state)
+            if progress.finished:
+                self._info('Results amount taken from the checkpoint', header=middle_code.full_name)
+                return progress.get_amounts()
+            self._info('Resuming from the checkpoint at position', progress.position, header=middle_code.full_name)
+        else:
+            progress = Progress()
+            progress.begin_run_datetime = self._query_issuer.get_server_current_datetime()
+        self._info('Server begin time', progress.begin_run_datetime, header=middle_code.full_name)
+        self._progress = progress
+        progress.start_time = time.monotonic()
+        progress.start_position = progress.position
+        self._next_progress_report = progress.start_time + self.PROGRESS_INTERVAL
 
-        begin_run_datetime = self._query_issuer.get_server_current_datetime()
-        self._info('Server begin time', begin_run_datetime, header=middle_code.full_name)
+        if self._progressive:
+            self._depths_end_ranks = self._decomposer.get_depths_end_ranks()
+            if not self._depths_end_ranks:
+                self._info('The subqueries are not ranked by depth. No interim bounds will be given',
+                           header=middle_code.full_name)
+        if fingerprint is not None or self._progressive:
+            # noinspection PyUnresolvedReferences
+            if self.workers > 1:
+                self._warning('The subqueries are evaluated in order to checkpoint or report the progress. '
+                              'Workers ignored', self.workers, header=middle_code.full_name)
+            subqueries = self._get_positioned_subqueries(progress)
+        else:
+            progress.results, subqueries = self._get_cached_results(middle_code)
+        # noinspection PyUnresolvedReferences
+        concurrency = self.concurrency
+        if concurrency > 1 and self._decomposer.depends_on_sub_amounts():
+            self._debug('The subqueries depend on the previous amounts. Issuing them in sequence',
+                        header=middle_code.full_name)
+            concurrency = 1
+        if concurrency > 1:
+            self._issue_concurrently(subqueries, subqueries_total, middle_code, concurrency, progress, fingerprint)
+        else:
+            self._issue_sequentially(subqueries, subqueries_total, middle_code, progress, fingerprint)
 
-        for q, sum_factor in self._decomposer.get_subqueries():
-            subquery = self._translator.get_particular_query(q)
-            self._debug(f'{q.name} of {subqueries_total}', header=q.full_name, arg=subquery)
-            if subquery not in self._cache:
-                no_error, sub_amount = self._query_issuer.issue(q.full_name, subquery)
-                issued_subqueries += 1
-                if no_error:
-                    self._cache[subquery] = sub_amount
-                    self._debug('Results amount cached', header=q.full_name)
-                    self._debug('Results amount', sub_amount, header=q.full_name)
-                    without_error_subqueries += 1
-                else:
-                    if sum_factor > 0:
-                        with_error_to_be_added += 1
-                    else:
-                        with_error_to_be_subtracted += 1
+        progress.end_run_datetime = self._query_issuer.get_server_current_datetime()
+        self._info('Server end time', progress.end_run_datetime, header=middle_code.full_name)
+        if progress.stopped:
+            self._warning('Evaluation stopped', header=middle_code.full_name)
+            if fingerprint is not None:
+                self._set_stopped_position(progress)
+                self._save_checkpoint(fingerprint, progress)
+        elif fingerprint is not None:
+            progress.finished = True
+            self._save_checkpoint(fingerprint, progress)
+
+        return progress.get_amounts()
+
+    def _get_positioned_subqueries(self, progress: Progress) -> Iterable[Optional[Tuple[str, str, int]]]:
+        """
+        Gives the subqueries from the position of the progress on, and a None at each position where
+        a checkpoint or a progress report is due (see `_set_position`), once the position of the
+        progress is set to it. The subqueries in flight are waited for at each None, so they are only
+        given when due. If the subqueries can be addressed by rank, the position is the rank of the
+        next subquery, and the Nones are only given between chunks of ranks, as a rank may give
+        several subqueries. Otherwise, the position is the amount of subqueries already given, and
+        the previous ones are enumerated again on resuming.
+
+        The position where the subqueries given since began, and their amount, are kept so the
+        position can be set where the evaluation stopped (see `_set_stopped_position`).
+        """
+        self._given_subqueries_position = progress.position
+        self._given_subqueries = 0
+        ranked_subqueries = self._decomposer.get_ranked_sub_queries_amount()
+        if ranked_subqueries:
+            begin = progress.position
+            while begin < ranked_subqueries:
+                end = min([begin + self.CHECKPOINT_RANKS, ranked_subqueries] +
+                          [rank for rank in self._depths_end_ranks if rank > begin])
+                self._given_subqueries_position = begin
+                self._given_subqueries = 0
+                subqueries = self._decomposer.get_translated_subqueries_range(self._translator, begin, end)
+                if progress.skipped_subqueries:
+                    subqueries = self._skip_subqueries(subqueries, progress.skipped_subqueries)
+                    self._given_subqueries = progress.skipped_subqueries
+                    progress.skipped_subqueries = 0
+                for subquery in subqueries:
+                    self._given_subqueries += 1
+                    yield subquery
+                if self._is_position_due(end):
+                    progress.position = end
+                    yield None
+                begin = end
+        else:
+            subqueries = self._decomposer.get_translated_subqueries(self._translator)
+            for position, subquery in enumerate(itertools.islice(subqueries, progress.position, None),
+                                                progress.position + 1):
+                self._given_subqueries += 1
+                yield subquery
+                if self._is_position_due(position):
+                    progress.position = position
+                    self._given_subqueries_position = position
+                    self._given_subqueries = 0
+                    yield None
+
+    def _skip_subqueries(self, subqueries: Iterable[Tuple[str, str, int]],
+                         amount: int) -> Iterable[Tuple[str, str, int]]:
+        """
+        Skips the given amount of subqueries, evaluated before the evaluation stopped. What the decomposer
+        learns while enumerating them and the next one is discarded, as the checkpoint already has it
+        (see `_set_stopped_position`).
+        """
+        subqueries = iter(subqueries)
+        state = self._decomposer.pop_sub_amounts_state()
+        next_subqueries = list(itertools.islice(subqueries, amount + 1))[amount:]
+        self._decomposer.pop_sub_amounts_state()
+        self._decomposer.merge_sub_amounts_state(state)
+        return itertools.chain(next_subqueries, subqueries)
+
+    def _set_stopped_position(self, progress: Progress):
+        """
+        Sets the position of the progress where the evaluation stopped, once the subqueries in flight have
+        been waited for. The last subquery given was not evaluated. If the subqueries are addressed by rank,
+        the position is the one where the subqueries given since began, and the ones evaluated from it on
+        are skipped on resuming (see `_skip_subqueries`).
+        """
+        evaluated_subqueries = self._given_subqueries - 1
+        if self._decomposer.get_ranked_sub_queries_amount():
+            progress.position = self._given_subqueries_position
+            progress.skipped_subqueries = evaluated_subqueries
+        else:
+            progress.position = self._given_subqueries_position + evaluated_subqueries
+
+    def _is_position_due(self, position: int) -> bool:
+        """Whether a checkpoint or a progress report is due at the given position (see `_set_position`)"""
+        if self._checkpoint is not None and self._checkpoint.is_due():
+            return True
+        return self._progressive and (position in self._depths_end_ranks or
+                                      time.monotonic() >= self._next_progress_report)
+
+    def _set_position(self, middle_code: MiddleCode, progress: Progress, fingerprint: Optional[str]):
+        """
+        Called when all the subqueries before the position of the progress have been evaluated.
+        Saves a checkpoint if it is due, and reports the progress at the end of each depth or
+        periodically otherwise.
+        """
+        if fingerprint is not None and self._checkpoint.is_due():
+            self._save_checkpoint(fingerprint, progress)
+        if not self._progressive:
+            return
+        if progress.position in self._depths_end_ranks:
+            progress.completed_depth = self._depths_end_ranks.index(progress.position) + 1
+        elif time.monotonic() < self._next_progress_report:
+            return
+        self._report_progress(middle_code, progress)
+
+    def _report_progress(self, middle_code: MiddleCode, progress: Progress):
+        """
+        Gives to `on_progress` the interim results amount, the bounds given by the depths completed,
+        the amount of depths completed, the amounts of subqueries evaluated and issued, and the
+        estimated time to finish, taken from the rate at which the ranks have been evaluated.
+        """
+        self._next_progress_report = time.monotonic() + self.PROGRESS_INTERVAL
+        lower_bound, upper_bound = self._decomposer.get_partial_bounds(progress.completed_depth) or (None, None)
+        ranked_subqueries = self._decomposer.get_ranked_sub_queries_amount()
+        estimated_time = None
+        if ranked_subqueries and progress.position > progress.start_position:
+            elapsed = time.monotonic() - progress.start_time
+            estimated_time = str(timedelta(seconds=round(elapsed * (ranked_subqueries - progress.position) /
+                                                         (progress.position - progress.start_position))))
+        self._info('Interim results amount', progress.results, header=middle_code.full_name)
+        self._info('Interim results amount bounds', f'from {lower_bound} to {upper_bound}',
+                   header=middle_code.full_name)
+        if self._on_progress is not None:
+            self._on_progress(middle_code, (progress.results, lower_bound, upper_bound, progress.completed_depth,
+                                            progress.evaluated_subqueries, progress.issued_subqueries,
+                                            estimated_time))
+
+    def _is_stopped(self) -> bool:
+        """
+        Whether the deadline or the maximum amount of requests has been reached. It is only checked before
+        issuing a subquery, so the subqueries already cached are still evaluated once it is reached.
+        The maximum amount of requests is of subqueries issued, which are as many as the requests unless
+        the query issuer batches them (see `GithubV4QueryIssuer`).
+        """
+        return ((self._deadline is not None and time.monotonic() >= self._deadline) or
+                (self._max_requests is not None and self._issued_subqueries >= self._max_requests))
+
+    def _save_checkpoint(self, fingerprint: str, progress: Progress):
+        """The decomposer state is given to the progress and taken back, so it keeps it (see `pop_sub_amounts_state`)"""
+        progress.decomposer_state = self._decomposer.pop_sub_amounts_state()
+        self._checkpoint.save(fingerprint, progress)
+        self._decomposer.merge_sub_amounts_state(progress.decomposer_state)
+
+    def _issue_sequentially(self, subqueries: Iterable[Optional[Tuple[str, str, int]]], subqueries_total: int,
+                            middle_code: MiddleCode, progress: Progress, fingerprint: Optional[str]):
+        for subquery_triple in subqueries:
+            if subquery_triple is None:
+                self._set_position(middle_code, progress, fingerprint)
+                continue
+            name, subquery, sum_factor = subquery_triple
+            header = f'{middle_code.full_name}.{name}'
+            self._debug(f'{name} of {subqueries_total}', header=header, arg=subquery)
+            sub_amount = self._cache.get_amount(subquery)
+            if sub_amount is None:
+                if self._is_stopped():
+                    progress.stopped = True
+                    break
+                self._count_issued_subquery()
+                no_error, sub_amount = self._query_issuer.issue(header, subquery)
+                self._set_issued_amount(header, name, subquery, no_error, sub_amount)
+                progress.add_issued(no_error, sum_factor, sub_amount)
             else:
-                sub_amount = self._cache[subquery]
-                self._debug(f'Results amount already cached', header=q.full_name)
-                self._debug('Results amount', sub_amount, header=q.full_name)
-            results += sum_factor * sub_amount
+                progress.add_cached(sum_factor, self._set_cached_amount(header, name, sub_amount))
 
-        end_run_datetime = self._query_issuer.get_server_current_datetime()
-        self._info('Server end time', end_run_datetime, header=middle_code.full_name)
+    def _issue_concurrently(self, subqueries: Iterable[Optional[Tuple[str, str, int]]], subqueries_total: int,
+                            middle_code: MiddleCode, concurrency: int, progress: Progress,
+                            fingerprint: Optional[str]):
+        """
+        Issues the subqueries not cached keeping up to `concurrency` of them in flight, while the
+        query issuer paces them. A subquery identical to one in flight is not issued again, but gets
+        the amount of that one. The amounts are cached and set to the decomposer as they arrive.
+        The subqueries in flight are waited for at each position given (see `_set_position`).
+        """
+        # each subquery in flight with the (header, name, sum factor) of all the subqueries waiting for it
+        in_flight: Dict[Future, Tuple[str, List[Tuple[str, str, int]]]] = {}
+        in_flight_futures: Dict[str, Future] = {}
 
-        return (issued_subqueries, without_error_subqueries,
-                with_error_to_be_added, with_error_to_be_subtracted,
-                results, begin_run_datetime, end_run_datetime)
+        def set_issued_amounts(futures: Iterable[Future]):
+            for future in futures:
+                subquery, waiting = in_flight.pop(future)
+                del in_flight_futures[subquery]
+                no_error, sub_amount = future.result()
+                (header, name, sum_factor), *merged = waiting
+                self._set_issued_amount(header, name, subquery, no_error, sub_amount)
+                progress.add_issued(no_error, sum_factor, sub_amount)
+                for header, name, sum_factor in merged:
+                    self._debug('Results amount given by an identical subquery', header=header)
+                    self._decomposer.set_sub_amount(name, sub_amount if no_error else None, issued=False)
+                    # they were not issued, so their outcome is only counted for the issued one
+                    progress.add_cached(sum_factor, sub_amount if no_error else 0)
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            for subquery_triple in subqueries:
+                if subquery_triple is None:
+                    set_issued_amounts(wait(in_flight).done)
+                    self._set_position(middle_code, progress, fingerprint)
+                    continue
+                name, subquery, sum_factor = subquery_triple
+                header = f'{middle_code.full_name}.{name}'
+                self._debug(f'{name} of {subqueries_total}', header=header, arg=subquery)
+                future = in_flight_futures.get(subquery)
+                if future is not None:
+                    self._debug('Identical subquery in flight', header=header)
+                    in_flight[future][1].append((header, name, sum_factor))
+                    continue
+                sub_amount = self._cache.get_amount(subquery)
+                if sub_amount is not None:
+                    progress.add_cached(sum_factor, self._set_cached_amount(header, name, sub_amount))
+                else:
+                    if self._is_stopped():
+                        progress.stopped = True
+                        break
+                    self._count_issued_subquery()
+                    if len(in_flight) >= concurrency:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        set_issued_amounts(done)
+                    future = executor.submit(self._query_issuer.issue, header, subquery)
+                    in_flight[future] = subquery, [(header, name, sum_factor)]
+                    in_flight_futures[subquery] = future
+            set_issued_amounts(wait(in_flight).done)
+
+    def _count_issued_subquery(self):
+        """The requests are counted by the query issuer, as it may issue several subqueries in one"""
+        self._issued_subqueries += 1
+
+    def _set_issued_amount(self, header: str, name: str, subquery: str, no_error: bool, sub_amount: int):
+        if no_error:
+            self._cache.set_amount(subquery, sub_amount)
+            self._debug('Results amount cached', header=header)
+            self._debug('Results amount', sub_amount, header=header)
+            self._decomposer.set_sub_amount(name, sub_amount, issued=True)
+        else:
+            METRICS.increment('request_errors_total')
+            self._decomposer.set_sub_amount(name, None, issued=True)
+
+    def _set_cached_amount(self, header: str, name: str, sub_amount: int) -> int:
+        self._debug(f'Results amount already cached', header=header)
+        self._debug('Results amount', sub_amount, header=header)
+        self._decomposer.set_sub_amount(name, sub_amount, issued=False)
+        return sub_amount
 
     def _run_simulation(self, subqueries_total, middle_code) -> Tuple[int, int, int, int, int,
                                                                       datetime, datetime]:
         to_issue_subqueries = 0
         without_error_subqueries = 0
-        results = 0
 
         begin_run_datetime = datetime.now()
         self._info('Local begin time', begin_run_datetime, header=middle_code.full_name)
 
-        for q, sum_factor in self._decomposer.get_subqueries():
-            subquery = self._translator.get_particular_query(q)
-            self._debug(f'... of {subqueries_total}', header=q.full_name, arg=subquery)
+        results, subqueries = self._get_cached_results(middle_code)
+        for name, subquery, sum_factor in subqueries:
+            header = f'{middle_code.full_name}.{name}'
+            self._debug(f'... of {subqueries_total}', header=header, arg=subquery)
             sub_amount = 0
             if subquery not in self._simulation_cache:
-                if subquery not in self._cache:
-                    self._debug('To issue', header=q.full_name)
+                cached_amount = self._cache.get_amount(subquery)
+                if cached_amount is None:
+                    self._debug('To issue', header=header)
                     to_issue_subqueries += 1
-                    if not self._query_issuer.check_query_restrictions(subquery, q.full_name):
-                        self._debug(f'Subquery discarded', header=q.full_name)
+                    self._decomposer.set_sub_amount(name, None, issued=True)
+                    if not self._query_issuer.check_query_restrictions(subquery, header):
+                        self._debug(f'Subquery discarded', header=header)
                     else:
                         self._simulation_cache.add(subquery)
-                        self._debug('Query cached', header=q.full_name)
+                        self._debug('Query cached', header=header)
                         without_error_subqueries += 1
                 else:
-                    sub_amount = self._cache[subquery]
-                    self._debug(f'Results amount already cached', header=q.full_name)
-                    self._debug('Results amount', sub_amount, header=q.full_name)
+                    sub_amount = cached_amount
+                    self._debug(f'Results amount already cached', header=header)
+                    self._debug('Results amount', sub_amount, header=header)
+                    self._decomposer.set_sub_amount(name, sub_amount, issued=False)
             else:
-                self._debug(f'Query already cached', header=q.full_name)
+                # it would be in the cache once issued
+                METRICS.increment('cache_hits_total')
+                self._debug(f'Query already cached', header=header)
+                self._decomposer.set_sub_amount(name, None, issued=False)
             results += sum_factor * sub_amount
 
         end_run_datetime = datetime.now()
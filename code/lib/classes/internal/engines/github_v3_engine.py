@@ -1,30 +1,44 @@
-from typing import Sequence
+import argparse
+from pathlib import Path
+from typing import Sequence, List, Tuple, Optional
 
-import github
+import urllib3
 
+from lib.classes.internal.decomposers import DECOMPOSER_TYPE, DEFAULT_DECOMPOSER_TYPE
+from lib.classes.internal.decomposers.disjoint_decomposer import DisjointDecomposer
+from lib.classes.internal.decomposers.dnf_converter import DnfConverter
+from lib.classes.internal.decomposers.espresso_minimizer import EspressoMinimizer
 from lib.classes.internal.decomposers.exclusion_inclusion_decomposer import ExclusionInclusionDecomposer
 from lib.classes.internal.engines.engine import Engine
 from lib.classes.internal.query_issuers.githubv3_query_issuer import GithubV3QueryIssuer
+from lib.classes.internal.query_issuers.runtime_calibration import RuntimeCalibration
+from lib.classes.internal.rules.qualifier_rules import QualifierRules
+from lib.classes.internal.translators.boolean_translator import BooleanTranslator, BooleanOperators
 from lib.classes.internal.translators.spaces_translator import SpacesTranslator
 from lib.utilities.with_external_arguments import CustomArgumentParser
 
 
 class GithubV3Engine(Engine):
     ARG_NAME = 'github'
+    QUERY_ISSUER_TYPE = GithubV3QueryIssuer
 
     def _init_arguments(self):
         Engine._init_arguments(self)
         self._args_parser.add_argument('**user')
         self._args_parser.add_argument('**passw')
+        self._args_parser.add_argument('**credentials', nargs='+', metavar='TOKEN|USER:PASSW', default=[])
         self._args_parser.add_argument('**search-type',
-                                       default=GithubV3QueryIssuer.DEFAULT_SEARCH_TYPE,
-                                       choices=GithubV3QueryIssuer.SEARCH_TYPE.keys(),
-                                       type=GithubV3QueryIssuer.cast_to_search_type)
+                                       default=self.QUERY_ISSUER_TYPE.DEFAULT_SEARCH_TYPE,
+                                       choices=self.QUERY_ISSUER_TYPE.SEARCH_TYPE.keys())
         self._args_parser.add_argument('**url', default='https://api.github.com')
         self._args_parser.add_argument('**logging', action='store_true')
         self._args_parser.add_argument('**admit-long-query', action='store_true')
         self._args_parser.add_argument('**query-max-length', type=int, default=128)
         self._args_parser.add_argument('**waiting-factor', type=int, default=7)
+        self._args_parser.add_argument('**rate-limit-period', type=float,
+                                       default=self.QUERY_ISSUER_TYPE.RATE_LIMIT_PERIOD)
+        self._args_parser.add_argument('**calibration', metavar='FILENAME')
+        self._args_parser.add_argument('**calibrate-from', nargs='+', metavar='PATH', type=Path, default=[])
         self._args_parser.add_argument('**total-retry', type=int, default=10)
         self._args_parser.add_argument('**connect-retry', type=int)
         self._args_parser.add_argument('**read-retry', type=int)
@@ -32,25 +46,94 @@ class GithubV3Engine(Engine):
         self._args_parser.add_argument('**backoff-factor', type=float, default=6)
         self._args_parser.add_argument('**backoff-max', type=int, default=600)
         self._args_parser.add_argument('**deep-simplify', action='store_true')
+        self._args_parser.add_argument('**dnf-max-terms', type=int, default=DnfConverter.DEFAULT_MAX_TERMS)
+        self._args_parser.add_argument('**dnf-timeout', type=float, default=DnfConverter.DEFAULT_TIMEOUT)
+        self._args_parser.add_argument('**dnf-cache', metavar='FILENAME')
+        self._args_parser.add_argument('**minimize', action='store_true')
+        self._args_parser.add_argument('**minimize-timeout', type=float, default=EspressoMinimizer.DEFAULT_TIMEOUT)
+        self._args_parser.add_argument('**decomposer',
+                                       default=DEFAULT_DECOMPOSER_TYPE,
+                                       choices=DECOMPOSER_TYPE.keys())
+        self._args_parser.add_argument('**prune-zeros', action='store_true')
+        self._args_parser.add_argument('**merge-subqueries', action='store_true')
+        self._args_parser.add_argument('**rules', type=argparse.FileType('r'))
+        self._args_parser.add_argument('**no-builtin-rules', action='store_true')
+        self._args_parser.add_argument('**no-pushdown', action='store_true')
+        self._args_parser.add_argument('**max-depth', type=int)
 
     def __init__(self, args_sequence: Sequence[str],
                  cache_options: Sequence[str],
                  input_caches_options: Sequence[str],
                  simulate: bool,
-                 main_args_parser: CustomArgumentParser
+                 main_args_parser: CustomArgumentParser,
+                 progressive: bool = False,
+                 deadline: Optional[float] = None,
+                 max_requests: Optional[int] = None
                  ):
         Engine.__init__(self, args_sequence, cache_options,
                         input_caches_options, simulate,
-                        main_args_parser)
+                        main_args_parser, progressive,
+                        deadline, max_requests)
         # noinspection PyUnresolvedReferences
-        self._decomposer = ExclusionInclusionDecomposer(self.deep_simplify)
-        self._translator = SpacesTranslator()
+        rules = QualifierRules(() if self.no_builtin_rules else self.QUERY_ISSUER_TYPE.SINGLE_VALUED_QUALIFIERS,
+                               self.rules)
         # noinspection PyUnresolvedReferences
-        self._query_issuer = GithubV3QueryIssuer(self.user, self.passw, self.url, self.search_type,
-                                                 self.query_max_length, self.admit_long_query,
-                                                 self.total_retry, self.connect_retry, self.read_retry,
-                                                 self.status_retry, self.backoff_factor, self.backoff_max,
-                                                 self.waiting_factor, not simulate)
+        dnf_converter = self._dnf_converter = DnfConverter(self.dnf_max_terms, self.dnf_timeout, self.dnf_cache)
+        # noinspection PyUnresolvedReferences
+        minimizer = EspressoMinimizer(self.minimize_timeout) if self.minimize else None
+        # noinspection PyUnresolvedReferences
+        self._main_decomposer = ExclusionInclusionDecomposer(self.deep_simplify, self.prune_zeros,
+                                                             self.merge_subqueries, rules, self.max_depth,
+                                                             dnf_converter, minimizer)
+        # noinspection PyUnresolvedReferences
+        if self.decomposer == DisjointDecomposer.ARG_NAME:
+            self._fallback_decomposer = self._main_decomposer
+            # noinspection PyUnresolvedReferences
+            self._main_decomposer = DisjointDecomposer(self.deep_simplify, rules, dnf_converter, minimizer)
+        # noinspection PyUnresolvedReferences
+        operators = self.QUERY_ISSUER_TYPE.SEARCH_TYPE_OPERATORS.get(self.search_type, BooleanOperators())
+        # noinspection PyUnresolvedReferences
+        if operators.disjunction and not self.no_pushdown:
+            self._translator = BooleanTranslator(operators)
+        else:
+            self._translator = SpacesTranslator()
+        # noinspection PyUnresolvedReferences
+        calibration = RuntimeCalibration(self.calibration)
+        # noinspection PyUnresolvedReferences
+        for path in self.calibrate_from:
+            calibration.add_output(path)
+        self._query_issuer = self._get_query_issuer(not simulate, calibration)
         # noinspection PyUnresolvedReferences
         if self.logging:
-            github.enable_console_debug_logging()
+            urllib3.add_stderr_logger()
+
+    def get_endpoint(self) -> Tuple[str, ...]:
+        # noinspection PyUnresolvedReferences
+        return Engine.get_endpoint(self) + (self.search_type, self.url)
+
+    def close(self):
+        self._dnf_converter.close()
+        Engine.close(self)
+
+    def _get_query_issuer(self, connect: bool, calibration: RuntimeCalibration) -> GithubV3QueryIssuer:
+        # noinspection PyUnresolvedReferences
+        return GithubV3QueryIssuer(self._get_credentials(), self.url,
+                                   GithubV3QueryIssuer.cast_to_search_type(self.search_type),
+                                   self.query_max_length, self.admit_long_query,
+                                   self.total_retry, self.connect_retry, self.read_retry,
+                                   self.status_retry, self.backoff_factor, self.backoff_max,
+                                   self.waiting_factor, connect, calibration,
+                                   self.rate_limit_period, max(self.concurrency, 1))
+
+    def _get_credentials(self) -> List[Tuple[Optional[str], Optional[str]]]:
+        """The credentials given by **user and **passw, followed by the ones given by **credentials"""
+        credentials = []
+        # noinspection PyUnresolvedReferences
+        if self.user is not None:
+            # noinspection PyUnresolvedReferences
+            credentials.append((self.user, self.passw))
+        # noinspection PyUnresolvedReferences
+        for credential in self.credentials:
+            user, separator, passw = credential.partition(':')
+            credentials.append((user, passw if separator else None))
+        return credentials
@@ -0,0 +1,55 @@
+from typing import Sequence, Optional
+
+from lib.classes.internal.engines.github_v3_engine import GithubV3Engine
+from lib.classes.internal.query_issuers.githubv4_query_issuer import GithubV4QueryIssuer
+from lib.classes.internal.query_issuers.runtime_calibration import RuntimeCalibration
+from lib.utilities.with_external_arguments import CustomArgumentParser
+
+
+class GithubV4Engine(GithubV3Engine):
+    """
+    Engine of the GitHub GraphQL API (v4). The subqueries are decomposed and cached as by
+    `GithubV3Engine`, but issued in batches of **batch-size per request (see `GithubV4QueryIssuer`).
+
+    A batch is only filled by subqueries in flight at the same time, so **concurrency defaults to twice
+    the default batch size, which keeps a batch filling while the previous one is issued.
+    """
+
+    ARG_NAME = 'github-v4'
+    QUERY_ISSUER_TYPE = GithubV4QueryIssuer
+
+    def _init_arguments(self):
+        GithubV3Engine._init_arguments(self)
+        self._args_parser.add_argument('**batch-size', type=int, default=GithubV4QueryIssuer.DEFAULT_BATCH_SIZE)
+        self._args_parser.add_argument('**batch-linger', type=float, default=GithubV4QueryIssuer.DEFAULT_BATCH_LINGER)
+        self._args_parser.set_defaults(concurrency=2 * GithubV4QueryIssuer.DEFAULT_BATCH_SIZE)
+
+    def __init__(self, args_sequence: Sequence[str],
+                 cache_options: Sequence[str],
+                 input_caches_options: Sequence[str],
+                 simulate: bool,
+                 main_args_parser: CustomArgumentParser,
+                 progressive: bool = False,
+                 deadline: Optional[float] = None,
+                 max_requests: Optional[int] = None
+                 ):
+        GithubV3Engine.__init__(self, args_sequence, cache_options,
+                                input_caches_options, simulate,
+                                main_args_parser, progressive,
+                                deadline, max_requests)
+        # noinspection PyUnresolvedReferences
+        if self.concurrency < self._query_issuer.batch_size:
+            # noinspection PyUnresolvedReferences
+            self._warning(f'The concurrency is lower than the batch size of {self._query_issuer.batch_size}. '
+                          f'Batches will hold at most a number of subqueries equal to the concurrency',
+                          self.concurrency)
+
+    def _get_query_issuer(self, connect: bool, calibration: RuntimeCalibration) -> GithubV4QueryIssuer:
+        # noinspection PyUnresolvedReferences
+        return GithubV4QueryIssuer(self._get_credentials(), self.url,
+                                   GithubV4QueryIssuer.cast_to_search_type(self.search_type),
+                                   self.query_max_length, self.admit_long_query,
+                                   self.total_retry, self.connect_retry, self.read_retry,
+                                   self.status_retry, self.backoff_factor, self.backoff_max,
+                                   self.waiting_factor, connect, calibration,
+                                   self.rate_limit_period, self.batch_size, self.batch_linger)
@@ -0,0 +1,102 @@
+from datetime import datetime
+from pathlib import Path
+from typing import Sequence, Optional, Tuple, Callable, Iterable, List
+
+from lib.classes.internal.engines.engine import Engine
+from lib.classes.internal.indexes.inverted_index import InvertedIndex
+from lib.classes.internal.middle_codes.middle_code import MiddleCode
+from lib.utilities.logging import ExitCode
+from lib.utilities.metrics import METRICS
+from lib.utilities.with_external_arguments import CustomArgumentParser
+
+
+class LocalIndexEngine(Engine):
+    """
+    Engine that counts the results of the queries in a local inverted index (see `InvertedIndex`) instead
+    of issuing requests. The expression of each query is evaluated as a whole by set algebra over the
+    posting lists of its literals, so it is neither converted to DNF nor decomposed, and its amount is
+    exact. It is meant for what-if analysis and as a correctness oracle for the other engines.
+
+    The index is built from the files under **corpus and saved to **index, or loaded from **index if no
+    corpus is given.
+    """
+
+    ARG_NAME = 'local-index'
+    ESTIMATED_TIME = '0:00:00'
+
+    def _init_arguments(self):
+        Engine._init_arguments(self)
+        self._args_parser.add_argument('**index', metavar='FILENAME', required=True)
+        self._args_parser.add_argument('**corpus', nargs='+', metavar='PATH', type=Path, default=[])
+        self._args_parser.add_argument('**max-file-size', type=int, default=InvertedIndex.DEFAULT_MAX_FILE_SIZE)
+
+    def __init__(self, args_sequence: Sequence[str],
+                 cache_options: Sequence[str],
+                 input_caches_options: Sequence[str],
+                 simulate: bool,
+                 main_args_parser: CustomArgumentParser,
+                 progressive: bool = False,
+                 deadline: Optional[float] = None,
+                 max_requests: Optional[int] = None
+                 ):
+        Engine.__init__(self, args_sequence, cache_options,
+                        input_caches_options, simulate,
+                        main_args_parser, progressive,
+                        deadline, max_requests)
+        # noinspection PyUnresolvedReferences
+        self._index = self._build_index() if self.corpus else self._load_index()
+        self._info('Indexed documents', self._index.documents)
+        self._info('Indexed terms', self._index.terms)
+
+    def _build_index(self) -> InvertedIndex:
+        # noinspection PyUnresolvedReferences
+        self._info('Building index ...', header=self.index)
+        # noinspection PyUnresolvedReferences
+        index = InvertedIndex.build(self.corpus, self.max_file_size)
+        try:
+            # noinspection PyUnresolvedReferences
+            index.save(self.index)
+        except IOError as e:
+            self._critical('Error while saving index', ExitCode.FILE_ERROR, e)
+        return index
+
+    def _load_index(self) -> InvertedIndex:
+        try:
+            # noinspection PyUnresolvedReferences
+            return InvertedIndex.load(self.index)
+        except (IOError, ValueError, KeyError) as e:
+            self._critical('Error while loading index', ExitCode.FILE_ERROR, e)
+
+    def plan(self, middle_codes: Sequence[MiddleCode]) -> None:
+        self._warning('The queries are evaluated directly in the index. Queries will not be planned')
+        return None
+
+    def get_capacity_estimated_times(self, subqueries_total: int, to_issue_subqueries: int,
+                                     scenarios: Iterable[Tuple[int, int, Optional[float]]]
+                                     ) -> List[Tuple[int, int, float, str, str]]:
+        return [(tokens, concurrency, cache_hit_ratio or 0., self.ESTIMATED_TIME, self.ESTIMATED_TIME)
+                for tokens, concurrency, cache_hit_ratio in scenarios]
+
+    def get_total_amount(self, middle_code: MiddleCode,
+                         on_progress: Optional[Callable[[MiddleCode, Tuple], None]] = None) -> Tuple:
+        """
+        The whole expression counts as a single subquery issued to the index. The results are built as
+        `Engine.get_total_amount` builds them (see `Engine._get_results`), so the outputs are the same
+        for every engine.
+        """
+        self._debug('Getting results amount ...', header=middle_code.full_name)
+        METRICS.increment('queries_total')
+        begin_run_datetime = datetime.now()
+        with METRICS.time('query_seconds'):
+            try:
+                results = self._index.count(middle_code.exp)
+            except ValueError as e:
+                self._critical('Unsupported literal', ExitCode.QUERY_ERROR, e, header=middle_code.full_name)
+        end_run_datetime = datetime.now()
+        self._count_issued_subquery()
+        METRICS.increment('requests_total')
+        self._info('Local begin time', begin_run_datetime, header=middle_code.full_name)
+        self._info('Local end time', end_run_datetime, header=middle_code.full_name)
+        return self._get_results(results, 1, 1, 1,
+                                 self.ESTIMATED_TIME, self.ESTIMATED_TIME, self.ESTIMATED_TIME, self.ESTIMATED_TIME,
+                                 begin_run_datetime, end_run_datetime, str(middle_code.exp))
@@ -0,0 +1,53 @@
+from datetime import datetime
+from typing import Any, Optional, Tuple
+
+
+class Progress:
+    """
+    The running amounts of the evaluation of a query: the partial sum of the results amounts, the
+    counters of the evaluated subqueries, and the position up to which the subqueries have been evaluated
+    (see `Engine._get_positioned_subqueries`). It is what a checkpoint stores (see `Checkpoint`).
+    """
+
+    def __init__(self):
+        self.results = 0
+        self.evaluated_subqueries = 0
+        self.issued_subqueries = 0
+        self.without_error_subqueries = 0
+        self.with_error_to_be_added = 0
+        self.with_error_to_be_subtracted = 0
+        self.position = 0
+        # the subqueries from the position on that were evaluated before the evaluation stopped
+        self.skipped_subqueries = 0
+        self.completed_depth = 0
+        self.decomposer_state: Any = None
+        self.begin_run_datetime: Optional[datetime] = None
+        self.end_run_datetime: Optional[datetime] = None
+        self.finished = False
+        self.stopped = False
+        # the monotonic time and the position at which the current run of the evaluation began
+        self.start_time = 0.
+        self.start_position = 0
+
+    def add_issued(self, no_error: bool, sum_factor: int, sub_amount: int):
+        self.issued_subqueries += 1
+        self.add_amount(no_error, sum_factor, sub_amount)
+
+    def add_cached(self, sum_factor: int, sub_amount: int):
+        self.evaluated_subqueries += 1
+        self.results += sum_factor * sub_amount
+
+    def add_amount(self, no_error: bool, sum_factor: int, sub_amount: int):
+        self.evaluated_subqueries += 1
+        if no_error:
+            self.without_error_subqueries += 1
+        elif sum_factor > 0:
+            self.with_error_to_be_added += 1
+        else:
+            self.with_error_to_be_subtracted += 1
+        self.results += sum_factor * sub_amount
+
+    def get_amounts(self) -> Tuple[int, int, int, int, int, datetime, datetime]:
+        return (self.issued_subqueries, self.without_error_subqueries,
+                self.with_error_to_be_added, self.with_error_to_be_subtracted,
+                self.results, self.begin_run_datetime, self.end_run_datetime)
@@ -0,0 +1,260 @@
+import itertools
+import json
+import os
+import re
+import struct
+import sys
+import zlib
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import sympy
+
+from lib.utilities.functions import write_atomically, bits_amount
+
+
+class InvertedIndex:
+    """
+    Inverted index over a local corpus, where each file is a document. The documents are identified by
+    their position, and the posting list of each term is kept as a bitset, a Python int whose i-th bit is
+    set if the i-th document contains the term. So the set algebra over the posting lists is done by the
+    bitwise operators, word by word.
+
+    The terms of a document are its words, lowercased, plus the qualifiers `extension:EXT` and
+    `filename:NAME`. The qualifier `language:NAME` matches the documents with any of the extensions of the
+    language, and the other qualifiers of the GitHub search are rejected, as the files have no such
+    metadata. Any other literal matches the documents containing all its words, so quoted literals are taken
+    as conjunctions of their words and not as phrases.
+
+    The index file has a JSON header with the amount of documents and the offset and length of the posting
+    list of each term, followed by the posting lists. Each one is stored compressed, either as the sorted
+    deltas between its documents or as a bitmap, whichever is smaller, and only decompressed when used.
+    The decompressed ones are memoized up to `MAX_MEMOIZED_BYTES`.
+    """
+
+    MAGIC = b'QTYIDX1\n'
+    QUALIFIERS = ('extension', 'filename')
+    LANGUAGE_QUALIFIER = 'language'
+    # the extensions of each language, by its lowercased name in the GitHub search
+    LANGUAGE_EXTENSIONS: Dict[str, Tuple[str, ...]] = {
+        'c': ('c', 'h'),
+        'c#': ('cs',),
+        'c++': ('cpp', 'cc', 'cxx', 'hpp', 'hh', 'hxx'),
+        'css': ('css',),
+        'go': ('go',),
+        'haskell': ('hs',),
+        'html': ('html', 'htm'),
+        'java': ('java',),
+        'javascript': ('js', 'mjs', 'cjs', 'jsx'),
+        'json': ('json',),
+        'kotlin': ('kt', 'kts'),
+        'lua': ('lua',),
+        'markdown': ('md', 'markdown'),
+        'perl': ('pl', 'pm'),
+        'php': ('php',),
+        'python': ('py', 'pyi', 'pyw'),
+        'r': ('r',),
+        'ruby': ('rb',),
+        'rust': ('rs',),
+        'scala': ('scala',),
+        'shell': ('sh', 'bash'),
+        'sql': ('sql',),
+        'swift': ('swift',),
+        'typescript': ('ts', 'tsx'),
+        'yaml': ('yml', 'yaml'),
+    }
+    LANGUAGE_ALIASES = {'cpp': 'c++', 'csharp': 'c#', 'js': 'javascript', 'ts': 'typescript', 'bash': 'shell',
+                        'yml': 'yaml'}
+    # qualifiers of the GitHub search about metadata that the indexed files do not have
+    UNSUPPORTED_QUALIFIERS = frozenset(('archived', 'author', 'created', 'fork', 'forks', 'in', 'is', 'label',
+                                        'license', 'org', 'path', 'pushed', 'repo', 'size', 'stars', 'state',
+                                        'topic', 'type', 'updated', 'user'))
+    QUALIFIER_SEPARATOR = ':'
+    MAX_MEMOIZED_BYTES = 256 << 20
+    DEFAULT_MAX_FILE_SIZE = 384 * 1024
+    SKIPPED_DIRS = frozenset(('.git', '.hg', '.svn'))
+    BINARY_CHECK_SIZE = 8192
+    IDS, BITMAP = 0, 1
+    _WORD_PATTERN = re.compile(r'\w+')
+    _HEADER_LENGTH = struct.Struct('<Q')
+
+    def __init__(self, documents: int, postings: Dict[str, bytes]):
+        self._documents = documents
+        self._all = (1 << documents) - 1
+        self._postings = postings
+        self._bitsets: Dict[str, int] = {}
+        self._max_memoized_bitsets = max(1, self.MAX_MEMOIZED_BYTES * 8 // max(documents, 1))
+
+    @property
+    def documents(self) -> int:
+        return self._documents
+
+    @property
+    def terms(self) -> int:
+        return len(self._postings)
+
+    @classmethod
+    def build(cls, paths: Iterable[Path], max_file_size: int = DEFAULT_MAX_FILE_SIZE) -> 'InvertedIndex':
+        """
+        Indexes the files under the given paths, skipping the ones larger than `max_file_size` bytes, the
+        binary ones and the version control directories
+        """
+        postings: Dict[str, array] = {}
+        documents = 0
+        for filename in cls._get_filenames(paths):
+            try:
+                if os.path.getsize(filename) > max_file_size:
+                    continue
+                with open(filename, 'rb') as file:
+                    data = file.read()
+            except IOError:
+                continue
+            if b'\0' in data[:cls.BINARY_CHECK_SIZE]:
+                continue
+            for term in cls._get_document_terms(filename, data.decode('utf-8', errors='ignore')):
+                ids = postings.get(term)
+                if ids is None:
+                    ids = postings[term] = array('I')
+                ids.append(documents)
+            documents += 1
+        return cls(documents, {term: cls._compress(ids, documents) for term, ids in postings.items()})
+
+    @classmethod
+    def _get_filenames(cls, paths: Iterable[Path]) -> Iterable[str]:
+        for path in paths:
+            if path.is_file():
+                yield str(path)
+                continue
+            for directory, directories, filenames in os.walk(path):
+                directories[:] = sorted(d for d in directories if d not in cls.SKIPPED_DIRS)
+                for filename in sorted(filenames):
+                    yield os.path.join(directory, filename)
+
+    @classmethod
+    def _get_document_terms(cls, filename: str, text: str) -> Iterable[str]:
+        terms = set(cls._WORD_PATTERN.findall(text.lower()))
+        basename = os.path.basename(filename).lower()
+        terms.add(f'filename{cls.QUALIFIER_SEPARATOR}{basename}')
+        extension = os.path.splitext(basename)[1][1:]
+        if extension:
+            terms.add(f'extension{cls.QUALIFIER_SEPARATOR}{extension}')
+        return terms
+
+    @classmethod
+    def _compress(cls, ids: array, documents: int) -> bytes:
+        if len(ids) * ids.itemsize < documents // 8:
+            deltas = array('I', (b - a for a, b in zip(itertools.chain((0,), ids), ids)))
+            if sys.byteorder == 'big':
+                deltas.byteswap()
+            return bytes((cls.IDS,)) + zlib.compress(deltas.tobytes())
+        bitmap = bytearray((documents + 7) // 8)
+        for i in ids:
+            bitmap[i >> 3] |= 1 << (i & 7)
+        return bytes((cls.BITMAP,)) + zlib.compress(bytes(bitmap))
+
+    def _decompress(self, posting: bytes) -> int:
+        data = zlib.decompress(posting[1:])
+        if posting[0] == self.BITMAP:
+            return int.from_bytes(data, 'little')
+        deltas = array('I')
+        deltas.frombytes(data)
+        if sys.byteorder == 'big':
+            deltas.byteswap()
+        bitmap = bytearray((self._documents + 7) // 8)
+        for i in itertools.accumulate(deltas):
+            bitmap[i >> 3] |= 1 << (i & 7)
+        return int.from_bytes(bitmap, 'little')
+
+    def save(self, filename: str):
+        terms = {}
+        offset = 0
+        for term, posting in self._postings.items():
+            terms[term] = offset, len(posting)
+            offset += len(posting)
+        header = json.dumps({'documents': self._documents, 'terms': terms}, separators=(',', ':')).encode()
+        write_atomically(filename, b''.join(itertools.chain(
+            (self.MAGIC, self._HEADER_LENGTH.pack(len(header)), header), self._postings.values())))
+
+    @classmethod
+    def load(cls, filename: str) -> 'InvertedIndex':
+        with open(filename, 'rb') as file:
+            data = file.read()
+        if not data.startswith(cls.MAGIC):
+            raise ValueError(f'{filename} is not an index file')
+        begin = len(cls.MAGIC) + cls._HEADER_LENGTH.size
+        header_length, = cls._HEADER_LENGTH.unpack_from(data, len(cls.MAGIC))
+        header = json.loads(data[begin:begin + header_length])
+        begin += header_length
+        return cls(header['documents'], {term: data[begin + offset:begin + offset + length]
+                                         for term, (offset, length) in header['terms'].items()})
+
+    def _get_term_bitset(self, term: str) -> int:
+        bitset = self._bitsets.get(term)
+        if bitset is None:
+            posting = self._postings.get(term)
+            bitset = self._decompress(posting) if posting is not None else 0
+            if len(self._bitsets) >= self._max_memoized_bitsets:
+                self._bitsets = {}
+            self._bitsets[term] = bitset
+        return bitset
+
+    def get_literal_bitset(self, literal: str) -> int:
+        """Raises a `ValueError` if the literal is a qualifier not supported, or a language not known"""
+        literal = literal.strip('"').lower()
+        qualifier, separator, value = literal.partition(self.QUALIFIER_SEPARATOR)
+        if separator and qualifier in self.QUALIFIERS:
+            return self._get_term_bitset(literal)
+        if separator and qualifier == self.LANGUAGE_QUALIFIER:
+            return self._get_language_bitset(value.strip('"'))
+        if separator and qualifier in self.UNSUPPORTED_QUALIFIERS:
+            raise ValueError(f'The qualifier {qualifier} is not supported by the index')
+        bitset = self._all
+        for word in self._WORD_PATTERN.findall(literal) or ('',):
+            bitset &= self._get_term_bitset(word)
+            if not bitset:
+                break
+        return bitset
+
+    def _get_language_bitset(self, language: str) -> int:
+        extensions = self.LANGUAGE_EXTENSIONS.get(self.LANGUAGE_ALIASES.get(language, language))
+        if extensions is None:
+            raise ValueError(f'The extensions of the language {language} are not known')
+        bitset = 0
+        for extension in extensions:
+            bitset |= self._get_term_bitset(f'extension{self.QUALIFIER_SEPARATOR}{extension}')
+        return bitset
+
+    def evaluate(self, exp: sympy.Basic) -> int:
+        """The bitset of the documents matching the boolean expression"""
+        if isinstance(exp, sympy.Symbol):
+            return self.get_literal_bitset(exp.name)
+        if isinstance(exp, sympy.Not):
+            return self._all ^ self.evaluate(exp.args[0])
+        if isinstance(exp, sympy.And):
+            # the negated operands are subtracted at the end, so their complements are not built
+            bitset = self._all
+            negated: List[sympy.Basic] = []
+            for arg in exp.args:
+                if isinstance(arg, sympy.Not):
+                    negated.append(arg.args[0])
+                    continue
+                bitset &= self.evaluate(arg)
+                if not bitset:
+                    return 0
+            for arg in negated:
+                bitset &= ~self.evaluate(arg)
+            return bitset
+        if isinstance(exp, sympy.Or):
+            bitset = 0
+            for arg in exp.args:
+                bitset |= self.evaluate(arg)
+            return bitset
+        if exp == sympy.true:
+            return self._all
+        if exp == sympy.false:
+            return 0
+        raise TypeError(f'Unsupported expression {exp}')
+
+    def count(self, exp: sympy.Basic) -> int:
+        return bits_amount(self.evaluate(exp))
@@ -6,6 +6,7 @@ from lib.classes import WithLoggingAndExternalArguments
 from lib.classes.internal.middle_codes.middle_code import MiddleCode
 from lib.utilities.functions import quote
 from lib.utilities.logging import ExitCode, VerbosityLevel
+from lib.utilities.metrics import METRICS
 
 
 class SourceCode:
@@ -78,7 +79,8 @@ class Parser(WithLoggingAndExternalArguments):
         self._source_code = SourceCode(source, namespace)
         self._source_code.consume_leading_spaces()
         while self._source_code.current_char:
-            middle_code = self.parse()
+            with METRICS.time('parse_seconds'):
+                middle_code = self.parse()
             if self._source_code.current_char and not self._source_code.current_char.isspace():
                 self._parsing_critical(f'Extra characters in query {quote(middle_code.full_name)}')
             self._source_code.consume_leading_spaces()
@@ -0,0 +1,111 @@
+import heapq
+import random
+import statistics
+from typing import Tuple, Dict, Optional
+
+from lib.classes.internal.query_issuers.runtime_calibration import RuntimeCalibration
+
+
+class CapacitySimulator:
+    """
+    Discrete-event simulation of issuing a batch of requests, to predict its runtime for a given
+    amount of credentials (tokens), concurrency and cache hit ratio.
+
+    Each request waits for a free worker, out of `concurrency`, and for a token of the rate limit
+    shared by the credentials, which is simulated as the token bucket of `RateLimiter`, full at the
+    beginning. It then takes a latency drawn from the calibrated sample, and, with the calibrated
+    probability, exceeds the rate limit, so it is retried after the calibrated mean penalty.
+
+    The simulated runtimes are scaled by a correction factor: the median ratio between the runtimes
+    of the calibration runs and their simulated runtimes, which accounts for what is not simulated.
+    The ratio of each run is simulated once, with the calibration of the time, so a new run only
+    simulates that run.
+    """
+
+    DEFAULT_LATENCY = 1.
+    DEFAULT_RUNS = 20
+    # the percentiles of the simulated runtimes given as the estimated range
+    LOW_PERCENTILE = 10
+    HIGH_PERCENTILE = 90
+    # beyond it, the runtime of the remaining requests is extrapolated from the second half of the simulation
+    MAX_SIMULATED_REQUESTS = 20000
+
+    def __init__(self, calibration: RuntimeCalibration, runs: int = DEFAULT_RUNS, seed: int = 0):
+        self._calibration = calibration
+        self._runs = runs
+        self._seed = seed
+        self._run_ratios: Dict[Tuple[int, float, int, int, int], Optional[float]] = {}
+
+    def simulate(self, requests: int, tokens: int, limit: int, concurrency: int,
+                 cache_hit_ratio: float = 0, period: float = 60) -> Tuple[float, float]:
+        """
+        Gives the range of the estimated seconds to evaluate `requests` subqueries, of which the given
+        ratio is taken from the cache, with `tokens` credentials of `limit` requests per `period` seconds
+        """
+        to_issue = round(requests * (1 - cache_hit_ratio))
+        runtimes = sorted(self._simulate_runtime(to_issue, tokens, limit, concurrency, period, seed)
+                          for seed in range(self._seed, self._seed + self._runs))
+        factor = self._get_correction_factor()
+        return (factor * self._get_percentile(runtimes, self.LOW_PERCENTILE),
+                factor * self._get_percentile(runtimes, self.HIGH_PERCENTILE))
+
+    @staticmethod
+    def _get_percentile(values, percentile: float) -> float:
+        return values[min(len(values) - 1, int(len(values) * percentile / 100))]
+
+    def _get_correction_factor(self) -> float:
+        runs = self._calibration.get_runs()
+        ratios = []
+        for run in runs:
+            if run not in self._run_ratios:
+                self._run_ratios[run] = self._get_run_ratio(*run)
+            if self._run_ratios[run] is not None:
+                ratios.append(self._run_ratios[run])
+        if len(self._run_ratios) > len(runs):
+            # the runs aged out of the calibration
+            self._run_ratios = {run: self._run_ratios[run] for run in runs}
+        return statistics.median(ratios) if ratios else 1.
+
+    def _get_run_ratio(self, issued: int, seconds: float, tokens: int, limit: int,
+                       concurrency: int) -> Optional[float]:
+        """The ratio between the runtime of the run and its simulated runtime, or None if it takes no time"""
+        simulated = statistics.mean(self._simulate_runtime(issued, tokens, limit, concurrency, 60, seed)
+                                    for seed in range(self._seed, self._seed + self._runs))
+        return seconds / simulated if simulated > 0 else None
+
+    def _simulate_runtime(self, requests: int, tokens: int, limit: int, concurrency: int,
+                          period: float, seed: int) -> float:
+        if requests <= 0:
+            return 0.
+        rng = random.Random(seed)
+        latencies = self._calibration.latencies or [self.DEFAULT_LATENCY]
+        exceeded_ratio = self._calibration.get_rate_limit_exceeded_ratio()
+        penalty = self._calibration.get_rate_limit_mean_penalty()
+        capacity = max(tokens * limit, 1)
+        rate = capacity / period
+        bucket_tokens = float(capacity)
+        last_refill = 0.
+        workers = [0.] * max(concurrency, 1)
+        runtime = half_runtime = 0.
+        simulated = min(requests, self.MAX_SIMULATED_REQUESTS)
+        for i in range(simulated):
+            # the workers are taken in the order they are free, so the time does not go backwards
+            now = heapq.heappop(workers)
+            while True:
+                if now > last_refill:
+                    bucket_tokens = min(capacity, bucket_tokens + (now - last_refill) * rate)
+                    last_refill = now
+                bucket_tokens -= 1
+                if bucket_tokens < 0:
+                    now = last_refill + -bucket_tokens / rate
+                if rng.random() >= exceeded_ratio:
+                    break
+                now += penalty
+            end = now + rng.choice(latencies)
+            heapq.heappush(workers, end)
+            runtime = max(runtime, end)
+            if i + 1 == simulated // 2:
+                half_runtime = runtime
+        if simulated < requests:
+            runtime += (requests - simulated) * (runtime - half_runtime) / (simulated - simulated // 2)
+        return runtime
@@ -1,41 +1,137 @@
-import random
+import base64
+import json
+import threading
 import time
-from datetime import datetime, timedelta
-from typing import Tuple
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import Tuple, Sequence, Optional, List, Callable, Dict
 
-from github import Github, BadCredentialsException, GithubException, Rate
+import urllib3
+from github import BadCredentialsException, GithubException, RateLimitExceededException
 from urllib3 import Retry
 
+from lib.classes.internal.query_issuers.capacity_simulator import CapacitySimulator
 from lib.classes.internal.query_issuers.query_issuer import QueryIssuer
+from lib.classes.internal.query_issuers.rate_limiter import RateLimiter
+from lib.classes.internal.query_issuers.runtime_calibration import RuntimeCalibration
+from lib.classes.internal.translators.boolean_translator import BooleanOperators, BooleanTranslator
 from lib.utilities.logging import ExitCode
+from lib.utilities.metrics import METRICS
+
+
+class MeasuredRetry(Retry):
+    """Retry policy that records the retries and the seconds slept before them"""
+
+    def increment(self, *args, **kwargs) -> Retry:
+        """The retry is only counted if there is one, as the last attempt raises `MaxRetryError`"""
+        retry = Retry.increment(self, *args, **kwargs)
+        METRICS.increment('retries_total')
+        return retry
+
+    def sleep(self, response=None):
+        start = time.perf_counter()
+        Retry.sleep(self, response)
+        METRICS.increment('retry_sleep_seconds_total', time.perf_counter() - start)
+
+
+class GithubCountClient:
+    """
+    Client of the REST API that only gets the amount of results of the searches. Each search asks for
+    a page of a single result and only `total_count` and `incomplete_results` are read from it, instead
+    of getting a full page of results through a PaginatedList of PyGithub to read its `totalCount`.
+
+    The requests go through a pool of keep-alive connections, which accept gzip, shared by the clients
+    of all the credentials. As PyGithub does, the errors are raised as `GithubException`, and the rate
+    limit headers of the last response are kept.
+    """
+
+    def __init__(self, pool: urllib3.PoolManager, url: str, authorization: Optional[str]):
+        self._pool = pool
+        self._url = url.rstrip('/')
+        # the headers given to a request replace the ones of the pool
+        self._headers = dict(pool.headers, **({} if authorization is None else {'Authorization': authorization}))
+        self.rate_limiting = (-1, -1)
+        self.rate_limiting_resettime = 0
+        self.date: Optional[str] = None
+
+    def _get(self, path: str, fields: Optional[Dict[str, object]] = None) -> dict:
+        response = self._pool.request('GET', f'{self._url}{path}', fields=fields, headers=self._headers)
+        headers = response.headers
+        if 'X-RateLimit-Remaining' in headers:
+            self.rate_limiting = int(headers['X-RateLimit-Remaining']), int(headers['X-RateLimit-Limit'])
+            self.rate_limiting_resettime = int(headers['X-RateLimit-Reset'])
+        self.date = headers.get('Date', self.date)
+        try:
+            data = json.loads(response.data)
+        except ValueError:
+            data = {}
+        if response.status == 401:
+            raise BadCredentialsException(response.status, data, dict(headers))
+        if response.status in (403, 429) and (self.rate_limiting[0] == 0 or
+                                              'rate limit' in str(data.get('message', '')).lower()):
+            raise RateLimitExceededException(response.status, data, dict(headers))
+        if response.status >= 400:
+            raise GithubException(response.status, data, dict(headers))
+        return data
+
+    def search_count(self, query: str, search_type: str) -> Tuple[int, bool]:
+        """The amount of results of the search, and whether it timed out, so the amount may be incomplete"""
+        data = self._get(f'/search/{search_type}', {'q': query, 'per_page': 1})
+        return data['total_count'], data.get('incomplete_results', False)
+
+    def get_search_rate(self) -> dict:
+        return self._get('/rate_limit')['resources']['search']
+
+
+class GithubV3Account:
+    """A credential with its own client, which keeps its own rate limit headers, and its own rate limiter"""
+
+    def __init__(self, name: str, client: Optional[GithubCountClient], rate_limiter: RateLimiter):
+        self.name = name
+        self.client = client
+        self.rate_limiter = rate_limiter
+        self.in_flight = 0
+        self.healthy = True
 
 
 class GithubV3QueryIssuer(QueryIssuer):
     SEARCH_TYPE = {
-        'code': Github.search_code,
-        'commits': Github.search_commits,
-        'issues': Github.search_issues,
-        'repositories': Github.search_repositories,
-        'topics': Github.search_topics,
-        'users': Github.search_users,
+        search_type: partial(GithubCountClient.search_count, search_type=search_type)
+        for search_type in ('code', 'commits', 'issues', 'repositories', 'topics', 'users')
     }
     DEFAULT_SEARCH_TYPE = 'code'
+    # boolean operators evaluated by the server, besides the implicit AND and NOT, for each search type
+    SEARCH_TYPE_OPERATORS = {
+        'issues': BooleanOperators(disjunction=True, grouping=True),
+        'repositories': BooleanOperators(disjunction=True),
+    }
+    # maximum amount of NOT and OR operators in a query
+    LOGICAL_OPERATORS_MAX_AMOUNT = 5
+    # search requests per minute of an authenticated credential
+    AUTHENTICATED_LIMIT = 30
+    # seconds of the window of the search rate limit
+    RATE_LIMIT_PERIOD = 60
+    SINGLE_VALUED_QUALIFIERS = ('language', 'extension')
+    DEFAULT_POOL_SIZE = 10
 
     @classmethod
     def cast_to_search_type(cls, search_type: str):
         return cls.SEARCH_TYPE[search_type]
 
-    __DATE_FORMAT = '%a, %d %b %Y %H:%M:%S %Z'
+    _DATE_FORMAT = '%a, %d %b %Y %H:%M:%S %Z'
 
-    def __init__(self, user: str, passw: str, url: str,
-                 search_type: SEARCH_TYPE, query_max_length: int,
+    def __init__(self, credentials: Sequence[Tuple[Optional[str], Optional[str]]], url: str,
+                 search_type: Callable[[GithubCountClient, str], Tuple[int, bool]], query_max_length: int,
                  admit_long_query: bool,
                  total_retry: int, connect_retry: int,
                  read_retry: int, status_retry: int,
                  backoff_factor: float, backoff_max: int,
-                 waiting_factor: int, connect: bool):
-        self._user = user
-        self._passw = passw
+                 waiting_factor: int, connect: bool,
+                 calibration: Optional[RuntimeCalibration] = None,
+                 rate_limit_period: float = RATE_LIMIT_PERIOD,
+                 pool_size: int = DEFAULT_POOL_SIZE):
+        self._credentials = credentials
+        self._rate_limit_period = rate_limit_period
         self._url = url
         self._search_type = search_type
         self._query_max_length = query_max_length
@@ -48,39 +144,88 @@ class GithubV3QueryIssuer(QueryIssuer):
         self._backoff_max = backoff_max
         self._waiting_factor = waiting_factor
         self._connect = connect
+        self._pool_size = pool_size
+        self._pool: Optional[urllib3.PoolManager] = None
+        self._calibration = calibration or RuntimeCalibration()
+        self._capacity_simulator = CapacitySimulator(self._calibration)
+        self._accounts: List[GithubV3Account] = []
+        self._accounts_lock = threading.Lock()
+        self._server_time_offset = timedelta()
+        self._first_request_time: Optional[float] = None
+        self._responses = 0
         QueryIssuer.__init__(self)
 
     def _set_client(self):
+        """
+        Creates a client for each credential. The credentials rejected by the server are discarded.
+        Without credentials, a single client is created without authentication.
+        """
         if self._connect:
-            try:
-                retry = Retry(total=self._total_retry,
+            self._pool = self._get_pool()
+            credentials = self._credentials or [(None, None)]
+            for i, (user, passw) in enumerate(credentials, 1):
+                name = f'Credential {i}' + (f' ({user})' if passw is not None else '')
+                try:
+                    self._accounts.append(self._get_account(name, user, passw))
+                except BadCredentialsException as e:
+                    self._warning('Authentication failed', e, header=name)
+                except (GithubException, urllib3.exceptions.HTTPError) as e:
+                    self._connection_critical(e)
+            if not self._accounts:
+                self._authentication_critical('No valid credential')
+            self._delay = self._rate_limit_period / sum(account.rate_limiter.limit for account in self._accounts)
+            self._debug('Delay time', self._delay)
+        else:
+            self._delay = 6  # take the delay as if it is not authenticated
+            self._accounts.append(GithubV3Account('Anonymous', None, RateLimiter(int(60 / self._delay))))
+
+    def _get_retry(self, allowed_methods=Retry.DEFAULT_ALLOWED_METHODS) -> Retry:
+        """The retry policy of a client, which also retries the 403 of the secondary rate limits"""
+        retry = MeasuredRetry(total=self._total_retry,
                               connect=self._connect_retry,
                               read=self._read_retry,
                               redirect=False,
                               status=self._status_retry,
                               status_forcelist=[403],
+                              allowed_methods=allowed_methods,
                               backoff_factor=self._backoff_factor,
                               raise_on_status=False,
                               respect_retry_after_header=True)
-                retry.RETRY_AFTER_STATUS_CODES = retry.RETRY_AFTER_STATUS_CODES | {403}
-                retry.BACKOFF_MAX = self._backoff_max
-                self._debug('Creating client ...')
-                self._client = Github(login_or_token=self._user,
-                                      password=self._passw,
-                                      base_url=self._url,
-                                      retry=retry)
-                self._debug('Client created')
-                self._debug('Getting rate limit ...')
-                limit = self._client.get_rate_limit().search.limit
-                self._debug('Rate limit per minute', limit)
-                self._delay = 60 / limit
-                self._debug('Delay time', self._delay)
-            except BadCredentialsException as e:
-                self._authentication_critical(e)
-            except ConnectionError as e:
-                self._connection_critical(e)
-        else:
-            self._delay = 6  # take the delay as if it is not authenticated
+        retry.RETRY_AFTER_STATUS_CODES = retry.RETRY_AFTER_STATUS_CODES | {403}
+        retry.BACKOFF_MAX = self._backoff_max
+        return retry
+
+    def _get_pool(self, allowed_methods=Retry.DEFAULT_ALLOWED_METHODS) -> urllib3.PoolManager:
+        """
+        The pool of keep-alive connections shared by the clients, which keeps up to `pool_size` of them
+        per host, as many as the requests in flight
+        """
+        return urllib3.PoolManager(maxsize=self._pool_size,
+                                   retries=self._get_retry(allowed_methods),
+                                   headers={'Accept': 'application/vnd.github+json',
+                                            'Accept-Encoding': 'gzip',
+                                            'User-Agent': 'quantityer'})
+
+    @staticmethod
+    def _get_authorization(user: Optional[str], passw: Optional[str]) -> Optional[str]:
+        """The Authorization header of a credential: a token if there is no password, or else basic"""
+        if user is None:
+            return None
+        if passw is None:
+            return f'token {user}'
+        return 'Basic ' + base64.b64encode(f'{user}:{passw}'.encode()).decode()
+
+    def _get_account(self, name: str, user: Optional[str], passw: Optional[str]) -> GithubV3Account:
+        client = GithubCountClient(self._pool, self._url, self._get_authorization(user, passw))
+        self._debug('Getting rate limit ...', header=name)
+        rate = client.get_search_rate()
+        self._debug('Rate limit per minute', rate['limit'], header=name)
+        if not self._accounts and client.date is not None:
+            self._server_time_offset = (datetime.strptime(client.date, self._DATE_FORMAT) - self._get_utc_now())
+        rate_limiter = RateLimiter(rate['limit'], self._rate_limit_period, rate['remaining'])
+        reset = datetime.fromtimestamp(rate['reset'], timezone.utc).replace(tzinfo=None)
+        rate_limiter.update(rate['remaining'], rate['limit'], self._get_reset_in(reset))
+        return GithubV3Account(name, client, rate_limiter)
 
     def issue(self, name: str, query: str) -> Tuple[bool, int]:
         def verbose(func, message, arg=None):
@@ -90,30 +235,56 @@ class GithubV3QueryIssuer(QueryIssuer):
         if not self.check_query_restrictions(query, name):
             verbose(self._debug, f'Subquery discarded')
             return False, 0
-        delay = self._get_waiting_time()
-        verbose(self._debug, f'Delaying {delay:.2f} seconds ...')
-        time.sleep(delay)
-        x = self._client.get_rate_limit().search
-        while x.remaining == 0:
-            verbose(self._debug, 'Rate limit reached')
-            delay = self._get_reset_time(x, name)
-            verbose(self._debug, f'Waiting {delay.seconds} seconds ...')
-            time.sleep(delay.seconds)
-            x = self._client.get_rate_limit().search
-        verbose(self._debug, f'Issuing ...')
-        try:
-            r = self._search_type(self._client, query)
+        while True:
+            account, delay = self._reserve_account()
             try:
-                _ = r[0]  # <- must be done in order to get the actual totalCount
-            except IndexError:
-                pass
-            return True, r.totalCount
-        except GithubException as e:
-            verbose(self._query_critical, f'Error while issuing', e)
+                if delay > 0:
+                    METRICS.observe('rate_limit_sleep_seconds', delay)
+                    verbose(self._debug, f'Rate limit reached. Waiting {delay:.2f} seconds ...')
+                    time.sleep(delay)
+                verbose(self._debug, f'Issuing with {account.name} ...')
+                METRICS.increment('requests_total')
+                start = time.perf_counter()
+                total_count, incomplete_results = self._search_type(account.client, query)
+                latency = time.perf_counter() - start
+                METRICS.observe('request_seconds', latency)
+                self._calibration.add_request(latency)
+                self._update_rate_limiter(account)
+                if incomplete_results:
+                    verbose(self._warning, f'Search timed out. The results amount may be incomplete')
+                    METRICS.increment('incomplete_results_total')
+                return True, total_count
+            except BadCredentialsException as e:
+                verbose(self._warning, f'{account.name} rejected. It will not be used anymore', e)
+                account.healthy = False
+            except RateLimitExceededException as e:
+                verbose(self._warning, f'{account.name} rate limit exceeded', e)
+                METRICS.increment('rate_limit_exceeded_total')
+                self._update_rate_limiter(account, exceeded=True)
+            except GithubException as e:
+                verbose(self._query_critical, f'Error while issuing', e)
+            except urllib3.exceptions.HTTPError as e:
+                self._connection_critical(e)
+            finally:
+                with self._accounts_lock:
+                    account.in_flight -= 1
+
+    def _reserve_account(self) -> Tuple[GithubV3Account, float]:
+        """
+        Takes a token from the healthy account that would give it the soonest, or the one with
+        less queries in flight if several would give it as soon. The time to wait for it is also given.
+        """
+        with self._accounts_lock:
+            accounts = [account for account in self._accounts if account.healthy]
+            if not accounts:
+                self._authentication_critical('All the credentials have been rejected')
+            account = min(accounts, key=lambda a: (a.rate_limiter.get_wait(), a.in_flight))
+            account.in_flight += 1
+            return account, account.rate_limiter.reserve()
 
     def check_query_restrictions(self, query: str, name: str) -> bool:
         query_len = len(query)
-        logical_not_amount = query.count('NOT ')
+        logical_operators_amount = self._get_logical_operators_amount(query)
         if query_len > self._query_max_length:
             if self._admit_long_query:
                 self._warning(f'Maximum allowed length of {self._query_max_length} exceeded. '
@@ -124,33 +295,105 @@ class GithubV3QueryIssuer(QueryIssuer):
                 self._query_critical(f'Maximum allowed length of {self._query_max_length} exceeded. '
                                      f'Subquery length',
                                      arg=query_len, header=name)
-        elif logical_not_amount > 5:
+        elif logical_operators_amount > self.LOGICAL_OPERATORS_MAX_AMOUNT:
             if self._admit_long_query:
-                self._warning(f'Maximum allowed logical NOT amount of 5 exceeded. '
-                              f'Logical NOT amount',
-                              arg=logical_not_amount, header=name)
+                self._warning(f'Maximum allowed logical operators amount of {self.LOGICAL_OPERATORS_MAX_AMOUNT} '
+                              f'exceeded. Logical operators amount',
+                              arg=logical_operators_amount, header=name)
                 return False
             else:
-                self._query_critical(f'Maximum allowed logical NOT amount of 5 exceeded. '
-                                     f'Logical NOT amount',
-                                     arg=logical_not_amount, header=name)
+                self._query_critical(f'Maximum allowed logical operators amount of '
+                                     f'{self.LOGICAL_OPERATORS_MAX_AMOUNT} exceeded. Logical operators amount',
+                                     arg=logical_operators_amount, header=name)
         else:
             return True
 
-    def get_estimated_time(self, subqueries_total: int) -> Tuple[str, str]:
-        return (str(timedelta(seconds=subqueries_total * self._delay)),
-                str(timedelta(seconds=subqueries_total * self._delay * self._waiting_factor)))
+    def satisfies_query_restrictions(self, query: str) -> bool:
+        return (len(query) <= self._query_max_length and
+                self._get_logical_operators_amount(query) <= self.LOGICAL_OPERATORS_MAX_AMOUNT)
+
+    @staticmethod
+    def _get_logical_operators_amount(query: str) -> int:
+        return query.count('NOT ') + query.count(BooleanTranslator.OR)
+
+    def get_estimated_time(self, subqueries_total: int, concurrency: int = 1) -> Tuple[str, str]:
+        """
+        Simulated with the accounts in use (see `CapacitySimulator`) once there is calibration.
+        Before, it is given by the delay between queries, multiplied by the waiting factor for the maximum
+        """
+        if self._calibration.is_empty():
+            return (str(timedelta(seconds=subqueries_total * self._delay)),
+                    str(timedelta(seconds=subqueries_total * self._delay * self._waiting_factor)))
+        accounts = [account for account in self._accounts if account.healthy]
+        return self._get_simulated_time(subqueries_total, len(accounts), self._get_limit_per_minute(accounts),
+                                        concurrency, 0)
+
+    def get_capacity_estimated_time(self, subqueries_total: int, tokens: int, concurrency: int,
+                                    cache_hit_ratio: float) -> Tuple[str, str]:
+        return self._get_simulated_time(subqueries_total, tokens, self.AUTHENTICATED_LIMIT, concurrency,
+                                        cache_hit_ratio)
+
+    def _get_simulated_time(self, subqueries_total: int, tokens: int, limit: int, concurrency: int,
+                            cache_hit_ratio: float) -> Tuple[str, str]:
+        low, high = self._capacity_simulator.simulate(subqueries_total, tokens, limit, concurrency, cache_hit_ratio)
+        return str(timedelta(seconds=round(low))), str(timedelta(seconds=round(high)))
+
+    def add_run(self, issued_subqueries: int, seconds: float, concurrency: int):
+        accounts = [account for account in self._accounts if account.healthy]
+        self._calibration.add_run(issued_subqueries, seconds, len(accounts), self._get_limit_per_minute(accounts),
+                                  concurrency)
+
+    def close(self):
+        self._calibration.save()
+
+    def _get_limit_per_minute(self, accounts: Sequence[GithubV3Account]) -> int:
+        """The mean rate limit of the given accounts, in requests per minute"""
+        limit = sum(account.rate_limiter.limit for account in accounts) / max(len(accounts), 1)
+        return round(limit * 60 / self._rate_limit_period)
 
     def get_server_current_datetime(self) -> datetime:
-        self._debug(f'Getting server current datetime ...')
-        return datetime.strptime(self._client.get_rate_limit().raw_headers['date'], self.__DATE_FORMAT)
+        """Estimated from the local clock and the server date taken when the client was created"""
+        return self._get_utc_now() + self._server_time_offset
+
+    def _update_rate_limiter(self, account: GithubV3Account, exceeded: bool = False):
+        """
+        Syncs the rate limiter of the account with the rate limit headers of its last response. If the
+        rate limit was exceeded, no query is taken as remaining, and the reset is not before the backoff.
+        """
+        remaining, limit = account.client.rate_limiting
+        reset = datetime.fromtimestamp(account.client.rate_limiting_resettime, timezone.utc).replace(tzinfo=None)
+        reset_in = self._get_reset_in(reset)
+        if exceeded:
+            remaining, reset_in = 0, max(reset_in, self._backoff_factor)
+            self._calibration.add_rate_limit_exceeded(reset_in)
+        account.rate_limiter.update(remaining, limit, reset_in)
+        METRICS.set('rate_limit_remaining', remaining, account=account.name)
+        METRICS.set('rate_limit_limit', limit, account=account.name)
+        self._update_utilization()
+
+    def _update_utilization(self):
+        """
+        Records the requests issued per second since the first one, over the requests per second allowed
+        by the rate limits of the healthy accounts
+        """
+        with self._accounts_lock:
+            now = time.monotonic()
+            if self._first_request_time is None:
+                self._first_request_time = now
+            self._responses += 1
+            allowed = (sum(account.rate_limiter.limit for account in self._accounts if account.healthy) /
+                       self._rate_limit_period)
+            elapsed = now - self._first_request_time
+        if elapsed > 0 and allowed > 0:
+            METRICS.set('rate_limit_utilization', (self._responses - 1) / elapsed / allowed)
 
-    def _get_waiting_time(self):
-        return random.triangular(self._delay, self._delay * self._waiting_factor, self._delay)
+    def _get_reset_in(self, reset: datetime) -> float:
+        """The seconds from the server current datetime to the given reset datetime"""
+        return (reset - self.get_server_current_datetime()).total_seconds()
 
-    def _get_reset_time(self, x: Rate, name: str):
-        self._debug(f'Getting reset time ...', header=name)
-        return x.reset - datetime.strptime(x.raw_headers['date'], self.__DATE_FORMAT)
+    @staticmethod
+    def _get_utc_now() -> datetime:
+        return datetime.now(timezone.utc).replace(tzinfo=None)
 
     def _connection_critical(self, error):
         self._critical(f'Connection error', ExitCode.CONNECTION, error)
@@ -0,0 +1,319 @@
+import base64
+import json
+import math
+import threading
+import time
+from datetime import datetime
+from typing import Tuple, Sequence, Optional, List, Dict
+
+import urllib3
+from urllib3 import Retry
+
+from lib.classes.internal.query_issuers.githubv3_query_issuer import GithubV3QueryIssuer
+from lib.classes.internal.query_issuers.rate_limiter import RateLimiter
+from lib.classes.internal.query_issuers.runtime_calibration import RuntimeCalibration
+from lib.utilities.metrics import METRICS
+
+
+class GithubV4Account:
+    """A credential, with the value of its Authorization header, and its own rate limiter of points"""
+
+    def __init__(self, name: str, authorization: Optional[str], rate_limiter: RateLimiter):
+        self.name = name
+        self.authorization = authorization
+        self.rate_limiter = rate_limiter
+        self.in_flight = 0
+        self.healthy = True
+
+
+class GithubV4Search:
+    """A subquery waiting to be issued in a batch, and its results once the batch is answered"""
+
+    def __init__(self, name: str, query: str):
+        self.name = name
+        self.query = query
+        self.taken = False
+        self.results: Tuple[bool, int] = (False, 0)
+        self.done = threading.Event()
+
+
+class GithubV4QueryIssuer(GithubV3QueryIssuer):
+    """
+    Query issuer of the GitHub GraphQL API (v4), which packs many searches into a single request, each
+    one as an aliased `search` field that only asks for the amount of results.
+
+    The subqueries issued concurrently are batched: the thread whose subquery fills a batch of
+    `batch_size` issues it, and a subquery not in a full batch after `batch_linger` seconds is issued
+    with the ones pending by then. So the batches are as large as the concurrency of the engine allows.
+    The size of a batch is bounded by the nodes that a single request can ask for.
+
+    The GraphQL rate limit is of points per hour instead of requests. Each batch costs one point per
+    hundred nodes asked for, and at least one, which is taken from the rate limiter of an account before
+    issuing it. The rate limiter is synced with the `rateLimit` field asked for along the searches.
+    """
+
+    # the GraphQL type of the search and the field of its amount of results, for each search type
+    SEARCH_TYPE = {
+        'discussions': ('DISCUSSION', 'discussionCount'),
+        'issues': ('ISSUE', 'issueCount'),
+        'repositories': ('REPOSITORY', 'repositoryCount'),
+        'users': ('USER', 'userCount'),
+    }
+    DEFAULT_SEARCH_TYPE = 'issues'
+    # points per hour of an authenticated credential
+    POINTS_LIMIT = 5000
+    RATE_LIMIT_PERIOD = 3600
+    AUTHENTICATED_LIMIT = round(POINTS_LIMIT * 60 / RATE_LIMIT_PERIOD)
+    # nodes that a single request can ask for, and nodes per point of its cost
+    NODE_LIMIT = 500000
+    NODES_PER_POINT = 100
+    # a search asks for its first result to get its amount, so each one is a node
+    NODES_PER_SEARCH = 1
+    DEFAULT_BATCH_SIZE = 50
+    DEFAULT_BATCH_LINGER = 0.01
+    RATE_LIMIT_QUERY = 'query { rateLimit { limit remaining resetAt } }'
+    _RESET_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+    def __init__(self, credentials: Sequence[Tuple[Optional[str], Optional[str]]], url: str,
+                 search_type: Tuple[str, str], query_max_length: int,
+                 admit_long_query: bool,
+                 total_retry: int, connect_retry: int,
+                 read_retry: int, status_retry: int,
+                 backoff_factor: float, backoff_max: int,
+                 waiting_factor: int, connect: bool,
+                 calibration: Optional[RuntimeCalibration] = None,
+                 rate_limit_period: float = RATE_LIMIT_PERIOD,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 batch_linger: float = DEFAULT_BATCH_LINGER):
+        self._batch_size = max(1, min(batch_size, self.NODE_LIMIT // self.NODES_PER_SEARCH))
+        self._batch_linger = batch_linger
+        self._pending: List[GithubV4Search] = []
+        self._pending_lock = threading.Lock()
+        self._batches = 0
+        self._run_batches = 0
+        GithubV3QueryIssuer.__init__(self, credentials, url, search_type, query_max_length, admit_long_query,
+                                     total_retry, connect_retry, read_retry, status_retry, backoff_factor,
+                                     backoff_max, waiting_factor, connect, calibration, rate_limit_period)
+
+    @property
+    def batch_size(self) -> int:
+        return self._batch_size
+
+    def _set_client(self):
+        """
+        Verifies each credential with a query of its rate limit. The credentials rejected by the server
+        are discarded. The GraphQL API is not available without authentication.
+        """
+        if self._connect:
+            if not self._credentials:
+                self._authentication_critical('The GraphQL API requires a credential')
+            # the searches are read-only, so the requests are retried even though they are POST
+            self._pool = self._get_pool(Retry.DEFAULT_ALLOWED_METHODS | {'POST'})
+            for i, (user, passw) in enumerate(self._credentials, 1):
+                name = f'Credential {i}' + (f' ({user})' if passw is not None else '')
+                account = self._get_account(name, user, passw)
+                if account is not None:
+                    self._accounts.append(account)
+            if not self._accounts:
+                self._authentication_critical('No valid credential')
+            self._delay = self._rate_limit_period / sum(account.rate_limiter.limit for account in self._accounts)
+            self._debug('Delay time per batch', self._delay)
+        else:
+            self._delay = self._rate_limit_period / self.POINTS_LIMIT
+            self._accounts.append(GithubV4Account('Anonymous', None,
+                                                  RateLimiter(self.POINTS_LIMIT, self._rate_limit_period)))
+
+    def _get_account(self, name: str, user: Optional[str], passw: Optional[str]) -> Optional[GithubV4Account]:
+        if passw is None:
+            authorization = f'bearer {user}'
+        else:
+            authorization = 'Basic ' + base64.b64encode(f'{user}:{passw}'.encode()).decode()
+        self._debug('Getting rate limit ...', header=name)
+        try:
+            response = self._post(self.RATE_LIMIT_QUERY, {}, authorization)
+        except urllib3.exceptions.HTTPError as e:
+            self._connection_critical(e)
+        data = self._get_data(response)
+        rate_limit = (data.get('data') or {}).get('rateLimit')
+        if response.status != 200 or rate_limit is None:
+            self._warning('Authentication failed', data.get('message') or data.get('errors') or response.status,
+                          header=name)
+            return None
+        self._debug('Rate limit per hour', rate_limit['limit'], header=name)
+        if not self._accounts and 'date' in response.headers:
+            self._server_time_offset = (datetime.strptime(response.headers['date'], self._DATE_FORMAT) -
+                                        self._get_utc_now())
+        rate_limiter = RateLimiter(rate_limit['limit'], self._rate_limit_period, rate_limit['remaining'])
+        account = GithubV4Account(name, authorization, rate_limiter)
+        self._update_rate_limiter(account, rate_limit)
+        return account
+
+    def _post(self, document: str, variables: Dict[str, str], authorization: str) -> urllib3.HTTPResponse:
+        return self._pool.request('POST', f'{self._url.rstrip("/")}/graphql',
+                                  body=json.dumps({'query': document, 'variables': variables}).encode(),
+                                  headers={**self._pool.headers, 'Authorization': authorization,
+                                           'Content-Type': 'application/json'})
+
+    @staticmethod
+    def _get_data(response: urllib3.HTTPResponse) -> dict:
+        try:
+            data = json.loads(response.data)
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def issue(self, name: str, query: str) -> Tuple[bool, int]:
+        self._debug('Getting results amount ...', header=name)
+        if not self.check_query_restrictions(query, name):
+            self._debug('Subquery discarded', header=name)
+            return False, 0
+        search = GithubV4Search(name, query)
+        with self._pending_lock:
+            self._pending.append(search)
+            batch = self._take_pending() if len(self._pending) >= self._batch_size else None
+        if batch is None and not search.done.wait(self._batch_linger):
+            with self._pending_lock:
+                batch = None if search.taken else self._take_pending()
+        if batch is not None:
+            try:
+                self._issue_batch(batch)
+            finally:
+                for pending_search in batch:
+                    pending_search.done.set()
+        search.done.wait()
+        return search.results
+
+    def _take_pending(self) -> List[GithubV4Search]:
+        batch, self._pending = self._pending[:self._batch_size], self._pending[self._batch_size:]
+        for search in batch:
+            search.taken = True
+        return batch
+
+    def get_batch_document(self, batch: Sequence[GithubV4Search]) -> Tuple[str, Dict[str, str]]:
+        """
+        The GraphQL document of the batch, with an aliased search for each subquery, and its variables,
+        the subqueries, so they are not escaped into the document
+        """
+        search_type, count_field = self._search_type
+        variables = {f'q{i}': search.query for i, search in enumerate(batch)}
+        declarations = ', '.join(f'${variable}: String!' for variable in variables)
+        searches = ' '.join(f's{i}: search(query: $q{i}, type: {search_type}, first: 1) {{ {count_field} }}'
+                            for i in range(len(batch)))
+        return f'query({declarations}) {{ rateLimit {{ cost limit remaining resetAt }} {searches} }}', variables
+
+    def get_batch_cost(self, size: int) -> int:
+        """The points that a batch of the given amount of subqueries costs"""
+        return max(1, math.ceil(size * self.NODES_PER_SEARCH / self.NODES_PER_POINT))
+
+    def _issue_batch(self, batch: Sequence[GithubV4Search]):
+        header = batch[0].name if len(batch) == 1 else f'{batch[0].name} (+{len(batch) - 1})'
+        document, variables = self.get_batch_document(batch)
+        cost = self.get_batch_cost(len(batch))
+        METRICS.increment('graphql_batches_total')
+        METRICS.increment('graphql_batched_subqueries_total', len(batch))
+        with self._accounts_lock:
+            self._batches += 1
+        while True:
+            account, delay = self._reserve_account(cost)
+            try:
+                if delay > 0:
+                    METRICS.observe('rate_limit_sleep_seconds', delay)
+                    self._debug(f'Rate limit reached. Waiting {delay:.2f} seconds ...', header=header)
+                    time.sleep(delay)
+                self._debug(f'Issuing batch of {len(batch)} with {account.name} ...', header=header)
+                METRICS.increment('requests_total')
+                start = time.perf_counter()
+                response = self._post(document, variables, account.authorization)
+                latency = time.perf_counter() - start
+                METRICS.observe('request_seconds', latency)
+                self._calibration.add_request(latency)
+                data = self._get_data(response)
+                errors = data.get('errors') or []
+                if response.status == 401:
+                    self._warning(f'{account.name} rejected. It will not be used anymore', data.get('message'),
+                                  header=header)
+                    account.healthy = False
+                elif response.status == 403 or any(error.get('type') == 'RATE_LIMITED' for error in errors):
+                    self._warning(f'{account.name} rate limit exceeded', data.get('message') or errors,
+                                  header=header)
+                    METRICS.increment('rate_limit_exceeded_total')
+                    self._update_rate_limiter(account, (data.get('data') or {}).get('rateLimit'), exceeded=True)
+                elif response.status != 200 or not isinstance(data.get('data'), dict):
+                    self._query_critical(f'Error while issuing', data.get('message') or errors or response.status,
+                                         header=header)
+                else:
+                    self._update_rate_limiter(account, data['data'].get('rateLimit'))
+                    self._set_batch_results(batch, data['data'], errors)
+                    return
+            except urllib3.exceptions.HTTPError as e:
+                self._connection_critical(e)
+            finally:
+                with self._accounts_lock:
+                    account.in_flight -= 1
+
+    def _set_batch_results(self, batch: Sequence[GithubV4Search], data: dict, errors: Sequence[dict]):
+        """Sets the amount of each search answered. The ones with errors are given as not issued"""
+        _, count_field = self._search_type
+        aliases_errors = {error['path'][0]: error for error in errors if error.get('path')}
+        for i, search in enumerate(batch):
+            alias = f's{i}'
+            results = data.get(alias)
+            if alias in aliases_errors or not results or count_field not in results:
+                self._warning('Error while issuing', aliases_errors.get(alias, {}).get('message'),
+                              header=search.name)
+                continue
+            search.results = True, results[count_field]
+
+    def _reserve_account(self, cost: int = 1) -> Tuple[GithubV4Account, float]:
+        with self._accounts_lock:
+            accounts = [account for account in self._accounts if account.healthy]
+            if not accounts:
+                self._authentication_critical('All the credentials have been rejected')
+            account = min(accounts, key=lambda a: (a.rate_limiter.get_wait(), a.in_flight))
+            account.in_flight += 1
+            return account, account.rate_limiter.reserve(cost)
+
+    def _update_rate_limiter(self, account: GithubV4Account, rate_limit: Optional[dict] = None,
+                             exceeded: bool = False):
+        """
+        Syncs the rate limiter of the account with the `rateLimit` field of its last response, if given.
+        If the rate limit was exceeded, no point is taken as remaining, and the reset is not before the
+        backoff.
+        """
+        if rate_limit is None:
+            if not exceeded:
+                return
+            remaining, limit, reset_in = 0, 0, 0.
+        else:
+            remaining, limit = rate_limit['remaining'], rate_limit['limit']
+            reset_in = self._get_reset_in(datetime.strptime(rate_limit['resetAt'], self._RESET_FORMAT))
+        if exceeded:
+            remaining, reset_in = 0, max(reset_in, self._backoff_factor)
+            self._calibration.add_rate_limit_exceeded(reset_in)
+        account.rate_limiter.update(remaining, limit, reset_in)
+        METRICS.set('rate_limit_remaining', remaining, account=account.name)
+        METRICS.set('rate_limit_limit', account.rate_limiter.limit, account=account.name)
+
+    def _get_batches(self, subqueries_total: int) -> int:
+        return math.ceil(subqueries_total / self._batch_size)
+
+    def _get_batches_concurrency(self, concurrency: int) -> int:
+        """The batches in flight when the given amount of subqueries are"""
+        return max(1, concurrency // self._batch_size)
+
+    def get_estimated_time(self, subqueries_total: int, concurrency: int = 1) -> Tuple[str, str]:
+        """Estimated as by `GithubV3QueryIssuer` with each batch as a request"""
+        return GithubV3QueryIssuer.get_estimated_time(self, self._get_batches(subqueries_total),
+                                                      self._get_batches_concurrency(concurrency))
+
+    def get_capacity_estimated_time(self, subqueries_total: int, tokens: int, concurrency: int,
+                                    cache_hit_ratio: float) -> Tuple[str, str]:
+        return GithubV3QueryIssuer.get_capacity_estimated_time(self, self._get_batches(subqueries_total), tokens,
+                                                               self._get_batches_concurrency(concurrency),
+                                                               cache_hit_ratio)
+
+    def add_run(self, issued_subqueries: int, seconds: float, concurrency: int):
+        """The run is calibrated with the batches issued since the last one as its requests"""
+        with self._accounts_lock:
+            batches, self._run_batches = self._batches - self._run_batches, self._batches
+        GithubV3QueryIssuer.add_run(self, batches, seconds, self._get_batches_concurrency(concurrency))
@@ -24,7 +24,28 @@ class QueryIssuer(WithLogging):
         pass
 
     @abstractmethod
-    def get_estimated_time(self, subqueries_total: int) -> bool:
+    def satisfies_query_restrictions(self, query: str) -> bool:
+        """Same as `check_query_restrictions` but without logging or exiting"""
+        pass
+
+    @abstractmethod
+    def get_estimated_time(self, subqueries_total: int, concurrency: int = 1) -> Tuple[str, str]:
+        pass
+
+    def get_capacity_estimated_time(self, subqueries_total: int, tokens: int, concurrency: int,
+                                    cache_hit_ratio: float) -> Tuple[str, str]:
+        """
+        The estimated time to evaluate the subqueries with the given amount of credentials, concurrency
+        and ratio of subqueries taken from the cache, to plan the capacity of a run
+        """
+        return self.get_estimated_time(round(subqueries_total * (1 - cache_hit_ratio)), concurrency)
+
+    def add_run(self, issued_subqueries: int, seconds: float, concurrency: int):
+        """Called after evaluating a query, with the subqueries issued and the seconds taken, to calibrate"""
+        pass
+
+    def close(self):
+        """Called once all the queries are evaluated"""
         pass
 
     @abstractmethod
@@ -0,0 +1,74 @@
+import threading
+import time
+from typing import Optional
+
+
+class RateLimiter:
+    """
+    Token bucket shared by the threads issuing queries. It holds up to `limit` tokens, refilled
+    continuously at `limit` tokens per `period` seconds, and each query takes one of them, or the ones
+    it costs.
+
+    The bucket is kept in sync with the rate limit reported by the server (see `update`). When the
+    server reports that no query remains, the refill is postponed until the reported reset time,
+    when the bucket is full again.
+    """
+
+    def __init__(self, limit: int, period: float = 60, remaining: Optional[int] = None):
+        self._limit = limit
+        self._period = period
+        self._tokens = float(limit if remaining is None else remaining)
+        # it is in the future while waiting for the reset of the server rate limit
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    def _refill(self, now: float):
+        self._tokens = min(self._limit, self._tokens + (now - self._last_refill) * self._limit / self._period)
+        self._last_refill = now
+
+    def reserve(self, tokens: int = 1) -> float:
+        """
+        Takes the given tokens and gives the seconds to wait before using them, which are 0 unless the
+        bucket is empty. The tokens taken before they are refilled are owed, so the waits of several
+        threads are spaced.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now > self._last_refill:
+                self._refill(now)
+            self._tokens -= tokens
+            return self._get_wait(now, self._tokens)
+
+    def get_wait(self) -> float:
+        """The seconds to wait for the next token, without taking it"""
+        with self._lock:
+            now = time.monotonic()
+            if now > self._last_refill:
+                self._refill(now)
+            return self._get_wait(now, self._tokens - 1)
+
+    def _get_wait(self, now: float, tokens: float) -> float:
+        """The seconds to wait until the given tokens are not owed"""
+        return max(self._last_refill - now, 0) + max(-tokens * self._period / self._limit, 0)
+
+    def update(self, remaining: int, limit: int, reset_in: float):
+        """
+        Receives the rate limit reported by the server: the queries `remaining` out of `limit`
+        until the window is reset in `reset_in` seconds.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if limit > 0:
+                self._limit = limit
+            if self._last_refill > now:
+                return
+            self._refill(now)
+            if remaining <= 0 < reset_in:
+                self._tokens = self._limit + min(self._tokens, 0)
+                self._last_refill = now + reset_in
+            else:
+                self._tokens = min(self._tokens, remaining)
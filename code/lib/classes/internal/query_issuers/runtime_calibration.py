@@ -0,0 +1,134 @@
+import json
+import os
+import random
+import re
+import threading
+from pathlib import Path
+from typing import Optional, List, Tuple
+
+from lib.utilities.functions import write_atomically
+from lib.utilities.logging import ExitCode
+from lib.utilities.logging.with_logging import WithLogging
+
+
+class RuntimeCalibration(WithLogging):
+    """
+    Measurements of the requests actually issued, to calibrate the estimated runtimes (see
+    `CapacitySimulator`): a sample of the request latencies, the rate limit exceeded events with the
+    seconds waited after them, and the observed runs, each one as the requests issued, the seconds
+    taken, the credentials used, their rate limit per minute and the concurrency.
+
+    The measurements are kept in a JSON file, if given, so they are accumulated between runs, with only
+    the last `MAX_RUNS` runs. The runs reported by previous outputs may be added too (see `add_output`),
+    but they are not kept in the file, as they would be added again.
+    """
+
+    MAX_LATENCIES = 10000
+    MAX_RUNS = 100
+    # so a simulated request is not retried forever after a calibration with only rate limit exceeded events
+    MAX_RATE_LIMIT_EXCEEDED_RATIO = 0.99
+    OUTPUT_FILE_EXT = '.out'
+    # the runs reported in outputs were made with a single authenticated credential without concurrency
+    OUTPUT_TOKENS = 1
+    OUTPUT_LIMIT = 30
+    OUTPUT_CONCURRENCY = 1
+
+    _ISSUED_PATTERN = re.compile(r'^\s*Issued:\s*(\d+)', re.MULTILINE)
+    _RUNTIME_PATTERN = re.compile(r'^\s*Runtime:\s*(?:(\d+) days?, )?(\d+):(\d+):(\d+(?:\.\d+)?)', re.MULTILINE)
+
+    def __init__(self, filename: Optional[str] = None):
+        WithLogging.__init__(self)
+        self._filename = filename
+        self._lock = threading.Lock()
+        self._random = random.Random(0)
+        self.latencies: List[float] = []
+        self.requests = 0
+        self.rate_limit_exceeded = 0
+        self.rate_limit_penalty = 0.
+        self.runs: List[Tuple[int, float, int, int, int]] = []
+        self._output_runs: List[Tuple[int, float, int, int, int]] = []
+        if filename is not None and os.path.exists(filename):
+            try:
+                with open(filename) as file:
+                    data = json.load(file)
+                self.latencies = data['latencies']
+                self.requests = data['requests']
+                self.rate_limit_exceeded = data['rate_limit_exceeded']
+                self.rate_limit_penalty = data['rate_limit_penalty']
+                self.runs = [tuple(run) for run in data['runs'][-self.MAX_RUNS:]]
+            except (IOError, ValueError, KeyError, TypeError) as e:
+                self._critical('Error while loading calibration', ExitCode.FILE_ERROR, e)
+            self._debug('Calibration loaded. Requests amount', self.requests)
+
+    def is_empty(self) -> bool:
+        return not self.latencies and not self.get_runs()
+
+    def get_runs(self) -> List[Tuple[int, float, int, int, int]]:
+        return self.runs + self._output_runs
+
+    def add_request(self, latency: float):
+        """Keeps a uniform sample of the latencies of all the requests (reservoir sampling)"""
+        with self._lock:
+            self.requests += 1
+            if len(self.latencies) < self.MAX_LATENCIES:
+                self.latencies.append(latency)
+            else:
+                i = self._random.randrange(self.requests)
+                if i < self.MAX_LATENCIES:
+                    self.latencies[i] = latency
+
+    def add_rate_limit_exceeded(self, penalty: float):
+        with self._lock:
+            self.rate_limit_exceeded += 1
+            self.rate_limit_penalty += max(penalty, 0)
+
+    def add_run(self, issued_subqueries: int, seconds: float, tokens: int, limit: int, concurrency: int):
+        if issued_subqueries > 0:
+            with self._lock:
+                self.runs.append((issued_subqueries, seconds, tokens, limit, concurrency))
+                del self.runs[:-self.MAX_RUNS]
+
+    def add_output(self, path: Path):
+        """Adds the runs reported in the output file, or in the output files in the directory, given"""
+        paths = sorted(path.glob(f'*{self.OUTPUT_FILE_EXT}')) if path.is_dir() else [path]
+        for output_path in paths:
+            try:
+                text = output_path.read_text()
+            except IOError as e:
+                self._critical('Error while reading output', ExitCode.FILE_ERROR, e)
+            runs = 0
+            for block in text.split('Results for query')[1:]:
+                issued = self._ISSUED_PATTERN.search(block)
+                runtime = self._RUNTIME_PATTERN.search(block)
+                if issued is None or runtime is None:
+                    continue
+                days, hours, minutes, seconds = runtime.groups()
+                self._output_runs.append((int(issued.group(1)),
+                                          int(days or 0) * 86400 + int(hours) * 3600 + int(minutes) * 60 +
+                                          float(seconds),
+                                          self.OUTPUT_TOKENS, self.OUTPUT_LIMIT, self.OUTPUT_CONCURRENCY))
+                runs += 1
+            self._debug(f'Runs added from {output_path}', runs)
+
+    def get_rate_limit_exceeded_ratio(self) -> float:
+        """The ratio of the attempts that exceeded the rate limit, as only the requests not exceeding it are added"""
+        attempts = self.requests + self.rate_limit_exceeded
+        return min(self.rate_limit_exceeded / attempts, self.MAX_RATE_LIMIT_EXCEEDED_RATIO) if attempts else 0.
+
+    def get_rate_limit_mean_penalty(self) -> float:
+        return self.rate_limit_penalty / self.rate_limit_exceeded if self.rate_limit_exceeded else 0.
+
+    def save(self):
+        if self._filename is None:
+            return
+        with self._lock:
+            data = json.dumps({'latencies': self.latencies,
+                               'requests': self.requests,
+                               'rate_limit_exceeded': self.rate_limit_exceeded,
+                               'rate_limit_penalty': self.rate_limit_penalty,
+                               'runs': self.runs})
+        try:
+            write_atomically(self._filename, data.encode())
+        except IOError as e:
+            self._critical('Error while saving calibration', ExitCode.FILE_ERROR, e)
+        self._debug('Calibration saved. Requests amount', self.requests)
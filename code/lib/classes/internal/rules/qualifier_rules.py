@@ -0,0 +1,180 @@
+import shlex
+from collections import defaultdict
+from typing import Iterable, Optional, TextIO, Dict, Set, FrozenSet, Tuple, Sequence, List
+
+import sympy
+
+from lib.utilities.logging import ExitCode
+from lib.utilities.logging.with_logging import WithLogging
+
+
+class MaskRules:
+    """
+    The rules of `QualifierRules` over the literals of a single query, precomputed so the conjunctions
+    of those literals are simplified as bitmasks, where the i-th bit stands for the i-th literal,
+    without building the literals of each conjunction.
+
+    The rules are pairwise, so a conjunction is empty if any of its literals conflicts with another one
+    of them, or with itself. A literal is removed if another literal of the conjunction makes it
+    redundant, as `QualifierRules.simplify` removes them.
+    """
+
+    def __init__(self, conflicts: Sequence[int], redundant: Sequence[int], positives: int):
+        # for each literal, the literals that can not be present together with it
+        self._conflicts = conflicts
+        self._conflicting = sum(1 << i for i, literal_conflicts in enumerate(conflicts) if literal_conflicts)
+        # for each literal, the literals that make it redundant
+        self._redundant = redundant
+        self._redundants = sum(1 << i for i, literal_redundant in enumerate(redundant) if literal_redundant)
+        self._positives = positives
+
+    def simplify(self, mask: int) -> Optional[int]:
+        """Returns None if the conjunction of the mask is provably empty, or else its simplified mask"""
+        bits = mask & self._conflicting
+        while bits:
+            bit = bits & -bits
+            if self._conflicts[bit.bit_length() - 1] & mask:
+                return None
+            bits ^= bit
+        simplified_mask = mask
+        bits = mask & self._redundants
+        while bits:
+            bit = bits & -bits
+            # the positive literals are removed in order, so one of two equivalent literals is kept
+            if self._redundant[bit.bit_length() - 1] & (simplified_mask if bit & self._positives else mask):
+                simplified_mask ^= bit
+            bits ^= bit
+        return simplified_mask
+
+
+class QualifierRules(WithLogging):
+    """
+    Static rules about the literals of a conjunction. They are used to detect the conjunctions
+    that can not have results and to remove the literals that are implied by the others.
+
+    A conjunction is empty if it contains a literal and its negation, two literals that are
+    disjoint, or two different values of a single valued qualifier (such as language:Python
+    and language:Java).
+
+    The rules file has one rule per line. Comments start with #:
+
+        implies LITERAL LITERAL ...     the first literal implies each one of the others
+        disjoint LITERAL LITERAL ...    the literals are pairwise disjoint
+    """
+
+    IMPLIES = 'implies'
+    DISJOINT = 'disjoint'
+    QUALIFIER_SEPARATOR = ':'
+
+    def __init__(self, single_valued_qualifiers: Iterable[str] = (), rules_file: Optional[TextIO] = None):
+        WithLogging.__init__(self)
+        self._single_valued_qualifiers = frozenset(q.lower() for q in single_valued_qualifiers)
+        self._implications: Dict[str, Set[str]] = defaultdict(set)
+        self._disjoints: Dict[str, Set[str]] = defaultdict(set)
+        if rules_file:
+            self._load(rules_file)
+            self._close_implications()
+
+    def _load(self, rules_file: TextIO):
+        self._debug(f'Loading rules ...', header=rules_file.name)
+        for line_number, line in enumerate(rules_file, start=1):
+            words = shlex.split(line, comments=True)
+            if not words:
+                continue
+            kind, literals = words[0], words[1:]
+            if len(literals) < 2:
+                self._rules_critical(f'At least two literals expected in line {line_number}', rules_file.name)
+            if kind == self.IMPLIES:
+                self._implications[literals[0]].update(literals[1:])
+            elif kind == self.DISJOINT:
+                for literal in literals:
+                    self._disjoints[literal].update(other for other in literals if other != literal)
+            else:
+                self._rules_critical(f'Unknown rule "{kind}" in line {line_number}', rules_file.name)
+        self._debug(f'Rules loaded', header=rules_file.name)
+
+    def _close_implications(self):
+        """Makes the implications transitive"""
+        for literal in list(self._implications):
+            pending = list(self._implications[literal])
+            while pending:
+                implied = pending.pop()
+                for other in self._implications.get(implied, ()):
+                    if other != literal and other not in self._implications[literal]:
+                        self._implications[literal].add(other)
+                        pending.append(other)
+
+    def _get_qualifier_value(self, literal: str) -> Optional[Tuple[str, str]]:
+        qualifier, separator, value = literal.partition(self.QUALIFIER_SEPARATOR)
+        if separator and qualifier.lower() in self._single_valued_qualifiers:
+            return qualifier.lower(), value.lower()
+        return None
+
+    def _excludes(self, literals: Set[str], literal: str) -> bool:
+        """Returns True if any of the literals can not be present together with the given one"""
+        if self._disjoints.get(literal, set()) & literals:
+            return True
+        qualifier_value = self._get_qualifier_value(literal)
+        if qualifier_value:
+            for other in literals:
+                other_qualifier_value = self._get_qualifier_value(other)
+                if (other_qualifier_value and other_qualifier_value[0] == qualifier_value[0] and
+                        other_qualifier_value[1] != qualifier_value[1]):
+                    return True
+        return False
+
+    def get_mask_rules(self, literals: Sequence[sympy.Basic]) -> Optional[MaskRules]:
+        """
+        The rules over the given literals (see `MaskRules`), or None if no rule applies to them, so
+        their conjunctions do not need to be simplified
+        """
+        names = [str(literal.args[0]) if isinstance(literal, sympy.Not) else str(literal) for literal in literals]
+        positives = [i for i, literal in enumerate(literals) if not isinstance(literal, sympy.Not)]
+        closures = {i: {names[i]} | self._implications.get(names[i], set()) for i in positives}
+        conflicts: List[int] = [0] * len(literals)
+        redundant: List[int] = [0] * len(literals)
+        for i in positives:
+            for j, name in enumerate(names):
+                if j in closures:
+                    if any(self._excludes(closures[j], other) for other in closures[i]):
+                        conflicts[i] |= 1 << j
+                    elif j != i and names[i] in self._implications.get(name, ()):
+                        redundant[i] |= 1 << j
+                elif name in closures[i]:
+                    conflicts[i] |= 1 << j
+                    conflicts[j] |= 1 << i
+                elif self._excludes(closures[i], name):
+                    redundant[j] |= 1 << i
+        if not any(conflicts) and not any(redundant):
+            return None
+        return MaskRules(conflicts, redundant, sum(1 << i for i in positives))
+
+    def simplify(self, literals: FrozenSet[sympy.Basic]) -> Optional[FrozenSet[sympy.Basic]]:
+        """
+        Returns None if the conjunction of the given literals is provably empty. Otherwise,
+        returns the given literals without those implied by the others.
+        """
+        positives = {str(literal): literal for literal in literals if not isinstance(literal, sympy.Not)}
+        negatives = {str(literal.args[0]): literal for literal in literals if isinstance(literal, sympy.Not)}
+        if positives.keys() & negatives.keys():
+            return None
+        closure = set(positives)
+        for literal in positives:
+            closure.update(self._implications.get(literal, ()))
+        if closure & negatives.keys():
+            return None
+        for literal in closure:
+            if self._excludes(closure, literal):
+                return None
+        for literal in sorted(positives):
+            if any(literal in self._implications.get(other, ()) for other in positives if other != literal):
+                del positives[literal]
+        for literal in list(negatives):
+            if self._excludes(closure, literal):
+                del negatives[literal]
+        if len(positives) + len(negatives) == len(literals):
+            return literals
+        return frozenset(positives.values()) | frozenset(negatives.values())
+
+    def _rules_critical(self, message: str, name: str):
+        self._critical(message, ExitCode.PARSING, header=name)
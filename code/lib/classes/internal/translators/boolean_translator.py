@@ -0,0 +1,93 @@
+from typing import Callable, NamedTuple, Optional
+
+import sympy
+
+from lib.classes.internal.middle_codes.sympy_logic_middle_code import SympyLogicMiddleCode
+from lib.classes.internal.translators.spaces_translator import SpacesTranslator
+
+
+class BooleanOperators(NamedTuple):
+    """Boolean operators that a search accepts besides the implicit AND between the literals and NOT"""
+    disjunction: bool = False
+    grouping: bool = False
+
+
+class BooleanTranslator(SpacesTranslator):
+    """
+    Translator for the searches that evaluate OR, and maybe parentheses, by themselves. The conjunctions
+    are translated as by `SpacesTranslator`, but whole subexpressions can be pushed down to the server
+    (see `push_down`), so they are evaluated by a single request instead of being decomposed.
+    """
+
+    OR = ' OR '
+
+    def __init__(self, operators: BooleanOperators):
+        SpacesTranslator.__init__(self)
+        self._operators = operators
+
+    def push_down(self, middle_code: SympyLogicMiddleCode,
+                  satisfies_query_restrictions: Callable[[str], bool]) -> SympyLogicMiddleCode:
+        """
+        If the query of the whole expression satisfies the restrictions, it is given as a single literal.
+        Otherwise, if the search accepts parentheses, each largest subexpression containing a disjunction
+        whose query satisfies them is replaced by a literal, the query in parentheses, so it is combined
+        with the other literals as a single one. The literals are opaque to the decomposers, so the amounts
+        are still exact.
+        """
+        exp = middle_code.exp
+        if not self._operators.disjunction or not self._has_disjunction(exp):
+            return middle_code
+        query = self.get_expression_query(exp)
+        if query is not None and satisfies_query_restrictions(query):
+            exp = sympy.Symbol(query)
+        elif self._operators.grouping:
+            exp = self._push_down_subexpressions(exp, satisfies_query_restrictions)
+        if exp == middle_code.exp:
+            return middle_code
+        pushed_down = SympyLogicMiddleCode(middle_code.namespace, middle_code.name, exp)
+        pushed_down.original_query = middle_code.original_query
+        return pushed_down
+
+    def _push_down_subexpressions(self, exp: sympy.Basic,
+                                  satisfies_query_restrictions: Callable[[str], bool]) -> sympy.Basic:
+        if not self._has_disjunction(exp):
+            return exp
+        if not isinstance(exp, sympy.Not):
+            query = self.get_expression_query(exp)
+            if query is not None and satisfies_query_restrictions(f'({query})'):
+                return sympy.Symbol(f'({query})')
+        return exp.func(*(self._push_down_subexpressions(arg, satisfies_query_restrictions) for arg in exp.args))
+
+    @staticmethod
+    def _has_disjunction(exp: sympy.Basic) -> bool:
+        return any(isinstance(node, sympy.Or) for node in sympy.preorder_traversal(exp))
+
+    def get_expression_query(self, exp: sympy.Basic) -> Optional[str]:
+        """The query of the expression, or None if it can not be written with the operators accepted"""
+        if isinstance(exp, sympy.Symbol):
+            return str(exp)
+        if isinstance(exp, sympy.Not):
+            if isinstance(exp.args[0], sympy.Symbol):
+                return self.get_literal_query(exp)
+            return self._get_group_query(exp.args[0], 'NOT ')
+        if isinstance(exp, sympy.And):
+            operands = [self._get_group_query(arg) if isinstance(arg, sympy.Or) else self.get_expression_query(arg)
+                        for arg in sorted(exp.args, key=str)]
+            return None if None in operands else self.join_literal_queries(operands)
+        if isinstance(exp, sympy.Or):
+            if not self._operators.disjunction:
+                return None
+            operands = [self._get_group_query(arg) if isinstance(arg, sympy.And) else self.get_expression_query(arg)
+                        for arg in sorted(exp.args, key=str)]
+            return None if None in operands else self.OR.join(operands)
+        return None
+
+    def _get_group_query(self, exp: sympy.Basic, prefix: str = '') -> Optional[str]:
+        """
+        The query of the expression in parentheses. The precedence between the operators is not relied
+        on, so a conjunction in a disjunction is grouped as well.
+        """
+        if not self._operators.grouping:
+            return None
+        query = self.get_expression_query(exp)
+        return None if query is None else f'{prefix}({query})'
@@ -1,3 +1,5 @@
+from typing import Sequence
+
 import sympy
 
 from lib.classes.internal.middle_codes.sympy_logic_middle_code import SympyLogicMiddleCode
@@ -13,14 +15,16 @@ class SpacesTranslator(Translator):
         Translator.__init__(self)
 
     def get_particular_query(self, conjunction_middle_code: SympyLogicMiddleCode) -> str:
-        particular_query = ''
-
-        if isinstance(conjunction_middle_code.exp, sympy.Symbol):
-            return str(conjunction_middle_code.exp)
+        if isinstance(conjunction_middle_code.exp, sympy.And):
+            symbols = sorted(conjunction_middle_code.exp.args, key=lambda a: str(a))
         else:
-            for symbol in sorted(conjunction_middle_code.exp.args, key=lambda a: str(a)):
-                if isinstance(symbol, sympy.Not):
-                    particular_query += f'NOT {symbol[1:]} '
-                else:
-                    particular_query += f'{symbol} '
-            return particular_query[:-1]
+            symbols = (conjunction_middle_code.exp,)
+        return self.join_literal_queries([self.get_literal_query(symbol) for symbol in symbols])
+
+    def get_literal_query(self, literal: sympy.Basic) -> str:
+        if isinstance(literal, sympy.Not):
+            return f'NOT {literal.args[0]}'
+        return str(literal)
+
+    def join_literal_queries(self, literal_queries: Sequence[str]) -> str:
+        return ' '.join(literal_queries)
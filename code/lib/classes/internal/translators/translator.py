@@ -1,4 +1,5 @@
 from abc import abstractmethod
+from typing import Sequence, Callable
 
 from lib.classes.internal.middle_codes.middle_code import MiddleCode
 from lib.utilities.logging.with_logging import WithLogging
@@ -11,3 +12,23 @@ class Translator(WithLogging):
     @abstractmethod
     def get_particular_query(self, middle_code: MiddleCode) -> str:
         pass
+
+    @abstractmethod
+    def get_literal_query(self, literal) -> str:
+        """Translates a single literal of a conjunction"""
+        pass
+
+    @abstractmethod
+    def join_literal_queries(self, literal_queries: Sequence[str]) -> str:
+        """
+        Joins the translations of the literals of a conjunction. The literals must be given
+        sorted by their string representation.
+        """
+        pass
+
+    def push_down(self, middle_code: MiddleCode, satisfies_query_restrictions: Callable[[str], bool]) -> MiddleCode:
+        """
+        Gives an equivalent middle code where the subexpressions that the server can evaluate by itself,
+        with queries that satisfy the restrictions, are single literals. By default, there are none.
+        """
+        return middle_code
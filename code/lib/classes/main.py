@@ -1,7 +1,8 @@
 import argparse
 import logging
+import threading
 from pathlib import Path
-from typing import Iterable, Sequence
+from typing import Iterable, Sequence, Tuple, List, Optional
 
 import colorama
 
@@ -11,6 +12,9 @@ from lib.classes.inputs.str_input import StrInput
 from lib.classes.internal.caches import DEFAULT_CACHE_TYPE, CACHE_TYPE, \
     INPUT_CACHE_TYPE
 from lib.classes.internal.engines import ENGINE_TYPE, DEFAULT_ENGINE_TYPE
+from lib.classes.internal.engines.engine import Engine
+from lib.classes.internal.engines.github_v4_engine import GithubV4Engine
+from lib.classes.internal.engines.local_index_engine import LocalIndexEngine
 from lib.classes.internal.middle_codes.middle_code import MiddleCode
 from lib.classes.internal.parsers import DEFAULT_PARSER_TYPE, PARSER_TYPE
 from lib.classes.outputs.output import Output
@@ -18,9 +22,10 @@ from lib.classes.outputs.stream_outputs.console_output import ConsoleOutput
 from lib.classes.outputs.stream_outputs.file_output import FileOutput
 from lib.utilities.functions import get_caster_to_optional, get_tuple_caster, \
     get_members_set_string, get_component
-from lib.utilities.logging import VerbosityLevel
+from lib.utilities.logging import VerbosityLevel, ExitCode
 from lib.utilities.logging.consts import VERBOSITY_LOGGER_NAME, CONSOLE_OUTPUT_FORMAT, FILE_OUTPUT_FORMAT
 from lib.utilities.logging.with_logging import WithLogging
+from lib.utilities.metrics import METRICS
 from lib.utilities.with_external_arguments import WithExternalArguments
 
 
@@ -29,6 +34,9 @@ class Main(WithLogging, WithExternalArguments):
     def __init__(self, args_sequence: Sequence[str] = None):
         WithLogging.__init__(self)
         WithExternalArguments.__init__(self, args_sequence)
+        self._outputs: Sequence[Output] = []
+        self._engine: Optional[Engine] = None
+        self._metrics_exported = threading.Event()
 
     def run(self):
         self._prologue()
@@ -38,6 +46,9 @@ class Main(WithLogging, WithExternalArguments):
     def _prologue(self):
         colorama.init()
         self._config_loggers()
+        # noinspection PyUnresolvedReferences
+        if (self.metrics_prometheus or self.metrics_json) and self.metrics_interval > 0:
+            threading.Thread(target=self._export_metrics_periodically, daemon=True).start()
 
     def _get_inputs(self) -> Iterable[Input]:
         # noinspection PyUnresolvedReferences
@@ -88,23 +99,82 @@ class Main(WithLogging, WithExternalArguments):
 
     def _main_logic(self):
         inputs = self._get_inputs()
-        outputs = self._get_outputs()
+        outputs = self._outputs = self._get_outputs()
         # noinspection PyUnresolvedReferences
-        engine = get_component(self.engine_options, ENGINE_TYPE, 'engine',
+        engine = self._engine = get_component(self.engine_options, ENGINE_TYPE, 'engine',
                                self._args_parser,
                                cache_options=self.cache_options,
                                input_caches_options=self.input_caches_options,
                                simulate=self.simulate,
-                               main_args_parser=self._args_parser)
-        for i in inputs:
-            for middle_code in i.get_middle_codes():
-                results = engine.get_total_amount(middle_code)
+                               main_args_parser=self._args_parser,
+                               progressive=self.progressive,
+                               deadline=self.deadline,
+                               max_requests=self.max_requests)
+        capacity_scenarios = self._get_capacity_scenarios()
+        # noinspection PyUnresolvedReferences
+        if self.plan:
+            middle_codes = [middle_code for i in inputs for middle_code in i.get_middle_codes()]
+            plan = engine.plan(middle_codes)
+            if plan is not None:
                 for output in outputs:
                     # noinspection PyUnresolvedReferences
-                    output.output(middle_code, self.simulate, results)
+                    output.output_plan(self.simulate, plan)
+                if capacity_scenarios:
+                    capacity = engine.get_capacity_estimated_times(plan[2], plan[5], capacity_scenarios)
+                    for output in outputs:
+                        output.output_capacity(None, capacity)
+        else:
+            middle_codes = (middle_code for i in inputs for middle_code in i.get_middle_codes())
+        for middle_code in middle_codes:
+            results = engine.get_total_amount(middle_code, self._output_progress)
+            for output in outputs:
+                # noinspection PyUnresolvedReferences
+                output.output(middle_code, self.simulate, results)
+            if capacity_scenarios:
+                capacity = engine.get_capacity_estimated_times(results[1], results[2], capacity_scenarios)
+                for output in outputs:
+                    output.output_capacity(middle_code, capacity)
+
+    def _get_capacity_scenarios(self) -> List[Tuple[int, int, Optional[float]]]:
+        scenarios = []
+        # noinspection PyUnresolvedReferences
+        for scenario in self.capacity or []:
+            # noinspection PyUnresolvedReferences
+            if not self.simulate:
+                self._args_parser.error('--capacity requires the simulation mode')
+            if len(scenario) not in (2, 3) or scenario[0] < 1 or scenario[1] < 1:
+                self._args_parser.error('--capacity requires a positive TOKENS and CONCURRENCY, '
+                                        'and optionally a HIT_RATIO')
+            cache_hit_ratio = scenario[2] if len(scenario) == 3 else None
+            if cache_hit_ratio is not None and not 0 <= cache_hit_ratio <= 1:
+                self._args_parser.error('The HIT_RATIO of --capacity must be between 0 and 1')
+            scenarios.append((int(scenario[0]), int(scenario[1]), cache_hit_ratio))
+        return scenarios
+
+    def _output_progress(self, middle_code: MiddleCode, progress: Tuple):
+        for output in self._outputs:
+            # noinspection PyUnresolvedReferences
+            output.output_progress(middle_code, self.simulate, progress)
 
     def _epilogue(self):
-        pass
+        if self._engine is not None:
+            self._engine.close()
+        self._metrics_exported.set()
+        try:
+            # noinspection PyUnresolvedReferences
+            METRICS.export(self.metrics_prometheus, self.metrics_json)
+        except IOError as e:
+            self._critical('Error while exporting metrics', ExitCode.FILE_ERROR, e)
+
+    def _export_metrics_periodically(self):
+        """Run in a background thread, where an error only skips the export, as the run must not be stopped"""
+        # noinspection PyUnresolvedReferences
+        while not self._metrics_exported.wait(self.metrics_interval):
+            try:
+                # noinspection PyUnresolvedReferences
+                METRICS.export(self.metrics_prometheus, self.metrics_json)
+            except IOError as e:
+                self._warning('Error while exporting metrics', e)
 
     def _config_loggers(self):
         verbosity_logger = logging.getLogger(VERBOSITY_LOGGER_NAME)
@@ -234,6 +304,60 @@ class Main(WithLogging, WithExternalArguments):
                                         ' In simulation mode no actual request will be issued '
                                         ' to the server')
 
+        results_group.add_argument('--plan', action='store_true',
+                                   dest='plan',
+                                   help='activate the planning mode. '
+                                        'In this mode, all the queries are parsed and decomposed '
+                                        'before issuing any request, the network cost of the whole '
+                                        'run is shown, and each distinct subquery shared by several '
+                                        'queries is issued only once. The queries are then decomposed '
+                                        'again to be evaluated, so the time and memory spent decomposing '
+                                        'and translating them, but not the requests, is doubled')
+
+        results_group.add_argument('--progressive', action='store_true',
+                                   dest='progressive',
+                                   help='activate the progressive mode. '
+                                        'In this mode, the intersections of fewer terms are evaluated first, '
+                                        'and the interim results amounts, with the bounds given by the '
+                                        'intersections evaluated so far and the estimated time to finish, '
+                                        'are output as they are known')
+
+        results_group.add_argument('--deadline', dest='deadline', type=float, metavar='SECONDS',
+                                   help='stop the evaluation after the given seconds and output the best '
+                                        'bounds reached. It activates the progressive mode')
+
+        results_group.add_argument('--max-requests', dest='max_requests', type=int, metavar='N',
+                                   help='stop the evaluation after issuing the given amount of subqueries and '
+                                        'output the best bounds reached. A subquery is a request, unless the '
+                                        'engine issues them in batches. It activates the progressive mode')
+
+        results_group.add_argument('--capacity', dest='capacity', nargs='+', action='append', type=float,
+                                   metavar=('TOKENS', 'CONCURRENCY [HIT_RATIO]'),
+                                   help='in simulation mode, estimate the runtime of each query, or of the plan, '
+                                        'with TOKENS authenticated credentials issuing up to CONCURRENCY '
+                                        'requests at a time, when the given ratio of sub-queries is taken '
+                                        'from the cache. If HIT_RATIO is not given, the one of the cache '
+                                        'in use is taken. The estimation is calibrated by the engine. '
+                                        'This option may be specified several times')
+
+        # ------------- Metrics -------------
+        metrics_group = self._args_parser.add_argument_group(title='metrics',
+                                                             description='options to export the metrics of '
+                                                                         'the stages of the run')
+
+        metrics_group.add_argument('--metrics-prometheus', dest='metrics_prometheus', metavar='FILE',
+                                   help='export the metrics to FILE in the Prometheus text format, '
+                                        'to be read by the textfile collector of the node exporter')
+
+        metrics_group.add_argument('--metrics-json', dest='metrics_json', metavar='FILE',
+                                   help='export the metrics to FILE as JSON')
+
+        metrics_group.add_argument('--metrics-interval', dest='metrics_interval', type=float,
+                                   metavar='SECONDS', default=60,
+                                   help='export the metrics every SECONDS during the run, besides at its end. '
+                                        'If it is 0, the metrics are only exported at the end of the run. '
+                                        'Default is 60 seconds')
+
         # ------------- Engines -------------
         engines_group = self._args_parser.add_argument_group(title='engines',
                                                              description='options to specify or show'
@@ -243,8 +367,10 @@ class Main(WithLogging, WithExternalArguments):
                                    # type=get_component_caster(ENGINE_TYPE, 'engine type'),
                                    default=DEFAULT_ENGINE_TYPE,
                                    help='sets the engine to use for issuing the queries. '
-                                        '(Currently there is only one engine. In the '
-                                        'future another engines may be incorporated) ')
+                                        f'{GithubV4Engine.ARG_NAME} issues them to the GraphQL API, in '
+                                        'batches of its **batch-size argument. '
+                                        f'{LocalIndexEngine.ARG_NAME} counts them in a local inverted '
+                                        'index, built from a corpus by its **corpus PATH argument')
 
         # ------------- Parsing -------------
         parsing_group = self._args_parser.add_argument_group(title='parsing',
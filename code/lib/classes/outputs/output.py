@@ -1,4 +1,5 @@
 from abc import abstractmethod
+from typing import Tuple, Optional, Sequence
 
 from lib.classes.internal.middle_codes.middle_code import MiddleCode
 from lib.utilities.logging.with_logging import WithLogging
@@ -12,3 +13,18 @@ class Output(WithLogging):
     @abstractmethod
     def output(self, middle_code: MiddleCode, simulate: bool, results):
         pass
+
+    def output_progress(self, middle_code: MiddleCode, simulate: bool, progress: Tuple):
+        """Outputs the interim results of a query in progressive mode (see `Engine._report_progress`)"""
+        pass
+
+    def output_plan(self, simulate: bool, plan: Tuple):
+        """Outputs the plan of the run, given before issuing any request (see `Engine.plan`)"""
+        pass
+
+    def output_capacity(self, middle_code: Optional[MiddleCode], capacity: Sequence[Tuple]):
+        """
+        Outputs the estimated runtimes of a query, or of the plan if no query is given, for each
+        capacity scenario (see `Engine.get_capacity_estimated_times`)
+        """
+        pass
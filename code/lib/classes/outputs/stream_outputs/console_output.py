@@ -1,5 +1,5 @@
 import sys
-from typing import TextIO
+from typing import TextIO, Tuple, Optional, Sequence
 
 import colorama
 
@@ -17,5 +17,20 @@ class ConsoleOutput(StreamOutput):
                 f'{StreamOutput._get_message(self, *args, **kwargs)}'
                 f'{colorama.Style.RESET_ALL}')
 
+    def output_progress(self, middle_code: MiddleCode, is_simulation: bool, progress: Tuple):
+        sys.stdout.write(f'{colorama.Fore.GREEN}'
+                         f'{self._get_progress_message(middle_code, *progress).expandtabs(self._tab_size)}'
+                         f'{colorama.Style.RESET_ALL}')
+
+    def output_plan(self, is_simulation: bool, plan: Tuple):
+        sys.stdout.write(f'{colorama.Fore.GREEN}'
+                         f'{self._get_plan_message(is_simulation, *plan).expandtabs(self._tab_size)}'
+                         f'{colorama.Style.RESET_ALL}')
+
+    def output_capacity(self, middle_code: Optional[MiddleCode], capacity: Sequence[Tuple]):
+        sys.stdout.write(f'{colorama.Fore.GREEN}'
+                         f'{self._get_capacity_message(middle_code, capacity).expandtabs(self._tab_size)}'
+                         f'{colorama.Style.RESET_ALL}')
+
     def _get_stream(self, middle_code: MiddleCode, is_simulation: bool) -> TextIO:
         return sys.stdout
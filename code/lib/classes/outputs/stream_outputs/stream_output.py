@@ -1,6 +1,6 @@
 from abc import abstractmethod
 from datetime import datetime
-from typing import TextIO
+from typing import TextIO, Optional, Dict, Sequence, Tuple
 
 from lib.classes.internal.middle_codes.middle_code import MiddleCode
 from lib.classes.outputs.output import Output
@@ -19,23 +19,49 @@ class StreamOutput(Output):
                      with_error_to_be_subtracted: int, estimated_time_min: datetime,
                      estimated_time_max: datetime, estimated_time_caching_min: datetime,
                      estimated_time_caching_max: datetime, begin_run_datetime: datetime,
-                     end_run_datetime: datetime, longest_subquery: str) -> str:
+                     end_run_datetime: datetime, longest_subquery: str,
+                     pruned_subqueries: int, truncated_subqueries: int,
+                     lower_bound: Optional[int], upper_bound: Optional[int],
+                     issued_per_depth: Dict[int, int], not_evaluated_subqueries: int) -> str:
 
         delimiter = '--------------------------------------------------------------------'
 
         message = (f'\n\n{delimiter}\n'
                    f'\tResults for query {middle_code.name} from '
                    f'{quote(middle_code.namespace)}{{simulation_message}}\n'
-                   f'\n\t\tResults amount: {results}\n'
-                   f'\n\t\tSub-queries total: {subqueries_total}\n')
+                   f'\n\t\tResults amount: {results}\n')
 
-        already_cached_subqueries = subqueries_total - issued_subqueries
+        # there are no bounds if the amount of some sub-query is not known
+        bounds = 'unknown' if lower_bound is None else f'from {lower_bound} to {upper_bound}'
+        if not_evaluated_subqueries:
+            message += (f'\t\tResults amount bounds: {bounds}\n'
+                        f'\t\t(Evaluation stopped: {not_evaluated_subqueries} sub-queries not evaluated)\n')
+        elif truncated_subqueries:
+            message += (f'\t\tResults amount bounds: {bounds}\n'
+                        f'\t\t(Truncated inclusion-exclusion: {truncated_subqueries} sub-queries saved)\n')
+
+        message += f'\n\t\tSub-queries total: {subqueries_total}\n'
+
+        already_cached_subqueries = (subqueries_total - issued_subqueries - pruned_subqueries -
+                                     not_evaluated_subqueries)
         if already_cached_subqueries:
             already_cached_queries_percent = div(already_cached_subqueries, subqueries_total) * 100
             message += (
                 f'\t\t\tFrom cache:      {already_cached_subqueries} '
                 f'({already_cached_queries_percent:g}% of total)\n')
 
+        if pruned_subqueries:
+            pruned_subqueries_percent = div(pruned_subqueries, subqueries_total) * 100
+            message += (
+                f'\t\t\tPruned:          {pruned_subqueries} '
+                f'({pruned_subqueries_percent:g}% of total)\n')
+
+        if not_evaluated_subqueries:
+            not_evaluated_subqueries_percent = div(not_evaluated_subqueries, subqueries_total) * 100
+            message += (
+                f'\t\t\tNot evaluated:   {not_evaluated_subqueries} '
+                f'({not_evaluated_subqueries_percent:g}% of total)\n')
+
         if issued_subqueries:
             issued_subqueries_percent = div(issued_subqueries, subqueries_total) * 100
             message += (
@@ -71,6 +97,11 @@ class StreamOutput(Output):
         if difference:
             message += f'\t\\tt\t\tDifference:       {difference}\n'
 
+        if is_simulation and issued_per_depth:
+            message += '\t\t\tTo be issued per depth:\n'
+            for depth, amount in issued_per_depth.items():
+                message += f'\t\t\t\t{depth:<4} {amount}\n'
+
         message += (f'\n\t\t{{location}} begin datetime: {begin_run_datetime}\n'
                     f'\t\t{{location}} end datetime:   {end_run_datetime}\n'
 
@@ -102,6 +133,50 @@ class StreamOutput(Output):
 
         return message
 
+    @staticmethod
+    def _get_progress_message(middle_code: MiddleCode, results: int, lower_bound: Optional[int],
+                              upper_bound: Optional[int], completed_depth: int, evaluated_subqueries: int,
+                              issued_subqueries: int, estimated_time: Optional[str]) -> str:
+        message = (f'\tInterim results for query {middle_code.name} from {quote(middle_code.namespace)}: '
+                   f'{results}\n'
+                   f'\t\tBounds: from {lower_bound} to {upper_bound} ({completed_depth} depths completed)\n'
+                   f'\t\tSub-queries evaluated: {evaluated_subqueries} ({issued_subqueries} issued)\n')
+        if estimated_time is not None:
+            message += f'\t\tEstimated time to finish: {estimated_time}\n'
+        return message
+
+    @staticmethod
+    def _get_plan_message(is_simulation: bool, planned_queries: int, subqueries_references: int,
+                          distinct_subqueries: int, shared_subqueries: int, cached_subqueries: int,
+                          to_issue_subqueries: int, estimated_time_min: str, estimated_time_max: str) -> str:
+        delimiter = '--------------------------------------------------------------------'
+        simulation_message = ' in simulation mode' if is_simulation else ''
+        return (f'\n\n{delimiter}\n'
+                f'\tPlan{simulation_message}\n'
+                f'\n\t\tPlanned queries:         {planned_queries}\n'
+                f'\t\tSub-queries references:  {subqueries_references}\n'
+                f'\t\tDistinct sub-queries:    {distinct_subqueries}\n'
+                f'\t\t\tShared:     {shared_subqueries}\n'
+                f'\t\t\tFrom cache: {cached_subqueries}\n'
+                f'\t\tRequests to be issued:   {to_issue_subqueries}\n'
+                f'\n\t\tEstimated runtime: from {estimated_time_min} to {estimated_time_max}'
+                f'\n{delimiter}\n\n')
+
+    @staticmethod
+    def _get_capacity_message(middle_code: Optional[MiddleCode], capacity: Sequence[Tuple]) -> str:
+        delimiter = '--------------------------------------------------------------------'
+        if middle_code is None:
+            title = 'Capacity for the plan'
+        else:
+            title = f'Capacity for query {middle_code.name} from {quote(middle_code.namespace)}'
+        message = (f'\n\n{delimiter}\n'
+                   f'\t{title}\n\n'
+                   f'\t\tTokens  Concurrency  Cache hit ratio  Estimated runtime\n')
+        for tokens, concurrency, cache_hit_ratio, estimated_time_min, estimated_time_max in capacity:
+            message += (f'\t\t{tokens:<7} {concurrency:<12} {cache_hit_ratio:<16.2%} '
+                        f'from {estimated_time_min} to {estimated_time_max}\n')
+        return message + f'{delimiter}\n\n'
+
     @abstractmethod
     def _get_stream(self, middle_code: MiddleCode, is_simulation: bool) -> TextIO:
         pass
@@ -109,3 +184,7 @@ class StreamOutput(Output):
     def output(self, middle_code: MiddleCode, is_simulation: bool, results):
         self._get_stream(middle_code, is_simulation).write(
             self._get_message(middle_code, is_simulation, *results).expandtabs(self._tab_size))
+
+    def output_progress(self, middle_code: MiddleCode, is_simulation: bool, progress: Tuple):
+        self._get_stream(middle_code, is_simulation).write(
+            self._get_progress_message(middle_code, *progress).expandtabs(self._tab_size))
@@ -1,3 +1,6 @@
+import os
+import stat
+import uuid
 from typing import Iterable
 
 from lib.utilities.with_external_arguments import CustomArgumentParser
@@ -106,3 +109,29 @@ def get_type_and_options(options):
         return options[0], options[1:]
     else:
         return options, ()
+
+
+def bits_amount(n: int) -> int:
+    return bin(n).count('1')
+
+
+def write_atomically(filename: str, data: bytes):
+    """
+    Writes the data to a temporary file in the same directory, which is synced and then renamed,
+    so the file is always either the previous one or the new one. The temporary file is given the
+    mode of the previous file, or otherwise the default one, which the umask applies to on creation
+    """
+    filename = os.path.abspath(filename)
+    temporary_filename = os.path.join(os.path.dirname(filename),
+                                      f'.{os.path.basename(filename)}.{uuid.uuid4().hex}.tmp')
+    try:
+        mode = stat.S_IMODE(os.stat(filename).st_mode)
+    except FileNotFoundError:
+        mode = None
+    with open(os.open(temporary_filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666), 'wb') as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    if mode is not None:
+        os.chmod(temporary_filename, mode)
+    os.replace(temporary_filename, filename)
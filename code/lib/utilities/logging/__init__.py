@@ -30,3 +30,4 @@ class ExitCode(Enum):
     CONNECTION = 6
     QUERY_ERROR = 7
     FILE_ERROR = 8
+    AUTHENTICATION = 9
@@ -0,0 +1,205 @@
+import bisect
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Tuple, List, Optional, Iterator
+
+from lib.utilities.functions import write_atomically
+
+# A metric is keyed by its name and its labels, sorted by label name
+MetricKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is the +Inf bucket
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def get_cumulative_counts(self) -> List[Tuple[float, int]]:
+        cumulative_counts = []
+        count = 0
+        for bound, bucket_count in zip(self.buckets + (math.inf,), self.counts):
+            count += bucket_count
+            cumulative_counts.append((bound, count))
+        return cumulative_counts
+
+
+class Metrics:
+    """
+    Counters, gauges and histograms of the stages of a run, shared by all the threads of the
+    process. They are exported in the Prometheus text format and as JSON.
+
+    The processes forked to evaluate shards of a query keep their own copies, which are not
+    gathered in the parent process.
+    """
+
+    PREFIX = 'quantityer'
+    # seconds, from cache lookups to rate limit waits
+    DEFAULT_BUCKETS = (0.0001, 0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30., 60.)
+
+    DESCRIPTIONS = {
+        'parse_seconds': 'Seconds parsing each query',
+        'dnf_conversion_seconds': 'Seconds converting each query to disjunctive normal form',
+        'enumeration_seconds_total': 'Seconds enumerating subqueries',
+        'translation_seconds_total': 'Seconds translating subqueries',
+        'subqueries_total': 'Subqueries enumerated',
+        'cache_hits_total': 'Subqueries whose amount was cached',
+        'cache_misses_total': 'Subqueries whose amount was not cached',
+        'cache_lookup_seconds': 'Seconds looking up each subquery in the cache',
+        'cache_write_seconds': 'Seconds writing each amount to the cache',
+        'queries_total': 'Queries evaluated',
+        'query_seconds': 'Seconds evaluating each query',
+        'requests_total': 'Requests issued to the server, a batch of subqueries being a single one',
+        'request_errors_total': 'Requests that did not give an amount',
+        'request_seconds': 'Seconds of each request to the server, retries included',
+        'rate_limit_sleep_seconds': 'Seconds waiting for the rate limit before each request that waited',
+        'rate_limit_exceeded_total': 'Requests rejected because the rate limit was exceeded',
+        'retries_total': 'Requests retried by the HTTP client',
+        'retry_sleep_seconds_total': 'Seconds waiting before the retries of the HTTP client',
+        'rate_limit_remaining': 'Requests remaining in the current window of the rate limit',
+        'rate_limit_limit': 'Requests allowed per window of the rate limit',
+        'incomplete_results_total': 'Searches that timed out, so their results amount may be incomplete',
+        'rate_limit_utilization': 'Requests issued per second over the requests per second allowed by the '
+                                  'rate limits, since the first request',
+        'graphql_batches_total': 'GraphQL requests issued, each one with a batch of subqueries',
+        'graphql_batched_subqueries_total': 'Subqueries issued in the batches of the GraphQL requests',
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[MetricKey, float] = {}
+        self._gauges: Dict[MetricKey, float] = {}
+        self._histograms: Dict[MetricKey, Histogram] = {}
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._gauges = {}
+            self._histograms = {}
+
+    @staticmethod
+    def _get_key(name: str, labels: Dict[str, str]) -> MetricKey:
+        return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+    def increment(self, name: str, amount: float = 1, **labels):
+        key = self._get_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels):
+        key = self._get_key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._get_key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.DEFAULT_BUCKETS)
+            histogram.observe(value)
+
+    @contextmanager
+    def time(self, name: str, **labels) -> Iterator[None]:
+        """Observes the seconds taken by the block in the given histogram"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def get_counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(self._get_key(name, labels), 0)
+
+    def get_gauge(self, name: str, **labels) -> Optional[float]:
+        with self._lock:
+            return self._gauges.get(self._get_key(name, labels))
+
+    def get_histogram_count(self, name: str, **labels) -> int:
+        with self._lock:
+            histogram = self._histograms.get(self._get_key(name, labels))
+            return histogram.count if histogram is not None else 0
+
+    @classmethod
+    def _get_full_name(cls, name: str) -> str:
+        return f'{cls.PREFIX}_{name}'
+
+    @staticmethod
+    def _get_labels_string(labels: Tuple[Tuple[str, str], ...]) -> str:
+        if not labels:
+            return ''
+        return '{' + ','.join(f'{label}="{json.dumps(value)[1:-1]}"' for label, value in labels) + '}'
+
+    @staticmethod
+    def _get_number_string(value: float) -> str:
+        if value == math.inf:
+            return '+Inf'
+        return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+    def get_prometheus_text(self) -> str:
+        lines = []
+
+        def add_header(name: str, metric_type: str):
+            if name in self.DESCRIPTIONS:
+                lines.append(f'# HELP {self._get_full_name(name)} {self.DESCRIPTIONS[name]}')
+            lines.append(f'# TYPE {self._get_full_name(name)} {metric_type}')
+
+        with self._lock:
+            for metrics, metric_type in ((self._counters, 'counter'), (self._gauges, 'gauge')):
+                last_name = None
+                for (name, labels), value in sorted(metrics.items()):
+                    if name != last_name:
+                        add_header(name, metric_type)
+                        last_name = name
+                    lines.append(f'{self._get_full_name(name)}{self._get_labels_string(labels)} '
+                                 f'{self._get_number_string(value)}')
+            last_name = None
+            for (name, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0]):
+                if name != last_name:
+                    add_header(name, 'histogram')
+                    last_name = name
+                full_name = self._get_full_name(name)
+                for bound, count in histogram.get_cumulative_counts():
+                    bucket_labels = labels + (('le', self._get_number_string(bound)),)
+                    lines.append(f'{full_name}_bucket{self._get_labels_string(bucket_labels)} {count}')
+                lines.append(f'{full_name}_sum{self._get_labels_string(labels)} '
+                             f'{self._get_number_string(histogram.sum)}')
+                lines.append(f'{full_name}_count{self._get_labels_string(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def get_json(self) -> str:
+        def get_entries(metrics: Dict[MetricKey, object], get_value) -> List[dict]:
+            return [{'name': self._get_full_name(name), 'labels': dict(labels), **get_value(value)}
+                    for (name, labels), value in sorted(metrics.items(), key=lambda item: item[0])]
+
+        with self._lock:
+            return json.dumps({
+                'counters': get_entries(self._counters, lambda value: {'value': value}),
+                'gauges': get_entries(self._gauges, lambda value: {'value': value}),
+                'histograms': get_entries(self._histograms, lambda histogram: {
+                    'buckets': [[self._get_number_string(bound), count]
+                                for bound, count in histogram.get_cumulative_counts()],
+                    'sum': histogram.sum,
+                    'count': histogram.count,
+                }),
+            }, indent=2)
+
+    def export(self, prometheus_filename: Optional[str] = None, json_filename: Optional[str] = None):
+        """Writes the metrics to the given files. Each file is replaced atomically"""
+        if prometheus_filename:
+            write_atomically(prometheus_filename, self.get_prometheus_text().encode())
+        if json_filename:
+            write_atomically(json_filename, self.get_json().encode())
+
+
+METRICS = Metrics()
@@ -0,0 +1,84 @@
+import re
+import unittest
+from typing import Tuple
+
+import sympy
+
+from benchmarks.offline_engine import FakeQueryIssuer, get_offline_engine
+from lib.classes.internal.middle_codes.sympy_logic_middle_code import SympyLogicMiddleCode
+from lib.classes.internal.translators.boolean_translator import BooleanTranslator, BooleanOperators
+
+
+class BooleanQueryIssuer(FakeQueryIssuer):
+    """Counts the documents matching a query with OR, NOT and parentheses, of up to `max_length` characters"""
+
+    TOKEN_PATTERN = re.compile(r'\(|\)|[^\s()]+')
+
+    def __init__(self, max_length: int = 256):
+        self._max_length = max_length
+        FakeQueryIssuer.__init__(self)
+
+    def issue(self, name: str, query: str) -> Tuple[bool, int]:
+        self.issued.append(query)
+        code = ''
+        for token in self.TOKEN_PATTERN.findall(query):
+            if code and not code.endswith(('(', ' or ', ' not ')) and token not in (')', 'OR'):
+                code += ' and '
+            code += {'(': '(', ')': ')', 'OR': ' or ', 'NOT': ' not '}.get(token, f'({token!r} in document)')
+        return True, sum(eval(code, {'document': document}) for document in self.DOCUMENTS)
+
+    def satisfies_query_restrictions(self, query: str) -> bool:
+        return len(query) <= self._max_length
+
+
+class TestBooleanTranslator(unittest.TestCase):
+    def setUp(self):
+        self.a, self.b, self.c, self.d, self.e, self.f = sympy.symbols('a b c d e f')
+
+    def test_get_expression_query(self):
+        a, b, c, d = self.a, self.b, self.c, self.d
+        translator = BooleanTranslator(BooleanOperators(disjunction=True, grouping=True))
+        self.assertEqual(translator.get_expression_query(a | b | ~c), 'a OR b OR NOT c')
+        self.assertEqual(translator.get_expression_query((a | b) & ~c), '(a OR b) NOT c')
+        self.assertEqual(translator.get_expression_query((a & b) | ~(c | d)), '(a b) OR NOT (c OR d)')
+        translator = BooleanTranslator(BooleanOperators(disjunction=True))
+        self.assertEqual(translator.get_expression_query(a | b), 'a OR b')
+        self.assertIsNone(translator.get_expression_query((a | b) & c))
+        self.assertIsNone(translator.get_expression_query((a & b) | c))
+
+    def test_push_down(self):
+        a, b, c, d, e, f = self.a, self.b, self.c, self.d, self.e, self.f
+        translator = BooleanTranslator(BooleanOperators(disjunction=True, grouping=True))
+        middle_code = SympyLogicMiddleCode(namespace='TEST', name='1', exp=(a | b) & (c | d) & ~(e | f))
+        self.assertEqual(translator.push_down(middle_code, lambda query: True).exp,
+                         sympy.Symbol('(a OR b) (c OR d) NOT (e OR f)'))
+        pushed_down = translator.push_down(middle_code, lambda query: len(query) <= 10)
+        self.assertEqual(pushed_down.exp, sympy.And(sympy.Symbol('(a OR b)'), sympy.Symbol('(c OR d)'),
+                                                    ~sympy.Symbol('(e OR f)')))
+        self.assertIs(translator.push_down(middle_code, lambda query: len(query) <= 5), middle_code)
+        conjunction = SympyLogicMiddleCode(namespace='TEST', name='2', exp=a & ~b)
+        self.assertIs(translator.push_down(conjunction, lambda query: True), conjunction)
+        translator = BooleanTranslator(BooleanOperators(disjunction=True))
+        self.assertIs(translator.push_down(middle_code, lambda query: True), middle_code)
+
+    def test_engine(self):
+        a, b, c, d, f, g, h = sympy.symbols('a b c d f g h')
+        exp = ((a | b) & (c | d)) | ((f | g) & h)
+        expected = BooleanQueryIssuer().issue('', '((a OR b) (c OR d)) OR ((f OR g) h)')[1]
+        issued = {}
+        # the whole query has 36 characters, and the longest subquery with its disjunctions pushed down 32
+        for args_sequence, max_length in ((['**no-pushdown'], 256), ([], 256), ([], 32), ([], 31)):
+            engine = get_offline_engine(['**search-type', 'issues', *args_sequence])
+            engine._query_issuer = BooleanQueryIssuer(max_length)
+            # the decomposers set the expression of the middle code to its DNF
+            results = engine.get_total_amount(SympyLogicMiddleCode(namespace='TEST', name='1', exp=exp))
+            self.assertEqual(results[0], expected)
+            issued[bool(args_sequence), max_length] = results[2]
+        self.assertGreater(issued[True, 256], 2 ** 4)
+        self.assertEqual(issued[False, 256], 1)
+        self.assertEqual(issued[False, 32], 3)
+        self.assertEqual(issued[False, 31], issued[True, 256])
+
+
+if __name__ == '__main__':
+    unittest.main()
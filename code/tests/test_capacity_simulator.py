@@ -0,0 +1,105 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from lib.classes.internal.query_issuers.capacity_simulator import CapacitySimulator
+from lib.classes.internal.query_issuers.runtime_calibration import RuntimeCalibration
+
+OUTPUT = '''
+--------------------------------------------------------------------
+    Results for query 1 from <../queries/01 - asyncio.in>
+
+        Results quantity: 69053
+
+        Sub-queries total: 15
+            Issued:          15 (100% of total)
+
+        Runtime:                           0:03:50
+--------------------------------------------------------------------
+'''
+
+
+def get_calibration(latency: float) -> RuntimeCalibration:
+    calibration = RuntimeCalibration()
+    calibration.add_request(latency)
+    return calibration
+
+
+class TestCapacitySimulator(unittest.TestCase):
+
+    def test_concurrency(self):
+        simulator = CapacitySimulator(get_calibration(1))
+        self.assertEqual(simulator.simulate(100, 1000, 30, 1), (100, 100))
+        self.assertEqual(simulator.simulate(100, 1000, 30, 10), (10, 10))
+        self.assertEqual(simulator.simulate(100, 1000, 30, 10, cache_hit_ratio=0.5), (5, 5))
+
+    def test_rate_limit(self):
+        simulator = CapacitySimulator(get_calibration(0.01))
+        # the bucket is full at the beginning, and then a token is refilled each 2 seconds
+        low, high = simulator.simulate(90, 1, 30, 4)
+        self.assertAlmostEqual(low, 120, delta=1)
+        low, high = simulator.simulate(90, 3, 30, 4)
+        self.assertLess(high, 1)
+        # the runtime beyond the simulated requests is extrapolated
+        simulator.MAX_SIMULATED_REQUESTS = 1000
+        low, high = simulator.simulate(10030, 1, 30, 1)
+        self.assertAlmostEqual(low, 20000, delta=10)
+
+    def test_rate_limit_exceeded(self):
+        calibration = get_calibration(1)
+        for _ in range(9):
+            calibration.add_request(1)
+        calibration.add_rate_limit_exceeded(60)
+        low, high = CapacitySimulator(calibration).simulate(100, 1000, 30, 1)
+        self.assertGreater(low, 100)
+        self.assertGreater(high, low)
+
+    def test_rate_limit_exceeded_storm(self):
+        calibration = get_calibration(1)
+        calibration.add_rate_limit_exceeded(1)
+        calibration.add_rate_limit_exceeded(1)
+        self.assertAlmostEqual(calibration.get_rate_limit_exceeded_ratio(), 2 / 3)
+        low, high = CapacitySimulator(calibration).simulate(100, 1000, 30, 1)
+        self.assertGreater(low, 100)
+        # with no request given, the simulated ones are still retried a bounded amount of times
+        calibration = RuntimeCalibration()
+        calibration.add_rate_limit_exceeded(1)
+        self.assertLess(calibration.get_rate_limit_exceeded_ratio(), 1)
+        self.assertGreater(CapacitySimulator(calibration).simulate(10, 1000, 30, 1)[0], 10)
+
+    def test_calibration(self):
+        with tempfile.TemporaryDirectory() as directory:
+            Path(directory, 'query.in.1.out').write_text(OUTPUT)
+            filename = os.path.join(directory, 'calibration.json')
+            calibration = RuntimeCalibration(filename)
+            calibration.add_output(Path(directory))
+            self.assertEqual(calibration.get_runs(), [(15, 230, 1, 30, 1)])
+            calibration.add_request(1)
+            # the runs of the outputs are not saved
+            calibration.save()
+            calibration = RuntimeCalibration(filename)
+            self.assertEqual(calibration.latencies, [1])
+            self.assertFalse(calibration.get_runs())
+            calibration.add_run(15, 30, 1, 30, 1)
+        # the runtime of the run is twice the simulated one
+        self.assertEqual(CapacitySimulator(calibration).simulate(15, 1, 30, 1), (30, 30))
+
+    def test_calibration_runs(self):
+        calibration = get_calibration(1)
+        simulator = CapacitySimulator(calibration)
+        simulated_runs = []
+        get_run_ratio = simulator._get_run_ratio
+        simulator._get_run_ratio = lambda *run: simulated_runs.append(run) or get_run_ratio(*run)
+        for i in range(calibration.MAX_RUNS + 10):
+            calibration.add_run(15, 15 * (i + 1), 1, 30, 1)
+            simulator.simulate(15, 1, 30, 1)
+        # only the last runs are kept, and each one is simulated once
+        self.assertEqual(len(calibration.get_runs()), calibration.MAX_RUNS)
+        self.assertEqual(calibration.get_runs()[0], (15, 15 * 11, 1, 30, 1))
+        self.assertEqual(len(simulated_runs), calibration.MAX_RUNS + 10)
+        self.assertEqual(len(simulator._run_ratios), calibration.MAX_RUNS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+import unittest
+from itertools import product
+
+import sympy
+
+from lib.classes.internal.decomposers.disjoint_decomposer import DisjointDecomposer
+from lib.classes.internal.middle_codes.sympy_logic_middle_code import SympyLogicMiddleCode
+
+
+class TestDisjointDecomposer(unittest.TestCase):
+
+    def test_get_subqueries(self):
+        a, b, c, d, e = symbols = sympy.symbols('a b c d e')
+        exp = sympy.Or(sympy.And(a, b), sympy.And(b, c), sympy.And(c, sympy.Not(d)), sympy.And(d, e))
+        decomposer = DisjointDecomposer()
+        decomposer.set_middle_code(SympyLogicMiddleCode(namespace='TEST', name='1', exp=exp))
+        subqueries = [q.exp for q, sum_factor in decomposer.get_subqueries()]
+        self.assertEqual(len(subqueries), decomposer.get_sub_queries_amount())
+        for values in product((True, False), repeat=len(symbols)):
+            assignment = dict(zip(symbols, values))
+            satisfied = sum(bool(q.subs(assignment)) for q in subqueries)
+            self.assertEqual(satisfied, int(bool(exp.subs(assignment))))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import itertools
+import os
+import tempfile
+import unittest
+
+import sympy
+
+from lib.classes.internal.decomposers.dnf_converter import DnfConverter
+
+
+class TestDnfConverter(unittest.TestCase):
+    def setUp(self):
+        self.symbols = sympy.symbols('a b c d e')
+
+    def test_equivalence(self):
+        a, b, c, d, e = self.symbols
+        exp = sympy.And(sympy.Or(a, b, sympy.Not(sympy.And(c, d))), sympy.Or(sympy.Not(a), e), sympy.Or(c, d, e))
+        terms = DnfConverter().convert(exp)
+        dnf = sympy.Or(*(sympy.And(*term) for term in terms))
+        for values in itertools.product((True, False), repeat=len(self.symbols)):
+            assignment = dict(zip(self.symbols, values))
+            self.assertEqual(bool(exp.subs(assignment)), bool(dnf.subs(assignment)))
+
+    def test_absorption_and_contradictions(self):
+        a, b, c, _, _ = self.symbols
+        exp = sympy.And(sympy.Or(a, sympy.And(a, b)), sympy.Or(sympy.Not(a), c))
+        self.assertEqual(DnfConverter().convert(exp), [frozenset((a, c))])
+
+    def test_budget(self):
+        exp = sympy.And(*(sympy.Or(*sympy.symbols(f'x{i}_:4')) for i in range(6)))
+        self.assertIsNone(DnfConverter(max_terms=1000).convert(exp))
+        self.assertEqual(len(DnfConverter(max_terms=4 ** 6).convert(exp)), 4 ** 6)
+
+    def test_cache(self):
+        a, b, c, d, e = self.symbols
+        shared = sympy.Or(sympy.And(a, b), c)
+        exp = sympy.And(shared, sympy.Or(d, sympy.Not(e)))
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'dnf')
+            converter = DnfConverter(cache_filename=filename)
+            terms = converter.convert(exp)
+            converter.close()
+            cached_terms = DnfConverter(cache_filename=filename, max_terms=0).convert(exp)
+        self.assertEqual(set(terms), set(cached_terms))
+
+    def test_unreadable_cache(self):
+        a, b, c = self.symbols[:3]
+        exp = sympy.And(sympy.Or(a, b), c)
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'dnf')
+            with open(filename, 'w') as file:
+                file.write('not a database')
+            converter = DnfConverter(cache_filename=filename)
+            self.assertEqual(set(converter.convert(exp)), {frozenset((a, c)), frozenset((b, c))})
+            converter.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
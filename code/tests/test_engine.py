@@ -0,0 +1,245 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import sympy
+
+from benchmarks.offline_engine import FakeQueryIssuer, get_offline_engine
+from lib.classes.internal.engines.checkpoint import Checkpoint
+from lib.classes.internal.middle_codes.sympy_logic_middle_code import SympyLogicMiddleCode
+from lib.classes.outputs.stream_outputs.file_output import FileOutput
+
+
+class TestEngine(unittest.TestCase):
+    def setUp(self):
+        a, b, c, d, f, g, h = sympy.symbols('a b c d f g h')
+        exp = sympy.Or(a & b, b & c, d, f & g, a & h, c & f)
+        self.middle_code = SympyLogicMiddleCode(namespace='TEST', name='1', exp=exp)
+        self.expected = sum(any(all(str(literal) in document for literal in term.args or (term,))
+                                for term in exp.args)
+                            for document in FakeQueryIssuer.DOCUMENTS)
+
+    def test_get_total_amount(self):
+        engine = get_offline_engine([])
+        results = engine.get_total_amount(self.middle_code)
+        self.assertEqual(results[0], self.expected)
+        self.assertEqual(results[2], len(engine._query_issuer.issued))
+
+    def test_concurrency(self):
+        for args_sequence in (['**concurrency', '8'], ['**concurrency', '8', '**prune-zeros'],
+                              ['**concurrency', '4', '**merge-subqueries']):
+            engine = get_offline_engine(args_sequence, latency=0.001)
+            results = engine.get_total_amount(self.middle_code)
+            self.assertEqual(results[0], self.expected)
+            issued = engine._query_issuer.issued
+            self.assertEqual(len(issued), len(set(issued)))
+            self.assertEqual(results[2], len(issued))
+
+    def test_concurrency_identical_subqueries(self):
+        """The subqueries waiting for an identical one in flight are not counted as issued"""
+        a, b, c = sympy.symbols('a b c')
+        middle_code = SympyLogicMiddleCode(namespace='TEST', name='1', exp=(a & b) | (a & c) | (b & c))
+        sequential = get_offline_engine([]).get_total_amount(middle_code)
+        engine = get_offline_engine(['**concurrency', '8'], latency=0.01)
+        results = engine.get_total_amount(SympyLogicMiddleCode(namespace='TEST', name='1',
+                                                               exp=(a & b) | (a & c) | (b & c)))
+        self.assertEqual(results[0], sequential[0])
+        self.assertEqual(results[2], len(engine._query_issuer.issued))
+        self.assertEqual(results[3] + results[4] + results[5], results[2])
+        self.assertEqual(results[2:6], sequential[2:6])
+
+    def test_fallback_decomposer(self):
+        a, b, c, d = sympy.symbols('a b c d')
+        exp = (a & b) | (b & c) | (c & d)
+        middle_code = SympyLogicMiddleCode(namespace='TEST', name='2', exp=exp)
+        engine = get_offline_engine(['**decomposer', 'disjoint'])
+        # the negations of the disjoint subqueries are expanded, so the fallback decomposer is not needed
+        engine._query_issuer.satisfies_query_restrictions = lambda query: 'NOT' not in query
+        conversions = []
+        convert_to_dnf = engine._main_decomposer._convert_to_dnf
+        engine._main_decomposer._convert_to_dnf = lambda: conversions.append(None) or convert_to_dnf()
+        results = engine.get_total_amount(middle_code)
+        self.assertIs(engine._decomposer, engine._main_decomposer)
+        # the decomposer is not set again after probing it
+        self.assertEqual(len(conversions), 1)
+        self.assertEqual(results[0], sum(bool(exp.subs({s: str(s) in document for s in (a, b, c, d)}))
+                                         for document in FakeQueryIssuer.DOCUMENTS))
+        self.assertEqual(engine._decomposer.get_expansion_sub_queries_amount(), 2)
+        self.assertEqual(results[1], len(engine._query_issuer.issued))
+        self.assertEqual(results[1], results[2])
+
+    def test_plan(self):
+        a, b, c, d = sympy.symbols('a b c d')
+        middle_codes = [SympyLogicMiddleCode(namespace='TEST', name=str(i), exp=exp)
+                        for i, exp in enumerate((a | b | c, b | c | d, a | b), 1)]
+        engine = get_offline_engine(['**concurrency', '4'])
+        plan = engine.plan(middle_codes)
+        issued = engine._query_issuer.issued
+        self.assertEqual(len(issued), len(set(issued)))
+        self.assertEqual(plan[1], 7 + 7 + 3)
+        self.assertEqual(plan[2], len(issued))
+        for middle_code in middle_codes:
+            results = engine.get_total_amount(middle_code)
+            self.assertEqual(results[2], 0)
+            self.assertEqual(results[0], sum(middle_code.exp.subs({s: str(s) in document for s in (a, b, c, d)})
+                                             in (True, sympy.true) for document in FakeQueryIssuer.DOCUMENTS))
+
+    def test_checkpoint(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'checkpoint')
+            for args_sequence in ([], ['**concurrency', '4'], ['**merge-subqueries']):
+                engine = get_offline_engine(args_sequence)
+                engine.get_total_amount(self.middle_code)
+                issued = len(engine._query_issuer.issued)
+                for fail_after in (issued // 2, issued // 4, None):
+                    engine = get_offline_engine(args_sequence)
+                    engine.CHECKPOINT_RANKS = 4
+                    engine._checkpoint = Checkpoint(filename, interval=0)
+                    engine._query_issuer = FakeQueryIssuer(fail_after=fail_after)
+                    try:
+                        results = engine.get_total_amount(self.middle_code)
+                    except ConnectionError:
+                        continue
+                    self.assertEqual(results[0], self.expected)
+                    self.assertLess(len(engine._query_issuer.issued), issued)
+                # the finished query is taken from the checkpoint
+                engine = get_offline_engine(args_sequence)
+                engine._checkpoint = Checkpoint(filename)
+                self.assertEqual(engine.get_total_amount(self.middle_code)[0], self.expected)
+                self.assertFalse(engine._query_issuer.issued)
+                # but not for another endpoint
+                engine = get_offline_engine(args_sequence + ['**url', 'https://github.example.com/api/v3'])
+                engine._checkpoint = Checkpoint(filename)
+                self.assertEqual(engine.get_total_amount(self.middle_code)[0], self.expected)
+                self.assertEqual(len(engine._query_issuer.issued), issued)
+                os.remove(filename)
+
+    def test_sharding(self):
+        a, b, e = sympy.symbols('a b e')
+        middle_code = SympyLogicMiddleCode(namespace='TEST', name='2', exp=a | b | e)
+        expected = sum(bool({'a', 'b', 'e'} & document) for document in FakeQueryIssuer.DOCUMENTS)
+        with tempfile.TemporaryDirectory() as directory:
+            engine = get_offline_engine(['**workers', '2'], cache_options=['shelf', os.path.join(directory, 'cache')])
+            engine.SHARDING_MIN_SUBQUERIES = 1
+            self.assertEqual(engine.get_total_amount(self.middle_code)[0], self.expected)
+            issued = len(engine._query_issuer.issued)
+            cached = len(engine._cache)
+            # the shards are read from the shelf while it is closed, and then it is written again
+            results = engine.get_total_amount(self.middle_code)
+            self.assertEqual((results[0], results[2]), (self.expected, 0))
+            self.assertEqual(engine.get_total_amount(middle_code)[0], expected)
+            self.assertGreater(len(engine._query_issuer.issued), issued)
+            self.assertGreater(len(engine._cache), cached)
+            engine.close()
+
+    def test_progressive(self):
+        for args_sequence in ([], ['**concurrency', '4']):
+            engine = get_offline_engine(args_sequence, progressive=True)
+            engine.CHECKPOINT_RANKS = 4
+            positions = []
+            set_position = engine._set_position
+            engine._set_position = lambda *args: positions.append(args[1].position) or set_position(*args)
+            reports = []
+            results = engine.get_total_amount(self.middle_code, lambda _, progress: reports.append(progress))
+            self.assertEqual(results[0], self.expected)
+            self.assertEqual([report[3] for report in reports], list(range(1, 7)))
+            # the subqueries in flight are only waited for at the end of each depth
+            self.assertEqual(positions, engine._depths_end_ranks)
+            for _, lower_bound, upper_bound, *_ in reports:
+                self.assertLessEqual(lower_bound, self.expected)
+                self.assertGreaterEqual(upper_bound, self.expected)
+            self.assertEqual(reports[-1][1:3], (self.expected, self.expected))
+
+    def test_progressive_not_ranked(self):
+        """The progress of the subqueries that are not ranked is reported periodically"""
+        engine = get_offline_engine(['**prune-zeros'], progressive=True)
+        engine.PROGRESS_INTERVAL = 0
+        reports = []
+        results = engine.get_total_amount(self.middle_code, lambda _, progress: reports.append(progress))
+        self.assertEqual(results[0], self.expected)
+        self.assertTrue(reports)
+        self.assertEqual([report[4] for report in reports], sorted(report[4] for report in reports))
+        self.assertEqual(reports[-1][0], self.expected)
+
+    def test_progressive_file_output(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = FileOutput(Path(directory, 'output'))
+            engine = get_offline_engine([], progressive=True)
+            engine.get_total_amount(self.middle_code,
+                                    lambda middle_code, progress: output.output_progress(middle_code, False, progress))
+            output.file.close()
+            with open(os.path.join(directory, 'output')) as file:
+                self.assertEqual(file.read().count('Interim results for query'), 6)
+
+    def test_max_requests(self):
+        engine = get_offline_engine([], max_requests=10)
+        results = engine.get_total_amount(self.middle_code)
+        self.assertEqual(len(engine._query_issuer.issued), 10)
+        self.assertGreater(results[-1], 0)
+        lower_bound, upper_bound = results[15:17]
+        self.assertLessEqual(lower_bound, self.expected)
+        self.assertGreaterEqual(upper_bound, self.expected)
+        # the subqueries not evaluated are not taken as cached
+        message = FileOutput(None)._get_message(self.middle_code, False, *results)
+        self.assertIn(f'Not evaluated:   {results[-1]} ', message)
+        self.assertNotIn('From cache', message)
+
+    def test_max_depth_failed_subquery(self):
+        engine = get_offline_engine(['**max-depth', '2'])
+        issue = engine._query_issuer.issue
+        engine._query_issuer.issue = lambda name, query: (False, 0) if query == 'a b c' else issue(name, query)
+        results = engine.get_total_amount(self.middle_code)
+        self.assertEqual(results[4] + results[5], 1)
+        self.assertEqual(results[15:17], (None, None))
+        message = FileOutput(None)._get_message(self.middle_code, False, *results)
+        self.assertIn('Results amount bounds: unknown', message)
+
+    def test_max_requests_cached(self):
+        """Once the maximum amount of requests is reached, the subqueries already cached are still evaluated"""
+        engine = get_offline_engine([], max_requests=3)
+        a, b = sympy.symbols('a b')
+        middle_code = SympyLogicMiddleCode(namespace='TEST', name='2', exp=a | b)
+        engine.get_total_amount(middle_code)
+        results = engine.get_total_amount(self.middle_code)
+        self.assertGreater(results[-1], 0)
+        results = engine.get_total_amount(middle_code)
+        self.assertEqual(results[0], sum(bool({'a', 'b'} & document) for document in FakeQueryIssuer.DOCUMENTS))
+        self.assertEqual(results[-1], 0)
+
+    def test_max_requests_pruning(self):
+        engine = get_offline_engine(['**prune-zeros'], max_requests=10)
+        middle_code = SympyLogicMiddleCode(namespace='TEST', name='2', exp=self.middle_code.exp | sympy.Symbol('x'))
+        results = engine.get_total_amount(middle_code)
+        pruned_subqueries, not_evaluated_subqueries = results[13], results[-1]
+        self.assertGreater(pruned_subqueries, 0)
+        self.assertGreater(not_evaluated_subqueries, 0)
+        self.assertEqual(results[1], results[2] + pruned_subqueries + not_evaluated_subqueries)
+        message = FileOutput(None)._get_message(middle_code, False, *results)
+        self.assertNotIn('From cache', message)
+
+    def test_max_requests_checkpoint(self):
+        """The checkpoint is saved where the evaluation stopped, so no subquery is issued again on resuming"""
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'checkpoint')
+            for args_sequence in ([], ['**concurrency', '4'], ['**merge-subqueries']):
+                engine = get_offline_engine(args_sequence)
+                engine.get_total_amount(self.middle_code)
+                issued = len(engine._query_issuer.issued)
+                engine = get_offline_engine(args_sequence, max_requests=issued // 3)
+                engine.CHECKPOINT_RANKS = 4
+                engine._checkpoint = Checkpoint(filename)
+                engine.get_total_amount(self.middle_code)
+                first_issued = engine._query_issuer.issued
+                engine = get_offline_engine(args_sequence)
+                engine.CHECKPOINT_RANKS = 4
+                engine._checkpoint = Checkpoint(filename)
+                results = engine.get_total_amount(self.middle_code)
+                self.assertEqual(results[0], self.expected)
+                self.assertFalse(set(first_issued) & set(engine._query_issuer.issued))
+                self.assertEqual(len(first_issued) + len(engine._query_issuer.issued), issued)
+                os.remove(filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
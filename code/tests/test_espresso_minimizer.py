@@ -0,0 +1,38 @@
+import itertools
+import random
+import unittest
+
+import sympy
+
+from lib.classes.internal.decomposers.espresso_minimizer import EspressoMinimizer
+
+
+def evaluate(terms, assignment) -> bool:
+    return any(all(not assignment[literal.args[0]] if isinstance(literal, sympy.Not) else assignment[literal]
+                   for literal in term)
+               for term in terms)
+
+
+class TestEspressoMinimizer(unittest.TestCase):
+    def test_consensus(self):
+        a, b, c = sympy.symbols('a b c')
+        # a & b | a & ~b | b & c == a | b & c
+        terms = [frozenset((a, b)), frozenset((a, sympy.Not(b))), frozenset((b, c))]
+        self.assertEqual(set(EspressoMinimizer().minimize(terms)), {frozenset((a,)), frozenset((b, c))})
+
+    def test_equivalence(self):
+        symbols = sympy.symbols('x:6')
+        generator = random.Random(0)
+        for _ in range(20):
+            terms = [frozenset(generator.choice((symbol, sympy.Not(symbol)))
+                               for symbol in generator.sample(symbols, generator.randint(1, 4)))
+                     for _ in range(generator.randint(2, 12))]
+            minimized = EspressoMinimizer().minimize(terms)
+            self.assertLessEqual(len(minimized), len(terms))
+            for values in itertools.product((True, False), repeat=len(symbols)):
+                assignment = dict(zip(symbols, values))
+                self.assertEqual(evaluate(terms, assignment), evaluate(minimized, assignment))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import itertools
+import unittest
+
+import sympy
+
+from lib.classes.internal.decomposers.exclusion_inclusion_decomposer import ExclusionInclusionDecomposer
+from lib.classes.internal.middle_codes.sympy_logic_middle_code import SympyLogicMiddleCode
+from lib.classes.internal.translators.spaces_translator import SpacesTranslator
+
+
+def get_middle_code(exp: sympy.Basic) -> SympyLogicMiddleCode:
+    return SympyLogicMiddleCode(namespace='TEST', name='1', exp=exp)
+
+
+def count(documents, conjunction: sympy.Basic) -> int:
+    literals = conjunction.args if isinstance(conjunction, sympy.And) else (conjunction,)
+    return sum(all(str(literal) in document for literal in literals) for document in documents)
+
+
+class TestExclusionInclusionDecomposer(unittest.TestCase):
+    DOCUMENTS = ({'a', 'b'}, {'a', 'c'}, {'b', 'c', 'd'}, {'d'}, {'a', 'b', 'c'})
+
+    def setUp(self):
+        a, b, c, d = sympy.symbols('a b c d')
+        self.exp = sympy.Or(a, b, c, d)
+
+    def _get_total(self, decomposer: ExclusionInclusionDecomposer) -> int:
+        total = 0
+        for q, sum_factor in decomposer.get_subqueries():
+            amount = count(self.DOCUMENTS, q.exp)
+            decomposer.set_sub_amount(q.name, amount, issued=True)
+            total += sum_factor * amount
+        return total
+
+    def test_get_subqueries(self):
+        decomposer = ExclusionInclusionDecomposer()
+        decomposer.set_middle_code(get_middle_code(self.exp))
+        self.assertEqual(decomposer.get_sub_queries_amount(), 15)
+        self.assertEqual(len(list(decomposer.get_subqueries())), 15)
+        decomposer.set_middle_code(get_middle_code(self.exp))
+        self.assertEqual(self._get_total(decomposer), len(self.DOCUMENTS))
+
+    def test_bitmask_enumeration(self):
+        """The subqueries and signs are the ones of the combinations of terms enumerated as sympy conjunctions"""
+        a, b, c, d, e = sympy.symbols('a b c d e')
+        exp = sympy.Or(sympy.And(a, b), sympy.And(b, c), d, sympy.And(a, sympy.Not(e)))
+        decomposer = ExclusionInclusionDecomposer()
+        decomposer.set_middle_code(get_middle_code(exp))
+        terms = sympy.Or.make_args(decomposer._middle_code.exp)
+        expected = sorted((str(sympy.And(*combination)), 1 if p & 1 else -1)
+                          for p in range(1, len(terms) + 1)
+                          for combination in itertools.combinations(terms, p))
+        self.assertEqual(sorted((str(q.exp), sum_factor) for q, sum_factor in decomposer.get_subqueries()),
+                         expected)
+
+    def test_prune_zeros(self):
+        decomposer = ExclusionInclusionDecomposer(prune_zeros=True)
+        decomposer.set_middle_code(get_middle_code(self.exp))
+        self.assertEqual(self._get_total(decomposer), len(self.DOCUMENTS))
+        # a & d is the only empty pair, so a & b & d, a & c & d and a & b & c & d are pruned
+        self.assertEqual(decomposer.get_pruned_sub_queries_amount(), 3)
+
+    def test_merge_subqueries(self):
+        a, b, c, d = sympy.symbols('a b c d')
+        exp = sympy.Or(sympy.And(a, b), sympy.And(a, c), sympy.And(b, c), d)
+        decomposer = ExclusionInclusionDecomposer(merge_subqueries=True)
+        decomposer.set_middle_code(get_middle_code(exp))
+        # the 15 combinations collapse into a & b, a & c, b & c, a & b & c and their unions with d
+        self.assertEqual(decomposer.get_sub_queries_amount(), 9)
+        self.assertEqual(len({str(q.exp) for q, _ in decomposer.get_subqueries()}), 9)
+        self.assertEqual(self._get_total(decomposer), len(self.DOCUMENTS))
+
+    def test_merge_subqueries_prune_zeros(self):
+        decomposer = ExclusionInclusionDecomposer(prune_zeros=True, merge_subqueries=True)
+        decomposer.set_middle_code(get_middle_code(self.exp))
+        self.assertEqual(self._get_total(decomposer), len(self.DOCUMENTS))
+        self.assertEqual(decomposer.get_pruned_sub_queries_amount(), 3)
+
+    def test_max_depth(self):
+        for merge_subqueries in (False, True):
+            decomposer = ExclusionInclusionDecomposer(merge_subqueries=merge_subqueries, max_depth=2)
+            decomposer.set_middle_code(get_middle_code(self.exp))
+            total = self._get_total(decomposer)
+            lower_bound, upper_bound = decomposer.get_bounds()
+            self.assertEqual(decomposer.get_truncated_sub_queries_amount(), 5)
+            self.assertEqual(total, lower_bound)
+            self.assertLessEqual(lower_bound, len(self.DOCUMENTS))
+            self.assertLessEqual(len(self.DOCUMENTS), upper_bound)
+
+    def test_max_depth_missing_amount(self):
+        """The partial sums are not bounds if the amount of some subquery is not known"""
+        decomposer = ExclusionInclusionDecomposer(max_depth=2)
+        decomposer.set_middle_code(get_middle_code(self.exp))
+        for i, (q, _) in enumerate(decomposer.get_subqueries()):
+            decomposer.set_sub_amount(q.name, None if i == 5 else count(self.DOCUMENTS, q.exp), issued=True)
+        self.assertIsNone(decomposer.get_bounds())
+        self.assertIsNotNone(decomposer.get_partial_bounds(1))
+
+    def test_translated_subqueries_range(self):
+        a, b, c, d, e = sympy.symbols('a b c d e')
+        exp = sympy.Or(a, b, sympy.And(c, d), sympy.And(d, e), sympy.Not(e))
+        translator = SpacesTranslator()
+        for merge_subqueries in (False, True):
+            for max_depth in (None, 3):
+                decomposer = ExclusionInclusionDecomposer(merge_subqueries=merge_subqueries, max_depth=max_depth)
+                decomposer.set_middle_code(get_middle_code(exp))
+                expected = sorted((q, f) for _, q, f in decomposer.get_translated_subqueries(translator))
+                ranked = decomposer.get_ranked_sub_queries_amount()
+                self.assertEqual(ranked, decomposer.get_sub_queries_amount())
+                subqueries = []
+                for begin in range(0, ranked, 7):
+                    subqueries.extend((q, f) for _, q, f in
+                                      decomposer.get_translated_subqueries_range(translator, begin, begin + 7))
+                self.assertEqual(sorted(subqueries), expected)
+
+    def test_negations_expansion(self):
+        a, b, c, d = sympy.symbols('a b c d')
+        exp = sympy.Or(sympy.And(a, sympy.Not(b), sympy.Not(c), sympy.Not(d)), sympy.And(b, c))
+        decomposer = ExclusionInclusionDecomposer()
+        decomposer.set_query_restrictions(lambda query: query.count('NOT ') <= 1)
+        decomposer.set_middle_code(get_middle_code(exp))
+        total = 0
+        for name, query, sum_factor in decomposer.get_translated_subqueries(SpacesTranslator()):
+            self.assertLessEqual(query.count('NOT '), 1)
+            words = query.replace('NOT ', '~').split()
+            total += sum_factor * sum(all(word[1:] not in document if word.startswith('~') else word in document
+                                          for word in words)
+                                      for document in self.DOCUMENTS)
+        self.assertEqual(total, sum(bool(exp.subs({s: s.name in document for s in (a, b, c, d)}))
+                                    for document in self.DOCUMENTS))
+
+    def test_negations_expansion_all_negated(self):
+        """A conjunction of negated literals is not expanded, as that would give the empty query"""
+        a, b, c, d = sympy.symbols('a b c d')
+        exp = sympy.Or(sympy.And(sympy.Not(a), sympy.Not(b)), sympy.And(c, sympy.Not(d)))
+        decomposer = ExclusionInclusionDecomposer()
+        decomposer.set_query_restrictions(lambda query: 'NOT ' not in query)
+        decomposer.set_middle_code(get_middle_code(exp))
+        queries = [query for _, query, _ in decomposer.get_translated_subqueries(SpacesTranslator())]
+        self.assertNotIn('', queries)
+        self.assertIn('NOT a NOT b', queries)
+        self.assertIn('c d', queries)
+
+
+if __name__ == '__main__':
+    unittest.main()
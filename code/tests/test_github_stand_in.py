@@ -0,0 +1,67 @@
+import json
+import time
+import unittest
+
+import sympy
+
+from benchmarks.github_stand_in import GithubStandIn, SyntheticDocuments
+from lib.classes.internal.engines.github_v3_engine import GithubV3Engine
+from lib.classes.internal.middle_codes.sympy_logic_middle_code import SympyLogicMiddleCode
+from lib.utilities.metrics import METRICS
+from lib.utilities.with_external_arguments import CustomArgumentParser
+
+
+def get_engine(url: str, *args_sequence: str) -> GithubV3Engine:
+    return GithubV3Engine(['**url', url, '**backoff-factor', '0', *args_sequence],
+                          'in-memory', [], False, CustomArgumentParser())
+
+
+class TestGithubStandIn(unittest.TestCase):
+    def setUp(self):
+        self.documents = SyntheticDocuments(1000)
+        self.terms = ['a', 'b', 'c', 'd']
+        self.middle_code = SympyLogicMiddleCode(namespace='TEST', name='1',
+                                                exp=sympy.Or(*sympy.symbols(self.terms)))
+
+    def test_concurrency(self):
+        with GithubStandIn(self.documents, secondary_every=5, retry_after=0, rejected=['rejected']) as stand_in:
+            engine = get_engine(stand_in.url, '**concurrency', '4', '**credentials', 'first', 'rejected', 'second')
+            results = engine.get_total_amount(self.middle_code)
+        self.assertEqual(results[0], self.documents.count_union(self.terms))
+        self.assertEqual(results[2], 2 ** len(self.terms) - 1)
+        self.assertEqual(results[3], results[2])
+        self.assertEqual(stand_in.served, results[2])
+        self.assertEqual(stand_in.secondary_limited, stand_in.search_requests // 5)
+
+    def test_rate_limit(self):
+        METRICS.reset()
+        with GithubStandIn(self.documents, limit=5, period=1) as stand_in:
+            engine = get_engine(stand_in.url, '**concurrency', '4', '**rate-limit-period', '1',
+                                '**credentials', 'first')
+            start = time.monotonic()
+            results = engine.get_total_amount(self.middle_code)
+            elapsed = time.monotonic() - start
+        self.assertEqual(results[0], self.documents.count_union(self.terms))
+        # the requests rejected near the reset of a window are retried
+        self.assertEqual(results[3], results[2])
+        # the first five are issued at once, and then five per window, whose reset is rounded up to seconds
+        self.assertGreaterEqual(elapsed, (results[2] - 5) / 5 - 0.5)
+        self.assertLess(elapsed, 2 * results[2] / 5)
+        self.assertGreater(METRICS.get_histogram_count('rate_limit_sleep_seconds'), 0)
+        # the requests allowed are given per period of the rate limit, of a second here, not per minute
+        self.assertLess(METRICS.get_gauge('rate_limit_utilization'), 2)
+
+    def test_count_only(self):
+        METRICS.reset()
+        with GithubStandIn(self.documents) as stand_in:
+            results = get_engine(stand_in.url, '**credentials', 'first').get_total_amount(self.middle_code)
+        self.assertEqual(results[0], self.documents.count_union(self.terms))
+        # each response, the one of the rate limit included, is a compressed page of a single item
+        self.assertLess(stand_in.response_bytes / (stand_in.search_requests + 1),
+                        len(json.dumps(stand_in.get_search_item('a', 0))))
+        # no request waited for the rate limit
+        self.assertEqual(METRICS.get_histogram_count('rate_limit_sleep_seconds'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import time
+import unittest
+
+import sympy
+
+from benchmarks.github_stand_in import GithubStandIn, SyntheticDocuments
+from lib.classes.internal.engines.github_v4_engine import GithubV4Engine
+from lib.classes.internal.middle_codes.sympy_logic_middle_code import SympyLogicMiddleCode
+from lib.classes.internal.query_issuers.githubv4_query_issuer import GithubV4Search
+from lib.utilities.metrics import METRICS
+from lib.utilities.with_external_arguments import CustomArgumentParser
+
+
+def get_engine(url: str, *args_sequence: str, simulate: bool = False) -> GithubV4Engine:
+    return GithubV4Engine(['**url', url, '**backoff-factor', '0', *args_sequence],
+                          'in-memory', [], simulate, CustomArgumentParser())
+
+
+class TestGithubV4Engine(unittest.TestCase):
+    def setUp(self):
+        self.documents = SyntheticDocuments(1000)
+        self.terms = ['a', 'b', 'c', 'd']
+        self.middle_code = SympyLogicMiddleCode(namespace='TEST', name='1',
+                                                exp=sympy.Or(*sympy.symbols(self.terms)))
+
+    def test_engines_import(self):
+        """The engines do not use what urllib3 only has since 2.0, as urllib3 1.26 is supported"""
+        from lib.classes.internal.engines import ENGINE_TYPE
+        self.assertIs(ENGINE_TYPE[GithubV4Engine.ARG_NAME], GithubV4Engine)
+
+    def test_batches(self):
+        METRICS.reset()
+        with GithubStandIn(self.documents) as stand_in:
+            engine = get_engine(stand_in.url, '**batch-size', '4', '**no-pushdown', '**credentials', 'first')
+            results = engine.get_total_amount(self.middle_code)
+        self.assertEqual(results[0], self.documents.count_union(self.terms))
+        self.assertEqual(results[2], 2 ** len(self.terms) - 1)
+        self.assertEqual(results[3], results[2])
+        self.assertEqual(stand_in.graphql_searches, results[2])
+        # besides the query of the rate limit of the credential
+        self.assertEqual(stand_in.graphql_requests - 1, METRICS.get_counter('graphql_batches_total'))
+        self.assertEqual(METRICS.get_counter('graphql_batches_total'), -(-results[2] // 4))
+        self.assertEqual(METRICS.get_counter('requests_total'), METRICS.get_counter('graphql_batches_total'))
+        self.assertEqual(METRICS.get_gauge('rate_limit_remaining', account='Credential 1'),
+                         stand_in.points_limit - METRICS.get_counter('graphql_batches_total'))
+
+    def test_push_down(self):
+        with GithubStandIn(self.documents) as stand_in:
+            results = get_engine(stand_in.url, '**credentials', 'first').get_total_amount(self.middle_code)
+        self.assertEqual(results[0], self.documents.count_union(self.terms))
+        self.assertEqual(stand_in.graphql_searches, 1)
+
+    def test_errors(self):
+        with GithubStandIn(self.documents, secondary_every=3, retry_after=0, rejected=['rejected'],
+                           failed=['a']) as stand_in:
+            engine = get_engine(stand_in.url, '**batch-size', '4', '**no-pushdown',
+                                '**credentials', 'rejected', 'first')
+            results = engine.get_total_amount(self.middle_code)
+        # only the search of the failed subquery is not given, and the batches limited are retried
+        self.assertEqual(results[3], results[2] - 1)
+        self.assertEqual(stand_in.graphql_searches, results[2])
+        self.assertGreater(stand_in.secondary_limited, 0)
+        self.assertEqual(stand_in.unauthorized, 1)
+
+    def test_rate_limit(self):
+        with GithubStandIn(self.documents, points_limit=2, points_period=1) as stand_in:
+            engine = get_engine(stand_in.url, '**batch-size', '5', '**no-pushdown', '**rate-limit-period', '1',
+                                '**credentials', 'first')
+            start = time.monotonic()
+            results = engine.get_total_amount(self.middle_code)
+            elapsed = time.monotonic() - start
+        self.assertEqual(results[0], self.documents.count_union(self.terms))
+        self.assertEqual(results[3], results[2])
+        # the third batch waits for the reset of the window, which is rounded up to seconds
+        self.assertGreaterEqual(elapsed, 0.5)
+        self.assertLess(elapsed, 5)
+
+    def test_batch_document(self):
+        issuer = get_engine('http://localhost', '**batch-size', '1000000', simulate=True)._query_issuer
+        self.assertEqual(issuer.batch_size, issuer.NODE_LIMIT)
+        document, variables = issuer.get_batch_document([GithubV4Search('1', 'a NOT b'), GithubV4Search('2', 'c')])
+        self.assertEqual(variables, {'q0': 'a NOT b', 'q1': 'c'})
+        self.assertIn('query($q0: String!, $q1: String!)', document)
+        self.assertIn('s1: search(query: $q1, type: ISSUE, first: 1) { issueCount }', document)
+        self.assertEqual([issuer.get_batch_cost(size) for size in (1, 100, 101)], [1, 1, 2])
+
+    def test_estimated_time(self):
+        issuer = get_engine('http://localhost', '**batch-size', '100', simulate=True)._query_issuer
+        # a batch per 0.72 seconds, the points per hour of a credential
+        self.assertEqual(issuer.get_estimated_time(1000)[0], '0:00:07.200000')
+
+
+if __name__ == '__main__':
+    unittest.main()
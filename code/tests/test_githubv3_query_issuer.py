@@ -0,0 +1,51 @@
+import time
+import unittest
+from typing import Tuple
+
+from github import BadCredentialsException
+
+from lib.classes.internal.query_issuers.githubv3_query_issuer import GithubV3QueryIssuer, GithubV3Account
+from lib.classes.internal.query_issuers.rate_limiter import RateLimiter
+
+
+class FakeClient:
+    def __init__(self, rejected=False):
+        self.rejected = rejected
+        self.issued = 0
+        self.rate_limiting = (30, 30)
+        self.rate_limiting_resettime = time.time() + 60
+
+
+def search(client: FakeClient, query: str) -> Tuple[int, bool]:
+    if client.rejected:
+        raise BadCredentialsException(401, None, None)
+    client.issued += 1
+    return 1, False
+
+
+def get_query_issuer() -> GithubV3QueryIssuer:
+    return GithubV3QueryIssuer([], '', search, 128, True,
+                               0, None, None, None, 0, 0, 1, False)
+
+
+class TestGithubV3QueryIssuer(unittest.TestCase):
+
+    def test_check_query_restrictions(self):
+        query_issuer = get_query_issuer()
+        self.assertTrue(query_issuer.check_query_restrictions('a NOT b', 'TEST'))
+        self.assertFalse(query_issuer.check_query_restrictions('a' * 129, 'TEST'))
+        self.assertFalse(query_issuer.check_query_restrictions('a' + ' NOT b' * 6, 'TEST'))
+
+    def test_accounts(self):
+        query_issuer = get_query_issuer()
+        clients = [FakeClient(), FakeClient(rejected=True), FakeClient()]
+        query_issuer._accounts = [GithubV3Account(str(i), client, RateLimiter(2))
+                                  for i, client in enumerate(clients)]
+        for _ in range(4):
+            self.assertEqual(query_issuer.issue('TEST', 'a'), (True, 1))
+        self.assertEqual([client.issued for client in clients], [2, 0, 2])
+        self.assertFalse(query_issuer._accounts[1].healthy)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import tempfile
+import unittest
+from array import array
+
+import sympy
+
+from benchmarks.offline_engine import get_offline_engine
+from lib.classes.internal.engines.local_index_engine import LocalIndexEngine
+from lib.classes.internal.indexes.inverted_index import InvertedIndex
+from lib.classes.internal.middle_codes.sympy_logic_middle_code import SympyLogicMiddleCode
+from lib.utilities.with_external_arguments import CustomArgumentParser
+
+
+class TestLocalIndexEngine(unittest.TestCase):
+    DOCUMENTS = {
+        'one.py': 'import a b',
+        'two.py': 'A c\n',
+        'three.txt': 'b, c; d',
+        'sub/four.txt': 'd',
+        'sub/five.py': 'a b c "e f"',
+        'sub/.git/ignored': 'a b c d',
+        'binary.bin': 'a\0b',
+    }
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        for filename, text in self.DOCUMENTS.items():
+            path = os.path.join(self.directory.name, filename)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as file:
+                file.write(text)
+        self.index_filename = os.path.join(self.directory.name, 'index')
+        self.engine = LocalIndexEngine(['**index', self.index_filename, '**corpus', self.directory.name],
+                                       'in-memory', [], False, CustomArgumentParser())
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def count(self, exp: sympy.Basic) -> int:
+        return self.engine.get_total_amount(SympyLogicMiddleCode(namespace='TEST', name='1', exp=exp))[0]
+
+    def test_get_total_amount(self):
+        a, b, c, d, e, f = sympy.symbols('a b c d e f')
+        self.assertEqual(self.engine._index.documents, 5)
+        self.assertEqual(self.count(a), 3)
+        self.assertEqual(self.count(a & ~b), 1)
+        self.assertEqual(self.count(~a), 2)
+        self.assertEqual(self.count((a | d) & ~(b & c)), 3)
+        self.assertEqual(self.count(sympy.Symbol('extension:py') & c), 2)
+        self.assertEqual(self.count(sympy.Symbol('filename:four.txt')), 1)
+        self.assertEqual(self.count(sympy.Symbol('"E F"')), 1)
+        self.assertEqual(self.count(sympy.Symbol('missing') | e), 1)
+
+    def test_load(self):
+        index = InvertedIndex.load(self.index_filename)
+        self.assertEqual(index.documents, 5)
+        self.assertEqual(index.terms, self.engine._index.terms)
+        exp = sympy.Or(*sympy.symbols('a d')) & ~sympy.Symbol('c')
+        self.assertEqual(index.count(exp), self.engine._index.count(exp))
+
+    def test_qualifiers(self):
+        index = self.engine._index
+        self.assertEqual(index.count(sympy.Symbol('language:Python')), 3)
+        self.assertEqual(index.count(sympy.Symbol('language:"Python"') & sympy.Symbol('c')), 2)
+        self.assertEqual(index.count(sympy.Symbol('language:java')), 0)
+        with self.assertRaises(ValueError):
+            index.count(sympy.Symbol('language:cobol'))
+        with self.assertRaises(ValueError):
+            index.count(sympy.Symbol('repo:owner/name'))
+        # not a qualifier of the GitHub search, so its words are looked for
+        self.assertEqual(index.count(sympy.Symbol('import:a')), 1)
+
+    def test_memoized_bitsets(self):
+        index = InvertedIndex.load(self.index_filename)
+        index._max_memoized_bitsets = 2
+        for term in ('a', 'b', 'c', 'd'):
+            index.get_literal_bitset(term)
+            self.assertLessEqual(len(index._bitsets), 2)
+        self.assertEqual(index.count(sympy.Symbol('a') & sympy.Symbol('b')), 2)
+
+    def test_compression(self):
+        ids = list(range(0, 1000, 3))
+        for documents in (1000, 100000):
+            index = InvertedIndex(documents, {'t': InvertedIndex._compress(array('I', ids), documents)})
+            self.assertEqual(index._get_term_bitset('t'), sum(1 << i for i in ids))
+
+    def test_oracle(self):
+        """The inclusion-exclusion over the conjunctions counted in the index gives the same amount"""
+        a, b, c, d = sympy.symbols('a b c d')
+        exp = (a & b) | (b & c) | d | (a & ~c)
+        engine = get_offline_engine([])
+        index = self.engine._index
+        engine._query_issuer.issue = lambda name, query: (True, index.count(sympy.And(*(
+            sympy.Not(sympy.Symbol(literal[4:])) if literal.startswith('NOT_') else sympy.Symbol(literal)
+            for literal in query.replace('NOT ', 'NOT_').split()))))
+        middle_code = SympyLogicMiddleCode(namespace='TEST', name='1', exp=exp)
+        self.assertEqual(engine.get_total_amount(middle_code)[0], self.count(exp))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import json
+import os
+import tempfile
+import unittest
+
+import sympy
+from urllib3.exceptions import MaxRetryError
+
+from benchmarks.offline_engine import get_offline_engine
+from lib.classes.internal.engines.github_v3_engine import GithubV3Engine
+from lib.classes.internal.middle_codes.sympy_logic_middle_code import SympyLogicMiddleCode
+from lib.classes.internal.query_issuers.githubv3_query_issuer import MeasuredRetry
+from lib.utilities.metrics import Metrics, METRICS
+from lib.utilities.with_external_arguments import CustomArgumentParser
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_export(self):
+        metrics = Metrics()
+        metrics.increment('requests_total')
+        metrics.increment('requests_total', 2)
+        metrics.set('rate_limit_remaining', 5, account='Credential 1')
+        for value in (0.0005, 0.2, 100):
+            metrics.observe('request_seconds', value)
+        text = metrics.get_prometheus_text()
+        self.assertIn('# TYPE quantityer_requests_total counter\nquantityer_requests_total 3\n', text)
+        self.assertIn('quantityer_rate_limit_remaining{account="Credential 1"} 5\n', text)
+        self.assertIn('quantityer_request_seconds_bucket{le="0.001"} 1\n', text)
+        self.assertIn('quantityer_request_seconds_bucket{le="0.25"} 2\n', text)
+        self.assertIn('quantityer_request_seconds_bucket{le="+Inf"} 3\n', text)
+        self.assertIn('quantityer_request_seconds_count 3\n', text)
+        with tempfile.TemporaryDirectory() as directory:
+            prometheus_filename = os.path.join(directory, 'metrics.prom')
+            json_filename = os.path.join(directory, 'metrics.json')
+            metrics.export(prometheus_filename, json_filename)
+            # the new files have the default mode, as the ones created by open
+            default_filename = os.path.join(directory, 'default')
+            open(default_filename, 'w').close()
+            self.assertEqual(os.stat(prometheus_filename).st_mode & 0o777, os.stat(default_filename).st_mode & 0o777)
+            # the files replaced keep their mode
+            os.chmod(prometheus_filename, 0o640)
+            metrics.export(prometheus_filename, json_filename)
+            self.assertEqual(os.stat(prometheus_filename).st_mode & 0o777, 0o640)
+            self.assertEqual(sorted(os.listdir(directory)), ['default', 'metrics.json', 'metrics.prom'])
+            with open(prometheus_filename) as file:
+                self.assertEqual(file.read(), text)
+            with open(json_filename) as file:
+                exported = json.load(file)
+        self.assertEqual(exported['counters'], [{'name': 'quantityer_requests_total', 'labels': {}, 'value': 3}])
+        self.assertEqual(exported['histograms'][0]['count'], 3)
+        self.assertEqual(exported['histograms'][0]['buckets'][-1], ['+Inf', 3])
+
+    def test_retries(self):
+        """The last attempt, which gives up, is not counted as a retry"""
+        METRICS.reset()
+        retry = MeasuredRetry(total=2)
+        with self.assertRaises(MaxRetryError):
+            while True:
+                retry = retry.increment('GET', '/search', error=ConnectionError())
+        self.assertEqual(METRICS.get_counter('retries_total'), 2)
+
+    def test_engine_metrics(self):
+        a, b, c = sympy.symbols('a b c')
+        middle_code = SympyLogicMiddleCode(namespace='TEST', name='1', exp=a | b | c)
+        METRICS.reset()
+        engine = get_offline_engine([])
+        engine.get_total_amount(middle_code)
+        engine.get_total_amount(middle_code)
+        self.assertEqual(METRICS.get_counter('requests_total'), 7)
+        self.assertEqual(METRICS.get_counter('cache_misses_total'), 7)
+        self.assertEqual(METRICS.get_counter('cache_hits_total'), 7)
+        self.assertEqual(METRICS.get_counter('subqueries_total'), 14)
+        self.assertEqual(METRICS.get_histogram_count('dnf_conversion_seconds'), 2)
+        self.assertEqual(METRICS.get_histogram_count('query_seconds'), 2)
+
+    def test_sharding_and_simulation_metrics(self):
+        a, b, c = sympy.symbols('a b c')
+        middle_code = SympyLogicMiddleCode(namespace='TEST', name='1', exp=a | b | c)
+        sharding_engine = get_offline_engine(['**workers', '2'])
+        sharding_engine.SHARDING_MIN_SUBQUERIES = 1
+        simulation_engine = GithubV3Engine([], 'in-memory', [], True, CustomArgumentParser())
+        for engine in (sharding_engine, simulation_engine):
+            METRICS.reset()
+            engine.get_total_amount(middle_code)
+            engine.get_total_amount(middle_code)
+            self.assertEqual(METRICS.get_counter('cache_misses_total'), 7)
+            self.assertEqual(METRICS.get_counter('cache_hits_total'), 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+from benchmarks.pipeline import generate_query, run_workload, compare, calibrate, Workload, STAGES
+from lib.classes.internal.parsers.brackets_syntax_parser import BracketsSyntaxParser
+
+
+class TestPipelineBenchmark(unittest.TestCase):
+    def test_generate_query(self):
+        self.assertEqual(generate_query(2, 2), '{[w0 w1] [w2 w3]}')
+        self.assertEqual(generate_query(1, 2, depth=2), '{[{w0 w1} {w2 w3}]}')
+        self.assertEqual(generate_query(3, 3, seed=1), generate_query(3, 3, seed=1))
+        self.assertIn('~', generate_query(4, 3, negation=0.5))
+        self.assertIn('language:', generate_query(4, 3, qualifiers=0.5))
+        self.assertLess(len(set(generate_query(8, 3, sharing=0.9).split())), 8 * 3)
+        source = generate_query(3, 2, depth=3, sharing=0.5, negation=0.3)
+        self.assertEqual(len(list(BracketsSyntaxParser([]).get_middle_codes(source, 'TEST'))), 1)
+
+    def test_run_workload(self):
+        results = run_workload(Workload(terms=4, width=2))
+        self.assertEqual(tuple(results), STAGES)
+        for measures in results.values():
+            self.assertEqual(measures['subqueries'], 2 ** 4 - 1)
+            self.assertGreaterEqual(measures['seconds'], 0)
+            self.assertGreaterEqual(measures['peak_bytes'], 0)
+
+    def test_compare(self):
+        baseline = {'translate': {'seconds': 1., 'peak_bytes': 1 << 20}, 'parse': {'seconds': 0.001}}
+        results = {'translate': {'seconds': 1.1, 'peak_bytes': 4 << 20}, 'parse': {'seconds': 0.005}}
+        self.assertEqual(compare(results, baseline, 0.25), {'translate': 'peak_bytes 4.00x'})
+        self.assertEqual(compare(results, {}, 0.25), {})
+
+    def test_compare_calibrated(self):
+        """The seconds of a baseline saved on a host twice as fast are not a regression"""
+        baseline = {'evaluate': {'seconds': 0.5}}
+        results = {'evaluate': {'seconds': 1.}}
+        self.assertEqual(compare(results, baseline, 0.25), {'evaluate': 'seconds 2.00x'})
+        self.assertEqual(compare(results, baseline, 0.25, seconds_scale=2.), {})
+        self.assertGreater(calibrate(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
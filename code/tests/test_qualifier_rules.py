@@ -0,0 +1,64 @@
+import unittest
+from io import StringIO
+
+import sympy
+
+from lib.classes.internal.rules.qualifier_rules import QualifierRules
+
+
+def literals(*names: str):
+    return frozenset(sympy.Not(sympy.Symbol(name[1:])) if name.startswith('~') else sympy.Symbol(name)
+                     for name in names)
+
+
+class TestQualifierRules(unittest.TestCase):
+
+    def setUp(self):
+        rules_file = StringIO('implies extension:py language:Python  # a comment\n'
+                              '\n'
+                              'disjoint foo bar\n')
+        rules_file.name = 'rules'
+        self.rules = QualifierRules(('language', 'extension'), rules_file)
+
+    def test_empty(self):
+        self.assertIsNone(self.rules.simplify(literals('a', '~a')))
+        self.assertIsNone(self.rules.simplify(literals('language:Python', 'language:Java')))
+        self.assertIsNone(self.rules.simplify(literals('extension:py', 'language:Java')))
+        self.assertIsNone(self.rules.simplify(literals('extension:py', '~language:Python')))
+        self.assertIsNone(self.rules.simplify(literals('foo', 'bar', 'a')))
+
+    def test_implied(self):
+        self.assertEqual(self.rules.simplify(literals('extension:py', 'language:Python')),
+                         literals('extension:py'))
+        self.assertEqual(self.rules.simplify(literals('language:python', '~language:Java', 'a')),
+                         literals('language:python', 'a'))
+        self.assertEqual(self.rules.simplify(literals('foo', '~bar')), literals('foo'))
+        self.assertEqual(self.rules.simplify(literals('foo', 'a', '~b')), literals('foo', 'a', '~b'))
+
+    def test_mask_rules(self):
+        """The rules over bitmasks simplify every conjunction of the literals as `simplify` does"""
+        equivalences_file = StringIO('implies a b\nimplies b a\nimplies extension:py a\n')
+        equivalences_file.name = 'equivalences'
+        query_literals = sorted(literals('extension:py', 'language:Python', '~language:Python', 'language:Java',
+                                         '~language:Java', 'foo', 'bar', '~bar', 'a', 'b', '~b'), key=str)
+        for rules in (self.rules, QualifierRules(('language',), equivalences_file)):
+            mask_rules = rules.get_mask_rules(query_literals)
+            for mask in range(1, 1 << len(query_literals)):
+                mask_literals = frozenset(literal for i, literal in enumerate(query_literals) if mask >> i & 1)
+                simplified = rules.simplify(mask_literals)
+                simplified_mask = mask_rules.simplify(mask)
+                if simplified is None:
+                    self.assertIsNone(simplified_mask, mask_literals)
+                else:
+                    self.assertEqual(simplified_mask, sum(1 << i for i, literal in enumerate(query_literals)
+                                                          if literal in simplified), mask_literals)
+
+    def test_mask_rules_not_applied(self):
+        self.assertIsNone(self.rules.get_mask_rules(sorted(literals('a', 'b', '~c', 'language:Python'), key=str)))
+        self.assertIsNone(QualifierRules().get_mask_rules(sorted(literals('language:Python', 'language:Java'),
+                                                                 key=str)))
+        self.assertIsNotNone(QualifierRules().get_mask_rules(sorted(literals('a', '~a'), key=str)))
+
+
+if __name__ == '__main__':
+    unittest.main()
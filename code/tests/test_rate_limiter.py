@@ -0,0 +1,27 @@
+import unittest
+
+from lib.classes.internal.query_issuers.rate_limiter import RateLimiter
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_reserve(self):
+        rate_limiter = RateLimiter(30, remaining=2)
+        self.assertEqual(rate_limiter.reserve(), 0)
+        self.assertEqual(rate_limiter.reserve(), 0)
+        self.assertAlmostEqual(rate_limiter.reserve(), 2, delta=0.1)
+        self.assertAlmostEqual(rate_limiter.reserve(), 4, delta=0.1)
+
+    def test_update(self):
+        rate_limiter = RateLimiter(30)
+        rate_limiter.update(1, 30, 50)
+        self.assertEqual(rate_limiter.reserve(), 0)
+        rate_limiter.update(0, 30, 50)
+        self.assertAlmostEqual(rate_limiter.reserve(), 50, delta=0.1)
+        # the responses received while waiting for the reset do not change the bucket
+        rate_limiter.update(0, 30, 10)
+        self.assertAlmostEqual(rate_limiter.reserve(), 50, delta=0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()